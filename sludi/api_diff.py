@@ -0,0 +1,786 @@
+""" Static API Diff Pre-Screen of Library Upgrades """
+
+import argparse
+import json
+import os
+import re
+import struct
+import sys
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from collections import deque
+from dataclasses import asdict, dataclass, field, replace
+
+from file_index import get_file_index
+from pom import PROPERTY_REF, Dependency, PomIndex, PomModel, get_pom_index, parse_pom
+from tracing import span
+
+M2_REPOSITORY = os.path.expanduser('~/.m2/repository')
+M2_REPOSITORY_ENV = 'SLUDI_M2_REPOSITORY'
+MAX_DEPENDENCY_DEPTH = 10
+MAX_CALL_SITES = 50
+MAX_LISTED = 20
+TRANSITIVE_SCOPES = ('', 'compile', 'runtime')
+TEST_SCOPES = ('', 'compile', 'runtime', 'provided', 'test')
+CLASS_OUTPUT_DIRS = ('target/classes', 'target/test-classes')
+
+# Verdicts from the most to the least likely to break, the order batches run their jobs in.
+VERDICTS = ("breaking", "api_changed", "unknown", "clean")
+
+ACC_PUBLIC, ACC_PRIVATE, ACC_PROTECTED, ACC_STATIC, ACC_INTERFACE = 0x0001, 0x0002, 0x0004, 0x0008, 0x0200
+UNKNOWN_ACCESS = -1
+REFERENCE_KINDS = {9: 'field', 10: 'method', 11: 'interface_method'}
+ERRORS = {'class_removed': 'java.lang.NoClassDefFoundError', 'method_removed': 'java.lang.NoSuchMethodError',
+          'field_removed': 'java.lang.NoSuchFieldError', 'static': 'java.lang.IncompatibleClassChangeError',
+          'class_kind': 'java.lang.IncompatibleClassChangeError', 'visibility': 'java.lang.IllegalAccessError'}
+# Methods every class and interface inherits from java.lang.Object, which is never on the classpath.
+OBJECT_METHODS = {('<init>', '()V'), ('toString', '()Ljava/lang/String;'), ('hashCode', '()I'),
+                  ('equals', '(Ljava/lang/Object;)Z'), ('getClass', '()Ljava/lang/Class;'),
+                  ('clone', '()Ljava/lang/Object;'), ('finalize', '()V'), ('notify', '()V'), ('notifyAll', '()V'),
+                  ('wait', '()V'), ('wait', '(J)V'), ('wait', '(JI)V')}
+PACKAGE_DECLARATION = re.compile(r'^\s*package\s+([\w.]+)\s*;', re.M)
+
+_class_sources = {}
+_artifact_poms = {}
+
+
+def get_m2_repository() -> str:
+    return os.environ.get(M2_REPOSITORY_ENV) or M2_REPOSITORY
+
+
+def artifact_file(group_id: str, artifact_id: str, version: str, extension: str, repository: str) -> str:
+    """ Returns the path of an artifact in a local Maven repository, e.g. `<repo>/okio/okio/1.17.2/okio-1.17.2.jar`. """
+    return f"{repository}/{group_id.replace('.', '/')}/{artifact_id}/{version}/{artifact_id}-{version}.{extension}"
+
+
+@dataclass
+class ClassInfo:
+    """ The linkage-relevant parts of a class file: its hierarchy, its members and the members it references. """
+    name: str
+    access: int
+    super_name: str | None
+    interfaces: list[str]
+    fields: dict[tuple[str, str], int]
+    methods: dict[tuple[str, str], int]
+    # (kind, owner, name, descriptor), kind being 'class', 'field', 'method' or 'interface_method'.
+    references: set[tuple[str, str, str, str]]
+
+    @property
+    def is_interface(self) -> bool:
+        return bool(self.access & ACC_INTERFACE)
+
+
+def parse_class(data: bytes) -> ClassInfo:
+    """
+    Parses the constant pool, header, fields and methods of a class file. Code and other attributes are skipped.
+
+    Args:
+        data (bytes): The content of the class file.
+
+    Returns:
+        ClassInfo: The parsed class, with names in the internal form (`okio/Utf8`).
+
+    Raises:
+        ValueError: If the data is not a well-formed class file.
+    """
+    if data[:4] != b'\xca\xfe\xba\xbe':
+        raise ValueError("Not a class file")
+    try:
+        count, pos = struct.unpack_from('>H', data, 8)[0], 10
+        pool: list = [None] * count
+        i = 1
+        while i < count:
+            tag = data[pos]
+            if tag == 1:
+                length = struct.unpack_from('>H', data, pos + 1)[0]
+                pool[i] = data[pos + 3:pos + 3 + length].decode('utf-8', errors='replace')
+                pos += 3 + length
+            elif tag in (7, 8, 16, 19, 20):
+                pool[i] = (tag, struct.unpack_from('>H', data, pos + 1)[0])
+                pos += 3
+            elif tag in (9, 10, 11, 12):
+                pool[i] = (tag,) + struct.unpack_from('>HH', data, pos + 1)
+                pos += 5
+            elif tag in (3, 4, 17, 18):
+                pos += 5
+            elif tag in (5, 6):
+                pos += 9
+                i += 1
+            elif tag == 15:
+                pos += 4
+            else:
+                raise ValueError(f"Unknown constant pool tag {tag}")
+            i += 1
+
+        def class_name(index: int) -> str:
+            return pool[pool[index][1]]
+
+        access, this_index, super_index, interface_count = struct.unpack_from('>HHHH', data, pos)
+        pos += 8
+        interfaces = [class_name(struct.unpack_from('>H', data, pos + 2 * k)[0]) for k in range(interface_count)]
+        pos += 2 * interface_count
+        tables = []
+        for _ in range(2):
+            table, member_count = {}, struct.unpack_from('>H', data, pos)[0]
+            pos += 2
+            for _ in range(member_count):
+                member_access, name_index, descriptor_index, attribute_count = struct.unpack_from('>HHHH', data, pos)
+                pos += 8
+                for _ in range(attribute_count):
+                    pos += 6 + struct.unpack_from('>I', data, pos + 2)[0]
+                table[(pool[name_index], pool[descriptor_index])] = member_access
+            tables.append(table)
+        references = set()
+        for entry in pool:
+            if not isinstance(entry, tuple):
+                continue
+            if entry[0] == 7:
+                name = pool[entry[1]].lstrip('[')
+                if pool[entry[1]].startswith('['):
+                    if not name.startswith('L'):
+                        continue
+                    name = name[1:-1]
+                references.add(('class', name, '', ''))
+            elif entry[0] in REFERENCE_KINDS:
+                owner = class_name(entry[1])
+                if not owner.startswith('['):
+                    name_and_type = pool[entry[2]]
+                    references.add((REFERENCE_KINDS[entry[0]], owner, pool[name_and_type[1]], pool[name_and_type[2]]))
+        name = class_name(this_index)
+        references.discard(('class', name, '', ''))
+        return ClassInfo(name, access, class_name(super_index) if super_index else None, interfaces, tables[0],
+                         tables[1], references)
+    except (struct.error, IndexError, TypeError) as e:
+        raise ValueError(f"Malformed class file: {e}")
+
+
+class ClassSource:
+    """ The class files of one jar or class output directory, listed up front and parsed on first use. """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.entries: dict[str, str] = {}
+        self._classes: dict[str, ClassInfo | None] = {}
+        self._zip = None
+        if os.path.isdir(path):
+            for dir_path, _, files in os.walk(path):
+                for file_name in files:
+                    if file_name.endswith('.class') and file_name != 'module-info.class':
+                        class_file = os.path.join(dir_path, file_name)
+                        self.entries[os.path.relpath(class_file, path).replace(os.sep, '/')[:-6]] = class_file
+        else:
+            self._zip = zipfile.ZipFile(path)
+            self.entries = {name[:-6]: name for name in self._zip.namelist() if name.endswith('.class')
+                            and not name.startswith('META-INF/') and not name.endswith('module-info.class')}
+
+    def get(self, name: str) -> ClassInfo | None:
+        if name not in self._classes:
+            entry = self.entries.get(name)
+            info = None
+            if entry is not None:
+                try:
+                    if self._zip is not None:
+                        data = self._zip.read(entry)
+                    else:
+                        with open(entry, 'rb') as fr:
+                            data = fr.read()
+                    info = parse_class(data)
+                except (ValueError, OSError, zipfile.BadZipFile):
+                    info = None
+            self._classes[name] = info
+        return self._classes[name]
+
+    def classes(self) -> list[ClassInfo]:
+        return [info for info in (self.get(name) for name in sorted(self.entries)) if info is not None]
+
+
+def get_class_source(path: str) -> ClassSource | None:
+    """
+    Returns the classes of a jar or class directory. Jars in the local repository never change, so they are listed
+    only once per process; class directories are build output and are listed on every call.
+    """
+    if os.path.isdir(path):
+        return ClassSource(path)
+    source = _class_sources.get(path)
+    if source is None:
+        try:
+            source = _class_sources[path] = ClassSource(path)
+        except (OSError, zipfile.BadZipFile) as e:
+            print(f"Unable to read {path}: {e}")
+            return None
+    return source
+
+
+@dataclass
+class EffectivePom:
+    """ A POM with its parent chain applied: inherited properties, managed versions and dependencies. """
+    model: PomModel
+    properties: dict[str, str]
+    managed: dict[str, Dependency]
+    dependencies: list[Dependency]
+
+
+def _interpolate(value: str, properties: dict[str, str]) -> str:
+    for _ in range(5):
+        if not PROPERTY_REF.search(value):
+            break
+        value = PROPERTY_REF.sub(lambda m: properties.get(m.group(1), m.group(0)), value)
+    return value
+
+
+def _read_m2_pom(group_id: str, artifact_id: str, version: str, repository: str) -> PomModel | None:
+    try:
+        return parse_pom(artifact_file(group_id, artifact_id, version, 'pom', repository))
+    except (ET.ParseError, OSError):
+        return None
+
+
+def _pom_chain(model: PomModel, repository: str, index: PomIndex | None = None) -> list[PomModel]:
+    """ Returns the POM and its ancestors, root first. Parents are taken from the checkout when they are in it. """
+    chain = [model]
+    while chain[0].parent is not None and len(chain) < MAX_DEPENDENCY_DEPTH:
+        child, parent = chain[0], chain[0].parent
+        parent_model = index.get(child.parent_path) if index is not None and child.parent_path else None
+        if parent_model is None or parent_model.coordinates != parent.coordinates:
+            parent_model = _read_m2_pom(parent.group_id, parent.artifact_id, parent.version, repository)
+        if parent_model is None:
+            break
+        chain.insert(0, parent_model)
+    return chain
+
+
+def _effective_pom(chain: list[PomModel], repository: str) -> EffectivePom:
+    """
+    Merges a POM chain the way Maven builds an effective POM: properties, dependencyManagement (including imported
+    BOMs) and dependencies are inherited, and every version is interpolated with the properties of the last POM.
+    """
+    model = chain[-1]
+    properties = {}
+    for pom_model in chain:
+        properties.update(pom_model.properties)
+    properties.update({'project.groupId': model.group_id, 'project.artifactId': model.artifact_id,
+                       'project.version': model.version, 'pom.version': model.version})
+    if model.parent is not None:
+        properties.update({'project.parent.groupId': model.parent.group_id,
+                           'project.parent.version': model.parent.version, 'parent.version': model.parent.version})
+    managed, imports, dependencies = {}, [], {}
+    for pom_model in chain:
+        for d in pom_model.managed_dependencies:
+            d = replace(d, group_id=_interpolate(d.group_id, properties), version=_interpolate(d.version, properties))
+            if d.scope == 'import':
+                imports.append(d)
+            else:
+                managed[d.coordinates] = d
+        for d in pom_model.dependencies:
+            d = replace(d, group_id=_interpolate(d.group_id, properties), version=_interpolate(d.version, properties))
+            dependencies[d.coordinates] = d
+    for d in imports:
+        bom = load_artifact_pom(d.group_id, d.artifact_id, d.version, repository)
+        for coordinates, managed_dependency in (bom.managed.items() if bom else ()):
+            managed.setdefault(coordinates, managed_dependency)
+    for coordinates, d in dependencies.items():
+        managed_dependency = managed.get(coordinates)
+        if managed_dependency is not None:
+            dependencies[coordinates] = replace(d, version=d.version or managed_dependency.version,
+                                                scope=d.scope or managed_dependency.scope)
+    return EffectivePom(model, properties, managed, list(dependencies.values()))
+
+
+def load_artifact_pom(group_id: str, artifact_id: str, version: str, repository: str) -> EffectivePom | None:
+    """ Returns the effective POM of an artifact in the local repository, or None if its POM is not there. """
+    key = (repository, group_id, artifact_id, version)
+    if key not in _artifact_poms:
+        _artifact_poms[key] = None
+        model = _read_m2_pom(group_id, artifact_id, version, repository)
+        if model is not None:
+            _artifact_poms[key] = _effective_pom(_pom_chain(model, repository), repository)
+    return _artifact_poms[key]
+
+
+class Classpath:
+    """
+    The artifacts a list of root dependencies resolves to in the local repository, together with the class output
+    directories of the client, which come first.
+
+    Resolution follows Maven's rules: the nearest declaration of an artifact wins (the first one at equal depth),
+    dependencyManagement of the root pins transitive versions, and test, provided and optional dependencies of
+    dependencies are left out. Exclusions are not applied.
+    """
+
+    def __init__(self, class_dirs: list[str]) -> None:
+        self.class_dirs = class_dirs
+        self.artifacts: dict[str, str] = {}
+        self.jars: dict[str, str] = {}
+        self.dependents: dict[str, set[str]] = {}
+        self.missing: list[str] = []
+        self._owners: dict[str, str] | None = None
+
+    def source(self, coordinates: str) -> ClassSource | None:
+        if coordinates.startswith('client:'):
+            return get_class_source(coordinates.split(':', 1)[1])
+        jar = self.jars.get(coordinates)
+        return get_class_source(jar) if jar else None
+
+    def owner(self, name: str) -> str | None:
+        """ Returns the coordinates of the artifact the class `name` is loaded from, or None if none has it. """
+        if self._owners is None:
+            self._owners = {}
+            for coordinates in [f"client:{d}" for d in self.class_dirs] + list(self.jars):
+                source = self.source(coordinates)
+                for class_name in (source.entries if source else ()):
+                    self._owners.setdefault(class_name, coordinates)
+        return self._owners.get(name)
+
+    def find(self, name: str) -> ClassInfo | None:
+        coordinates = self.owner(name)
+        source = self.source(coordinates) if coordinates else None
+        return source.get(name) if source else None
+
+
+def resolve_classpath(roots: list[Dependency], managed: dict[str, Dependency], repository: str,
+                      class_dirs: list[str] | None = None) -> Classpath:
+    classpath = Classpath(class_dirs or [])
+    pending = deque((dependency, 0, None) for dependency in roots)
+    while pending:
+        dependency, depth, dependent = pending.popleft()
+        coordinates = dependency.coordinates
+        if coordinates in classpath.artifacts:
+            if dependent:
+                classpath.dependents[coordinates].add(dependent)
+            continue
+        version = dependency.version
+        if depth > 0 and coordinates in managed and managed[coordinates].version:
+            version = managed[coordinates].version
+        classpath.artifacts[coordinates] = version
+        classpath.dependents[coordinates] = {dependent} if dependent else set()
+        if not version or PROPERTY_REF.search(version):
+            classpath.missing.append(f"{coordinates}:{version or '?'}")
+            continue
+        pom = load_artifact_pom(dependency.group_id, dependency.artifact_id, version, repository)
+        jar = artifact_file(dependency.group_id, dependency.artifact_id, version, 'jar', repository)
+        if os.path.isfile(jar):
+            classpath.jars[coordinates] = jar
+        elif pom is None or pom.model.packaging != 'pom':
+            classpath.missing.append(f"{coordinates}:{version}")
+        if pom is None or depth >= MAX_DEPENDENCY_DEPTH:
+            continue
+        for child in pom.dependencies:
+            if child.scope in TRANSITIVE_SCOPES and not child.optional:
+                pending.append((child, depth + 1, coordinates))
+    return classpath
+
+
+def lookup_member(classpath: Classpath, owner: str, kind: str, name: str, descriptor: str) -> int | None:
+    """
+    Resolves a field or method reference through the class hierarchy, as the JVM does when it links it.
+
+    Returns:
+        int | None: The access flags of the member found, `UNKNOWN_ACCESS` if the hierarchy reaches a class that is
+                    not on the classpath (usually a JDK class), or None if no class of the hierarchy declares it.
+    """
+    key = (name, descriptor)
+    pending, seen, unknown = [owner], set(), False
+    while pending:
+        class_name = pending.pop(0)
+        if class_name in seen:
+            continue
+        seen.add(class_name)
+        if class_name == 'java/lang/Object':
+            if kind != 'field' and key in OBJECT_METHODS:
+                return ACC_PUBLIC
+            continue
+        info = classpath.find(class_name)
+        if info is None:
+            unknown = True
+            continue
+        members = info.fields if kind == 'field' else info.methods
+        if key in members:
+            return members[key]
+        if name == '<init>':
+            break
+        if info.super_name:
+            pending.append(info.super_name)
+        pending.extend(info.interfaces)
+    return UNKNOWN_ACCESS if unknown else None
+
+
+@dataclass
+class ApiChange:
+    """ A class or member whose change breaks code compiled against the old version, and the error it raises. """
+    kind: str
+    owner: str
+    name: str = ""
+    descriptor: str = ""
+
+    @property
+    def error(self) -> str:
+        return ERRORS[self.kind]
+
+    @property
+    def target(self) -> str:
+        """ The member as the JVM names it in the error message, e.g. `okio.Utf8.size(Ljava/lang/String;)J`. """
+        if not self.name:
+            return self.owner
+        if self.descriptor.startswith('('):
+            return f"{self.owner.replace('/', '.')}.{self.name}{self.descriptor}"
+        return self.name
+
+    def key(self) -> tuple[str, str, str, str]:
+        return self.kind, self.owner, self.name, self.descriptor
+
+
+@dataclass
+class BrokenReference:
+    """ A reference from a class on the upgraded classpath that will fail to link. """
+    consumer: str
+    artifact: str
+    change: ApiChange
+
+
+@dataclass
+class CallSite:
+    """ A line of the client's sources that uses a changed class or member. """
+    file: str
+    line_no: int
+    line: str
+    change: ApiChange
+
+
+def _member_change(old_access: int | None, new_access: int | None, kind: str) -> str | None:
+    if new_access is None:
+        return 'field_removed' if kind == 'field' else 'method_removed'
+    if old_access is None or old_access < 0 or new_access < 0:
+        return None
+    if (old_access ^ new_access) & ACC_STATIC:
+        return 'static'
+    if new_access & ACC_PRIVATE and not old_access & ACC_PRIVATE:
+        return 'visibility'
+    return None
+
+
+def check_reference(old: Classpath, new: Classpath, reference: tuple[str, str, str, str],
+                    new_code: bool) -> ApiChange | None:
+    """
+    Checks that a reference made by a class resolves on the upgraded classpath.
+
+    References made by code that did not change are only reported if they resolved on the old classpath.
+    References made by new code are reported whenever they do not resolve, except to classes on neither classpath
+    (JDK classes, or optional dependencies that are not there).
+    """
+    kind, owner, name, descriptor = reference
+    new_class, old_class = new.find(owner), old.find(owner)
+    if new_class is None:
+        return ApiChange('class_removed', owner) if old_class is not None else None
+    if kind == 'class':
+        return None
+    expects_interface = kind == 'interface_method'
+    if kind != 'field' and new_class.is_interface != expects_interface and \
+            (new_code or old_class is None or old_class.is_interface == expects_interface):
+        return ApiChange('class_kind', owner, name, descriptor)
+    new_access = lookup_member(new, owner, kind, name, descriptor)
+    old_access = lookup_member(old, owner, kind, name, descriptor) if old_class is not None else None
+    if new_access is None and old_access is None and not new_code:
+        return None
+    change = _member_change(old_access, new_access, kind)
+    return ApiChange(change, owner, name, descriptor) if change else None
+
+
+def diff_api(old: Classpath, new: Classpath, coordinates: str) -> list[ApiChange]:
+    """
+    Diffs the public and protected API of one artifact of the old classpath against the upgraded classpath.
+
+    Members are resolved through the upgraded class hierarchy, so a method moved up into a superclass is not
+    reported as removed.
+    """
+    source = old.source(coordinates)
+    changes = []
+    for info in (source.classes() if source else ()):
+        if not info.access & ACC_PUBLIC:
+            continue
+        new_info = new.find(info.name)
+        if new_info is None:
+            changes.append(ApiChange('class_removed', info.name))
+            continue
+        if not new_info.access & ACC_PUBLIC:
+            changes.append(ApiChange('visibility', info.name))
+        if new_info.is_interface != info.is_interface:
+            changes.append(ApiChange('class_kind', info.name))
+        for kind, members in (('field', info.fields), ('method', info.methods)):
+            for (name, descriptor), access in sorted(members.items()):
+                if not access & (ACC_PUBLIC | ACC_PROTECTED) or name == '<clinit>':
+                    continue
+                change = _member_change(access, lookup_member(new, info.name, kind, name, descriptor), kind)
+                if change:
+                    changes.append(ApiChange(change, info.name, name, descriptor))
+    return changes
+
+
+def check_linkage(old: Classpath, new: Classpath) -> list[BrokenReference]:
+    """
+    Checks the references of every class that can be affected by the upgrade: the client's compiled classes, the
+    artifacts whose version changed, and the artifacts depending on those.
+    """
+    changed = {c for c, version in new.artifacts.items() if old.artifacts.get(c) != version}
+    removed = {c for c in old.artifacts if c not in new.artifacts}
+    dependents = {d for c in changed | removed for d in old.dependents.get(c, set()) | new.dependents.get(c, set())}
+    touched = changed | removed
+    consumers = [f"client:{d}" for d in new.class_dirs] + sorted((changed | dependents) & set(new.jars))
+    broken, seen = [], set()
+    for coordinates in consumers:
+        source = new.source(coordinates)
+        new_code = coordinates in changed
+        artifact = 'client' if coordinates.startswith('client:') else f"{coordinates}:{new.artifacts[coordinates]}"
+        for info in (source.classes() if source else ()):
+            for reference in sorted(info.references):
+                if not new_code and (new.owner(reference[1]) or old.owner(reference[1])) not in touched:
+                    continue
+                change = check_reference(old, new, reference, new_code)
+                if change is None or (info.name, change.key()) in seen:
+                    continue
+                seen.add((info.name, change.key()))
+                broken.append(BrokenReference(info.name.replace('/', '.'), artifact, change))
+    return broken
+
+
+def _usage_pattern(change: ApiChange) -> re.Pattern:
+    simple_name = re.split(r'[/$]', change.owner)[-1]
+    if not change.name:
+        return re.compile(rf'\b{re.escape(simple_name)}\b')
+    if change.name == '<init>':
+        return re.compile(rf'\bnew\s+{re.escape(simple_name)}\s*[(<]')
+    if change.descriptor.startswith('('):
+        return re.compile(rf'\b{re.escape(change.name.removesuffix("$default"))}\s*\(')
+    return re.compile(rf'\b{re.escape(change.name)}\b')
+
+
+def find_call_sites(client_dir: str, changes: list[ApiChange]) -> list[CallSite]:
+    """
+    Finds the lines of the client's Java sources that use changed classes or members.
+
+    A file is only searched for the members of a class it can see: it imports the class or its package, names it in
+    full, or is in the same package. Members are matched by name, so overloads are not told apart.
+    """
+    by_class: dict[str, list[ApiChange]] = {}
+    for change in changes:
+        by_class.setdefault(change.owner.split('$')[0].replace('/', '.'), []).append(change)
+    index = get_file_index(client_dir)
+    sources = sorted(path for name, paths in index.files.items() if name.endswith('.java') for path in paths)
+    call_sites = []
+    for path in sources:
+        try:
+            with open(os.path.join(index.client_dir, path), 'r', encoding='utf-8', errors='replace') as fr:
+                text = fr.read()
+        except OSError:
+            continue
+        package = PACKAGE_DECLARATION.search(text)
+        lines = None
+        for class_name, class_changes in by_class.items():
+            class_package = class_name.rpartition('.')[0]
+            if class_name not in text and f"import {class_package}.*" not in text and \
+                    (package.group(1) if package else '') != class_package:
+                continue
+            lines = lines or text.splitlines()
+            for change in class_changes:
+                pattern = _usage_pattern(change)
+                for line_no, line in enumerate(lines, 1):
+                    stripped = line.strip()
+                    if stripped.startswith(('import ', 'package ', '//', '*', '/*')) or not pattern.search(line):
+                        continue
+                    call_sites.append(CallSite(path, line_no, stripped, change))
+                    if len(call_sites) >= MAX_CALL_SITES:
+                        return call_sites
+    return call_sites
+
+
+@dataclass
+class PrescreenReport:
+    lib: str
+    old: str
+    new: str
+    changed_artifacts: dict[str, list] = field(default_factory=dict)
+    api_changes: list[ApiChange] = field(default_factory=list)
+    broken_references: list[BrokenReference] = field(default_factory=list)
+    call_sites: list[CallSite] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def verdict(self) -> str:
+        """
+        'breaking' if linkage errors are predicted, 'api_changed' if the library's API changed but no use of the
+        change was found, 'unknown' if the library's jars are not in the local repository, and 'clean' otherwise.
+        """
+        if self.broken_references or self.call_sites:
+            return "breaking"
+        if self.api_changes:
+            return "api_changed"
+        if any(missing.startswith(self.lib + ':') for missing in self.missing):
+            return "unknown"
+        return "clean"
+
+    @property
+    def exception(self) -> tuple[str, str]:
+        """ The exception and message the test is most likely to fail with, or empty strings. """
+        changes = [b.change for b in self.broken_references] + [c.change for c in self.call_sites]
+        return (changes[0].error, changes[0].target) if changes else ("", "")
+
+    def summary(self) -> dict:
+        exception, exception_info = self.exception
+        return {'verdict': self.verdict, 'exception': exception, 'exception_info': exception_info,
+                'api_changes': len(self.api_changes), 'broken_references': len(self.broken_references),
+                'call_sites': [f"{c.file}:{c.line_no}" for c in self.call_sites[:5]],
+                'changed_artifacts': self.changed_artifacts, 'duration': self.duration}
+
+    def to_dict(self) -> dict:
+        return dict(asdict(self), verdict=self.verdict)
+
+
+def _with_version(roots: list[Dependency], managed: dict[str, Dependency], lib: str,
+                  version: str) -> tuple[list[Dependency], dict[str, Dependency]]:
+    """ Sets the version of `lib` wherever the client declares or manages it, adding it if it does not. """
+    group_id, artifact_id = lib.split(':')[:2]
+    roots = [replace(d, version=version) if d.coordinates == lib else d for d in roots]
+    if not any(d.coordinates == lib for d in roots):
+        roots.append(Dependency(group_id, artifact_id, version))
+    return roots, dict(managed, **{lib: Dependency(group_id, artifact_id, version)})
+
+
+def get_client_dependencies(client_dir: str, submodule: str,
+                            repository: str) -> tuple[list[Dependency], dict[str, Dependency], list[str]]:
+    """
+    Returns the dependencies on the test classpath of the client's module, its managed versions and the class
+    output directories of the module and of the reactor modules it depends on.
+
+    Dependencies on reactor modules are replaced by the dependencies of those modules.
+    """
+    index = get_pom_index(client_dir)
+    module_dir = client_dir if submodule in ("N/A", "") else f"{client_dir}/{submodule}"
+    model = index.get(f"{module_dir}/pom.xml") or index.get(f"{client_dir}/pom.xml")
+    if model is None:
+        return [], {}, []
+    effective = _effective_pom(_pom_chain(model, repository, index), repository)
+    reactor = {m.coordinates: m for m in index.poms.values()}
+    class_dirs = [f"{os.path.dirname(model.path)}/{d}" for d in CLASS_OUTPUT_DIRS]
+    roots, seen = [], {model.coordinates}
+    pending = deque(d for d in effective.dependencies if d.scope in TEST_SCOPES)
+    while pending:
+        dependency = pending.popleft()
+        if dependency.coordinates in seen:
+            continue
+        seen.add(dependency.coordinates)
+        module = reactor.get(dependency.coordinates)
+        if module is None:
+            roots.append(dependency)
+            continue
+        class_dirs.append(f"{os.path.dirname(module.path)}/{CLASS_OUTPUT_DIRS[0]}")
+        module_pom = _effective_pom(_pom_chain(module, repository, index), repository)
+        pending.extend(d for d in module_pom.dependencies if d.scope in TRANSITIVE_SCOPES and not d.optional)
+    return roots, effective.managed, [d for d in class_dirs if os.path.isdir(d)]
+
+
+def prescreen(client_info: dict, downloads_dir: str | None = None, repository: str | None = None) -> PrescreenReport:
+    """
+    Predicts the linkage errors of a library upgrade from the jars in the local Maven repository, without building.
+
+    The old and new classpaths are resolved from the client's POMs when its checkout exists, or else from the
+    library's own dependencies. The public API of the library is diffed between the two, the references of every
+    class the upgrade can affect are checked against the new classpath, and the client's sources are searched for
+    uses of what changed.
+
+    Args:
+        client_info (dict): The incompatibility, with its 'lib', 'old' and 'new' fields.
+        downloads_dir (str | None): Directory holding the client's checkout, or None to screen the library alone.
+        repository (str | None): The local Maven repository. Defaults to `get_m2_repository()`.
+
+    Returns:
+        PrescreenReport: The changes and breakage found.
+    """
+    lib, old_version, new_version = client_info['lib'], client_info['old'], client_info['new']
+    repository = repository or get_m2_repository()
+    start = time.perf_counter()
+    with span("prescreen", lib=lib, version=new_version) as s:
+        client_dir = f"{downloads_dir}/{client_info['client']}" if downloads_dir else None
+        roots, managed, class_dirs = [], {}, []
+        if client_dir and os.path.isfile(f"{client_dir}/pom.xml"):
+            submodule = client_info.get('submodule', "N/A")
+            if submodule == "N/A":
+                submodule = client_info.get('test_module', "N/A")
+            roots, managed, class_dirs = get_client_dependencies(client_dir, submodule, repository)
+        else:
+            client_dir = None
+        old = resolve_classpath(*_with_version(roots, managed, lib, old_version), repository, class_dirs)
+        new = resolve_classpath(*_with_version(roots, managed, lib, new_version), repository, class_dirs)
+        report = PrescreenReport(lib, old_version, new_version)
+        report.changed_artifacts = {c: [old.artifacts.get(c), new.artifacts.get(c)]
+                                    for c in sorted(set(old.artifacts) | set(new.artifacts))
+                                    if old.artifacts.get(c) != new.artifacts.get(c)}
+        report.missing = sorted(set(old.missing) | set(new.missing))
+        if lib in old.jars and lib in new.jars:
+            report.api_changes = diff_api(old, new, lib)
+            report.broken_references = check_linkage(old, new)
+            if client_dir:
+                changes = {c.key(): c for c in report.api_changes + [b.change for b in report.broken_references]}
+                report.call_sites = find_call_sites(client_dir, list(changes.values()))
+        report.duration = round(time.perf_counter() - start, 3)
+        s.set(verdict=report.verdict, api_changes=len(report.api_changes),
+              broken_references=len(report.broken_references), call_sites=len(report.call_sites))
+    return report
+
+
+def print_report(report: PrescreenReport) -> None:
+    print(f"API pre-screen of {report.lib} {report.old} -> {report.new}: {report.verdict} ({report.duration}s)")
+    if report.changed_artifacts:
+        print("  Changed artifacts:")
+        for coordinates, (old_version, new_version) in report.changed_artifacts.items():
+            print(f"    {coordinates} {old_version or '-'} -> {new_version or '-'}")
+    sections = [("API changes", [f"{c.error} {c.target}" if c.name else f"{c.error} {c.owner}"
+                                 for c in report.api_changes]),
+                ("Broken references", [f"{b.change.error} {b.change.target} from {b.consumer} ({b.artifact})"
+                                       for b in report.broken_references]),
+                ("Call sites", [f"{c.file}:{c.line_no}  {c.line}  [{c.change.error}]" for c in report.call_sites]),
+                ("Not in the local repository", report.missing)]
+    for title, lines in sections:
+        if lines:
+            print(f"  {title} ({len(lines)}):")
+            for line in lines[:MAX_LISTED]:
+                print(f"    {line}")
+            if len(lines) > MAX_LISTED:
+                print(f"    ... {len(lines) - MAX_LISTED} more")
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Predicts linkage errors of a library upgrade without building')
+    parser.add_argument('--id', help='The Subject ID whose upgrade to screen', required=False)
+    parser.add_argument('--lib', help='The library to screen, as groupId:artifactId', required=False)
+    parser.add_argument('--old', help='The version of --lib to upgrade from', required=False)
+    parser.add_argument('--new', help='The version of --lib to upgrade to', required=False)
+    parser.add_argument('--repository', help='The local Maven repository (default: ~/.m2/repository)', required=False)
+    parser.add_argument('--json', help='Print the full report as JSON', action='store_true')
+    opts = parser.parse_args(argv)
+    if not opts.id and not (opts.lib and opts.old and opts.new):
+        parser.print_help()
+        exit(1)
+    return opts
+
+
+def main():
+    from utils import DOWNLOADS_DIR, INCOMPATIBILITIES_JSON_FILE, get_knowledge_info
+
+    opts = parseArgs(sys.argv[1:])
+    if opts.id:
+        client_info = get_knowledge_info(opts.id, INCOMPATIBILITIES_JSON_FILE)
+        if not client_info:
+            print(f"Unable to find incompatibility id {opts.id}..")
+            exit(1)
+        report = prescreen(client_info, DOWNLOADS_DIR, opts.repository)
+    else:
+        report = prescreen({'lib': opts.lib, 'old': opts.old, 'new': opts.new}, None, opts.repository)
+    if opts.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        print_report(report)
+    exit(0)
+
+if __name__ == "__main__":
+    main()
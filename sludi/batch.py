@@ -0,0 +1,162 @@
+""" Parallel Batch Runner for Incompatibilities """
+
+import csv
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from utils import *
+from api_diff import VERDICTS, PrescreenReport, prescreen
+from incompatibilities import checkout_client, test_upgrade_incompatibility, read_failure_info
+from tracing import span, trace_context
+
+JOBS_DIR = DOWNLOADS_DIR + '/_jobs'
+SUMMARY_FIELDS = ["id", "client", "lib", "old", "new", "result", "exception", "exception_info", "file_name",
+                  "line_no", "duration"]
+
+
+def get_job_downloads_dir(id: str) -> str:
+    """ Returns the private downloads directory of a batch job, so that jobs never share a checkout. """
+    return f"{JOBS_DIR}/{id}"
+
+
+def run_job(client_info: dict, keep_checkout: bool = False, stop_early: bool = False) -> dict:
+    """
+    Runs discovery, the Maven test build and extraction for one incompatibility in its own checkout.
+
+    Args:
+        client_info (dict): The incompatibility from incompatibilities.json.
+        keep_checkout (bool): Keep the job's worktree instead of removing it once the job is done.
+        stop_early (bool): Stop the test build as soon as the target test has failed.
+
+    Returns:
+        dict: The updated client info, with 'result' set to 'Pass', 'Fail' or 'Error' and 'duration' in seconds.
+    """
+    start = time.perf_counter()
+    downloads_dir = get_job_downloads_dir(client_info['id'])
+    with trace_context(client_info['id']), span("job") as job_span:
+        try:
+            checkout_client(client_info, downloads_dir)
+            if test_upgrade_incompatibility(client_info, True, downloads_dir, stop_early):
+                client_info['result'] = "Pass"
+            else:
+                client_info['result'] = "Fail"
+                try:
+                    read_failure_info(client_info)
+                except ValueError as e:
+                    print(f"{client_info['id']}: {e}")
+        except Exception as e:
+            client_info['result'] = "Error"
+            client_info['error'] = str(e)
+        job_span.set(result=client_info['result'])
+    if not keep_checkout:
+        remove_worktree(f"{downloads_dir}/{client_info['client']}")
+        if os.path.isdir(downloads_dir) and not os.listdir(downloads_dir):
+            os.rmdir(downloads_dir)
+    client_info['duration'] = round(time.perf_counter() - start, 2)
+    return client_info
+
+
+def write_summary(results: list[dict], results_dir: str = RESULTS_DIR) -> str:
+    """
+    Writes the batch results to a CSV file in the 'test_results' directory.
+
+    Returns:
+        str: The path of the summary file.
+    """
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
+    summary_file = f"{results_dir}/batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    with open(summary_file, 'w', newline='', encoding='utf-8') as fw:
+        writer = csv.DictWriter(fw, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in sorted(results, key=lambda r: get_id_number(r['id'])):
+            writer.writerow(result)
+    return summary_file
+
+
+def get_id_number(id: str) -> int:
+    number = id.split('-')[-1]
+    return int(number) if number.isdigit() else 0
+
+
+def prioritise(clients_info: list[dict]) -> list[dict]:
+    """
+    Pre-screens the library upgrade of every incompatibility from the jars in the local Maven repository and orders
+    them so that the ones predicted to break run first. The pre-screen summary is kept in each client info. An
+    upgrade whose pre-screen fails (e.g. on a corrupt jar) gets the verdict 'unknown' and still runs.
+    """
+    for ci in clients_info:
+        try:
+            ci['prescreen'] = prescreen(ci).summary()
+        except Exception as e:
+            print(f"{ci['id']}: pre-screen failed, {type(e).__name__}: {e}..")
+            ci['prescreen'] = dict(PrescreenReport(ci['lib'], ci['old'], ci['new']).summary(), verdict="unknown",
+                                   error=str(e))
+        exception = f" ({ci['prescreen']['exception']}: {ci['prescreen']['exception_info']})" \
+            if ci['prescreen']['exception'] else ""
+        print(f"{ci['id']}: pre-screen {ci['prescreen']['verdict']}{exception}")
+    return sorted(clients_info, key=lambda ci: VERDICTS.index(ci['prescreen']['verdict']))
+
+
+def run_batch(ids: list[str] | None, workers: int | None = None, keep_checkouts: bool = False,
+              stop_early: bool = False, prescreen_only: bool = False, skip_clean: bool = False) -> list[dict]:
+    """
+    Runs many incompatibilities concurrently across a process pool.
+
+    Every job works in its own worktree under `_downloads/_jobs/<id>` and passes `cwd=` to its subprocesses, so jobs
+    are independent of each other and of the process working directory. Worktrees share one mirror per repository
+    and are removed when their job is done. Knowledge records are written by this
+    process once each job completes, and a summary of all jobs is written to 'test_results'. Jobs are submitted in
+    the order of the API pre-screen, those predicted to break first, and with `skip_clean` the upgrades the
+    pre-screen found no API change in are not run at all.
+
+    Args:
+        ids (list[str] | None): The incompatibility ids to run, or None to run every entry in incompatibilities.json.
+        workers (int | None): Number of worker processes. Defaults to the number of CPUs.
+        keep_checkouts (bool): Keep every job's worktree after the batch.
+        stop_early (bool): Stop every test build as soon as its target test has failed.
+        prescreen_only (bool): Only pre-screen the upgrades, without running any job.
+        skip_clean (bool): Skip the jobs whose pre-screen verdict is 'clean'. Their result is 'Skipped'.
+
+    Returns:
+        list[dict]: The client info of every job, including its result.
+    """
+    with open(INCOMPATIBILITIES_JSON_FILE, 'r') as file:
+        clients_info = json.load(file)
+    if ids is not None:
+        wanted = set(ids)
+        missing = wanted - {ci['id'] for ci in clients_info}
+        for id in sorted(missing, key=get_id_number):
+            print(f"Unable to find incompatibility id {id}..")
+        clients_info = [ci for ci in clients_info if ci['id'] in wanted]
+    if not clients_info:
+        return []
+    clients_info = prioritise(clients_info)
+    if prescreen_only:
+        return clients_info
+
+    results = []
+    if skip_clean:
+        results = [dict(ci, result="Skipped") for ci in clients_info if ci['prescreen']['verdict'] == "clean"]
+        clients_info = [ci for ci in clients_info if ci['prescreen']['verdict'] != "clean"]
+        for result in results:
+            print(f"{result['id']}: Skipped, the pre-screen found no API change")
+    if clients_info:
+        workers = workers or os.cpu_count() or 1
+        print(f"Running {len(clients_info)} incompatibilities with {workers} workers...")
+        with ProcessPoolExecutor(max_workers=min(workers, len(clients_info))) as executor:
+            futures = {executor.submit(run_job, ci, keep_checkouts, stop_early): ci for ci in clients_info}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = dict(futures[future], result="Error", error=str(e))
+                print(f"{result['id']}: {result['result']} ({result.get('duration', 0)}s)")
+                record = {k: v for k, v in result.items() if k not in ('result', 'duration', 'error')}
+                write_knowledge_info(record)
+                results.append(result)
+    export_knowledge_info()
+
+    print(f"Summary written to {write_summary(results)}")
+    return results
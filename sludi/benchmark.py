@@ -0,0 +1,334 @@
+""" Benchmarks for the Discovery and Extraction Pipeline """
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable
+
+from failure_index import FailureIndex, FailureSignature
+from file_index import FileIndex
+from knowledge_store import KnowledgeStore
+from log_analyzer import analyze_test_log
+from log_store import latest_run
+from method_index import clear_method_indexes, get_method_index
+from pom import PomIndex, ReactorGraph, rewrite_dependency_version
+from utils import INCOMPATIBILITIES_JSON_FILE, KNOWLEDGE_JSON_FILE, RESULTS_DIR, TEST_LOG_DIR
+
+DEFAULT_SCALES = (1, 10, 100)
+DEFAULT_REPEAT = 5
+REGRESSION_THRESHOLD = 1.25
+BENCH_LIB = "com.example:bench-lib"
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(name: str, scale: int, fn: Callable[[], object], repeat: int, items: int = 1, size: int = 0) -> dict:
+    """
+    Times `repeat` calls of `fn`, then measures its peak memory with tracemalloc in one extra call.
+
+    Memory is traced in a separate call so tracing does not distort the timings.
+
+    Args:
+        name (str): Benchmark name.
+        scale (int): Scale factor of the fixture.
+        fn (Callable[[], object]): The operation to measure.
+        repeat (int): Number of timed calls.
+        items (int): Number of items (lines, records, lookups...) one call processes.
+        size (int): Number of input bytes one call processes.
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and peak memory of the benchmark.
+    """
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    mean = sum(samples) / len(samples)
+    result = {'name': name, 'scale': scale, 'runs': repeat, 'items': items, 'bytes': size,
+              'mean_ms': round(mean * 1000, 3), 'p50_ms': round(percentile(samples, 0.5) * 1000, 3),
+              'p90_ms': round(percentile(samples, 0.9) * 1000, 3), 'p99_ms': round(percentile(samples, 0.99) * 1000, 3),
+              'max_ms': round(max(samples) * 1000, 3), 'items_per_s': round(items / mean, 1) if mean else 0.0,
+              'peak_memory_kb': round(peak / 1024, 1)}
+    if size:
+        result['mb_per_s'] = round(size / mean / 1024 / 1024, 2) if mean else 0.0
+    print(f"{name:<24} x{scale:<4} p50 {result['p50_ms']:>10.3f} ms  p90 {result['p90_ms']:>10.3f} ms  "
+          f"peak {result['peak_memory_kb']:>10.1f} KB")
+    return result
+
+
+def get_fixtures(work_dir: str) -> list[tuple[dict, str]]:
+    """
+    Returns the incompatibilities that have a stored test log, with the path of the log. Archived logs are
+    decompressed into `work_dir`.
+    """
+    with open(INCOMPATIBILITIES_JSON_FILE, 'r') as file:
+        clients_info = json.load(file)
+    fixtures = []
+    for client_info in clients_info:
+        test_log = f"{TEST_LOG_DIR}/{client_info['id']}/test.log"
+        run = latest_run(client_info['id'], "test", TEST_LOG_DIR)
+        if not os.path.isfile(test_log) and run is not None:
+            test_log = f"{work_dir}/{client_info['id']}/test.log"
+            os.makedirs(os.path.dirname(test_log), exist_ok=True)
+            with open(test_log, 'w', encoding='utf-8') as fw:
+                fw.write(run.text())
+        if os.path.isfile(test_log):
+            fixtures.append((client_info, test_log))
+    return fixtures
+
+
+def scale_log(test_log: str, scale: int, work_dir: str) -> str:
+    """ Writes the log `scale` times over into one file, as a build of a reactor with `scale` times more output. """
+    if scale == 1:
+        return test_log
+    scaled_log = f"{work_dir}/{os.path.basename(os.path.dirname(test_log))}-x{scale}.log"
+    with open(test_log, 'rb') as fr:
+        content = fr.read()
+    with open(scaled_log, 'wb') as fw:
+        for _ in range(scale):
+            fw.write(content)
+    return scaled_log
+
+
+def make_java_source(methods: int) -> str:
+    """ Generates a Java class with `methods` methods, each holding a lambda and an anonymous class. """
+    lines = ["package com.example.bench;", "", "public class Generated {"]
+    for i in range(methods):
+        lines += [f"    public int method{i}(int value) {{",
+                  f"        Runnable task = () -> {{",
+                  f"            System.out.println(value + {i});",
+                  f"        }};",
+                  f"        Object listener = new Object() {{",
+                  f"            public String toString() {{ return \"{i}\"; }}",
+                  f"        }};",
+                  f"        return value * {i};",
+                  f"    }}", ""]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def make_pom(artifact_id: str, modules: list[str], parent: bool, extra_dependencies: int = 0) -> str:
+    parent_block = ("  <parent><groupId>com.example</groupId><artifactId>bench</artifactId>"
+                    "<version>1.0</version></parent>\n") if parent else ""
+    module_block = "".join(f"    <module>{module}</module>\n" for module in modules)
+    extra_block = "".join(f"    <dependency><groupId>com.example</groupId><artifactId>extra-{i}</artifactId>"
+                          f"<version>1.{i}</version></dependency>\n" for i in range(extra_dependencies))
+    return ("<project>\n" + parent_block +
+            f"  <groupId>com.example</groupId>\n  <artifactId>{artifact_id}</artifactId>\n  <version>1.0</version>\n"
+            f"  <properties><bench.version>1.0.0</bench.version></properties>\n"
+            f"  <modules>\n{module_block}  </modules>\n"
+            f"  <dependencies>\n"
+            f"    <dependency><groupId>com.example</groupId><artifactId>bench-lib</artifactId>"
+            f"<version>${{bench.version}}</version></dependency>\n"
+            f"    <dependency><groupId>junit</groupId><artifactId>junit</artifactId>"
+            f"<version>4.13.2</version><scope>test</scope></dependency>\n" + extra_block +
+            f"  </dependencies>\n</project>\n")
+
+
+def make_client_tree(client_dir: str, modules: int, files_per_module: int) -> None:
+    """ Generates a fake multi-module Maven client with `modules` modules of `files_per_module` sources each. """
+    names = [f"module-{i}" for i in range(modules)]
+    os.makedirs(client_dir)
+    with open(f"{client_dir}/pom.xml", 'w') as fw:
+        fw.write(make_pom("bench", names, parent=False))
+    for i, name in enumerate(names):
+        source_dir = f"{client_dir}/{name}/src/main/java/com/example/bench/m{i}"
+        test_dir = f"{client_dir}/{name}/src/test/java/com/example/bench/m{i}"
+        os.makedirs(source_dir)
+        os.makedirs(test_dir)
+        with open(f"{client_dir}/{name}/pom.xml", 'w') as fw:
+            fw.write(make_pom(name, [], parent=True))
+        for j in range(files_per_module):
+            with open(f"{source_dir}/Source{j}.java", 'w') as fw:
+                fw.write(f"package com.example.bench.m{i};\nclass Source{j} {{}}\n")
+        with open(f"{test_dir}/Module{i}Test.java", 'w') as fw:
+            fw.write(f"package com.example.bench.m{i};\nclass Module{i}Test {{}}\n")
+
+
+def bench_log_analysis(fixtures: list[tuple[dict, str]], scales: list[int], repeat: int, work_dir: str) -> list[dict]:
+    results = []
+    for scale in scales:
+        logs = [scale_log(test_log, scale, work_dir) for _, test_log in fixtures]
+        size = sum(os.path.getsize(log) for log in logs)
+        lines = 0
+        for log in logs:
+            with open(log, 'rb') as fr:
+                lines += sum(1 for _ in fr)
+        results.append(measure("log_analysis", scale, lambda: [analyze_test_log(log) for log in logs], repeat,
+                               lines, size))
+
+        def locate() -> None:
+            for (client_info, _), log in zip(fixtures, logs):
+                analyze_test_log(log, client_info['test'].split('#')[0]).error_location
+        results.append(measure("error_location", scale, locate, repeat, len(logs), size))
+    return results
+
+
+def bench_method_lookup(scales: list[int], repeat: int, work_dir: str) -> list[dict]:
+    results = []
+    for scale in scales:
+        source = make_java_source(20 * scale)
+        line_count = source.count('\n')
+        index_dir = tempfile.mkdtemp(dir=work_dir)
+
+        def build() -> None:
+            clear_method_indexes()
+            shutil.rmtree(index_dir, ignore_errors=True)
+            get_method_index(source, index_dir)
+        results.append(measure("method_index_build", scale, build, repeat, line_count, len(source)))
+
+        index = get_method_index(source, index_dir)
+        results.append(measure("method_lookup", scale, lambda: [index.find(n) for n in range(1, line_count + 1)],
+                               repeat, line_count))
+    return results
+
+
+def bench_knowledge_store(scales: list[int], repeat: int, work_dir: str) -> list[dict]:
+    with open(KNOWLEDGE_JSON_FILE, 'r') as file:
+        records = json.load(file)
+    results = []
+    for scale in scales:
+        count = 100 * scale
+        synthetic = [dict(records[i % len(records)], id=f"b-{i}") for i in range(count)]
+        db_path = f"{work_dir}/knowledge-x{scale}.db"
+
+        def write() -> None:
+            store = KnowledgeStore(db_path)
+            for record in synthetic:
+                store.upsert(record)
+            store.close()
+        results.append(measure("knowledge_write", scale, write, repeat, count))
+
+        store = KnowledgeStore(db_path)
+        results.append(measure("knowledge_read", scale, lambda: [store.get(r['id']) for r in synthetic], repeat, count))
+        export_path = f"{work_dir}/knowledge-x{scale}.json"
+        results.append(measure("knowledge_export", scale, lambda: store.export_json(export_path), repeat, count))
+
+        # Every failure gets a distinct word so signatures are near-duplicates of their template, not copies.
+        failures = [dict(r, exception_info=f"{r.get('exception_info', '')} case{i}") for i, r in enumerate(synthetic)
+                    if r.get('exception')]
+        index = FailureIndex(store)
+        for record in failures:
+            index.add(record)
+        signatures = [FailureSignature.from_record(r) for r in failures[:100]]
+        results.append(measure("failure_lookup", scale, lambda: [index.lookup(s) for s in signatures], repeat,
+                               len(signatures)))
+        store.close()
+    return results
+
+
+def bench_pom(scales: list[int], repeat: int, work_dir: str) -> list[dict]:
+    results = []
+    for scale in scales:
+        pom_text = make_pom("bench", [], parent=False, extra_dependencies=20 * scale)
+        results.append(measure("pom_rewrite", scale, lambda: rewrite_dependency_version(pom_text, BENCH_LIB, "2.0.0",
+                                                                                       replace_refs=True),
+                               repeat, 1, len(pom_text)))
+
+        modules = 10 * scale
+        client_dir = f"{work_dir}/client-x{scale}"
+        make_client_tree(client_dir, modules, 10)
+
+        def index_and_bump() -> None:
+            index = PomIndex(client_dir)
+            index.set_version(BENCH_LIB, "2.0.0")
+            index.set_version(BENCH_LIB, "1.0.0")
+        results.append(measure("pom_index_set_version", scale, index_and_bump, repeat, modules + 1))
+        results.append(measure("reactor_graph", scale,
+                               lambda: ReactorGraph(client_dir).find_test_module(f"Module{modules - 1}Test"),
+                               repeat, modules + 1))
+
+        def index_files() -> None:
+            index = FileIndex(client_dir)
+            index.build(None)
+            index.lookup("Source0.java", f"com.example.bench.m{modules - 1}")
+        results.append(measure("file_index", scale, index_files, repeat, modules * 12))
+    return results
+
+
+def get_version() -> str:
+    result = subprocess.run("git rev-parse --short HEAD", shell=True, cwd=os.path.dirname(os.path.realpath(__file__)),
+                            capture_output=True, text=True)
+    return result.stdout.strip() or "unknown"
+
+
+def compare(results: list[dict], baseline_file: str, threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    """
+    Compares the p50 latency of every benchmark against a previous report.
+
+    Returns:
+        list[str]: A description of every benchmark that got slower by more than `threshold` times.
+    """
+    with open(baseline_file, 'r') as file:
+        baseline = {(r['name'], r['scale']): r for r in json.load(file)['results']}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['name'], result['scale']))
+        if previous and previous['p50_ms'] and result['p50_ms'] > previous['p50_ms'] * threshold:
+            regressions.append(f"{result['name']} x{result['scale']}: p50 {previous['p50_ms']} ms -> "
+                               f"{result['p50_ms']} ms")
+    return regressions
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Benchmarks the SLUDI pipeline on the stored test logs')
+    parser.add_argument('--scales', help='Comma-separated scale factors of the fixtures',
+                        default=','.join(str(scale) for scale in DEFAULT_SCALES))
+    parser.add_argument('--repeat', help='Timed runs per benchmark', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--only', help='Comma-separated benchmark groups: logs,methods,knowledge,pom', required=False)
+    parser.add_argument('--output', help='Path of the JSON report', required=False)
+    parser.add_argument('--baseline', help='Previous JSON report to check for regressions', required=False)
+    return parser.parse_args(argv)
+
+
+def main():
+    opts = parseArgs(sys.argv[1:])
+    scales = [int(scale) for scale in opts.scales.split(',')]
+    groups = set(opts.only.split(',')) if opts.only else {'logs', 'methods', 'knowledge', 'pom'}
+    results = []
+    with tempfile.TemporaryDirectory(prefix='sludi-bench-') as work_dir:
+        fixtures = get_fixtures(work_dir)
+        if 'logs' in groups:
+            results += bench_log_analysis(fixtures, scales, opts.repeat, work_dir)
+        if 'methods' in groups:
+            results += bench_method_lookup(scales, opts.repeat, work_dir)
+        if 'knowledge' in groups:
+            results += bench_knowledge_store(scales, opts.repeat, work_dir)
+        if 'pom' in groups:
+            results += bench_pom(scales, opts.repeat, work_dir)
+
+    report = {'version': get_version(), 'timestamp': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'fixtures': [client_info['id'] for client_info, _ in fixtures], 'results': results}
+    output = opts.output or f"{RESULTS_DIR}/benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fw:
+        json.dump(report, fw, indent=2)
+    print(f"Benchmark report written to {output}")
+
+    if opts.baseline:
+        regressions = compare(results, opts.baseline)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        exit(1 if regressions else 0)
+    exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+""" Parallel Bisection of Library Versions """
+
+import glob
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from utils import *
+from api_diff import get_m2_repository
+from batch import get_job_downloads_dir
+from build_cache import get_build_cache, hash_key
+from incompatibilities import TEST_ENABLED, checkout_client, get_test_module, install_project, read_failure_info, \
+    run_upgraded_test
+from tracing import span, trace_context
+
+VERSION_INDEX_FILE = SCRIPT_DIR + '/knowledge/version_index.json'
+VERSION_TOKEN = re.compile(r'\d+|[a-z]+')
+# Rank of the qualifiers Maven knows; releases rank 5 and unknown qualifiers sort after them, alphabetically.
+QUALIFIERS = {'alpha': 0, 'a': 0, 'beta': 1, 'b': 1, 'milestone': 2, 'm': 2, 'rc': 3, 'cr': 3, 'snapshot': 4,
+              '': 5, 'ga': 5, 'final': 5, 'release': 5, 'sp': 6}
+RELEASE_RANK = QUALIFIERS['']
+
+
+def version_key(version: str) -> tuple:
+    """
+    Sort key approximating Maven's version ordering: numbers compare numerically, trailing zeros are ignored
+    (1.0 == 1.0.0), and pre-release qualifiers sort before the release they qualify (1.0-rc1 < 1.0 < 1.0-sp1 < 1.0.1).
+    """
+    items = []
+    for token in VERSION_TOKEN.findall(version.lower()):
+        if token.isdigit():
+            items.append((2, int(token), ''))
+        else:
+            items.append((1, QUALIFIERS.get(token, RELEASE_RANK + 2), token))
+    leading = next((i for i, item in enumerate(items) if item[0] != 2), len(items))
+    while leading > 1 and items[leading - 1] == (2, 0, ''):
+        del items[leading - 1]
+        leading -= 1
+    return tuple(items) + ((1, RELEASE_RANK, ''),)
+
+
+def is_pre_release(version: str) -> bool:
+    return any(item[0] == 1 and item[1] < RELEASE_RANK for item in version_key(version)[:-1])
+
+
+def list_versions(lib: str, repository: str | None = None, index_file: str = VERSION_INDEX_FILE) -> list[str]:
+    """
+    Lists the versions of `lib` known locally, oldest first.
+
+    Versions come from the version directories of the artifact in the local Maven repository, the
+    `maven-metadata-*.xml` files Maven caches there, and the local version index, a JSON file mapping
+    `groupId:artifactId` to a list of versions.
+    """
+    group_id, artifact_id = lib.split(':')[:2]
+    artifact_dir = f"{repository or get_m2_repository()}/{group_id.replace('.', '/')}/{artifact_id}"
+    versions = set()
+    if os.path.isdir(artifact_dir):
+        for name in os.listdir(artifact_dir):
+            if glob.glob(f"{artifact_dir}/{name}/{artifact_id}-{name}.*"):
+                versions.add(name)
+        for metadata_file in glob.glob(f"{artifact_dir}/maven-metadata*.xml"):
+            try:
+                root = ET.parse(metadata_file).getroot()
+            except (ET.ParseError, OSError):
+                continue
+            versions.update((v.text or "").strip() for v in root.iter('version') if (v.text or "").strip())
+    if os.path.exists(index_file):
+        with open(index_file, 'r') as file:
+            versions.update(json.load(file).get(lib, []))
+    return sorted(versions, key=version_key)
+
+
+def candidate_versions(client_info: dict, versions: list[str], include_pre_releases: bool = False) -> list[str]:
+    """ Returns the versions after 'old' up to and including 'new', which is always the last candidate. """
+    old, new = version_key(client_info['old']), version_key(client_info['new'])
+    candidates = [v for v in versions if old < version_key(v) < new and (include_pre_releases or not is_pre_release(v))]
+    return candidates + [client_info['new']]
+
+
+def get_bisection_key(client_info: dict) -> str:
+    """ Outcomes are shared by every incompatibility running the same test of the same commit against `lib`. """
+    return hash_key('bisect', client_info['url'], client_info['sha'], client_info['test'], client_info['test_cmd'],
+                    client_info['lib'])
+
+
+def test_version(client_info: dict, version: str, keep_checkout: bool = False, stop_early: bool = False) -> dict:
+    """
+    Runs the client's test against one version of the library in a checkout of its own.
+
+    The run is recorded as incompatibility `<id>@<version>`, so its test log and build cache entries never collide
+    with the other versions tested at the same time.
+
+    Returns:
+        dict: The version, its outcome ('pass', 'fail' or 'error'), the exception of a failure and the duration.
+    """
+    start = time.perf_counter()
+    ci = dict(client_info, id=f"{client_info['id']}@{version}", new=version)
+    downloads_dir = get_job_downloads_dir(ci['id'])
+    client_dir = f"{downloads_dir}/{ci['client']}"
+    outcome = {'version': version}
+    with trace_context(client_info['id']), span("bisect_version", lib=ci['lib'], version=version) as s:
+        try:
+            checkout_client(ci, downloads_dir)
+            install_project(ci['sha'], client_dir, get_build_cache(), get_test_module(ci, client_dir))
+            if not changeLibVersion(ci['client'], ci['lib'], version, downloads_dir):
+                raise ValueError(f"No POM of {ci['client']} declares the version of {ci['lib']}")
+            if run_upgraded_test(ci, downloads_dir, stop_early):
+                outcome['outcome'] = "pass"
+            else:
+                read_failure_info(ci)
+                outcome.update(outcome="fail", exception=ci['exception'], exception_info=ci['exception_info'])
+        except Exception as e:
+            outcome.update(outcome="error", error=str(e))
+        s.set(outcome=outcome['outcome'])
+    if not keep_checkout:
+        remove_worktree(client_dir)
+        if os.path.isdir(downloads_dir) and not os.listdir(downloads_dir):
+            os.rmdir(downloads_dir)
+    outcome['duration'] = round(time.perf_counter() - start, 2)
+    return outcome
+
+
+def install_client(client_info: dict, keep_checkout: bool = False) -> dict:
+    """
+    Installs the client once, in a checkout of its own, before versions are tested concurrently, so the workers find
+    the install in the build cache instead of all building it, and writing to the local Maven repository, at once.
+
+    Returns:
+        dict: The client info, with the 'test_module' of the test found for the workers.
+    """
+    ci = dict(client_info)
+    downloads_dir = get_job_downloads_dir(f"{ci['id']}@{ci['old']}")
+    client_dir = f"{downloads_dir}/{ci['client']}"
+    with trace_context(ci['id']), span("bisect_install", lib=ci['lib']):
+        try:
+            checkout_client(ci, downloads_dir)
+            install_project(ci['sha'], client_dir, get_build_cache(), get_test_module(ci, client_dir))
+        except Exception as e:
+            print(f"Unable to install {ci['client']} before bisecting, every version installs it: {e}..")
+    if not keep_checkout:
+        remove_worktree(client_dir)
+        if os.path.isdir(downloads_dir) and not os.listdir(downloads_dir):
+            os.rmdir(downloads_dir)
+    return ci
+
+
+@dataclass
+class BisectionResult:
+    id: str
+    lib: str
+    versions: list[str]
+    outcomes: dict[str, dict] = field(default_factory=dict)
+    first_failing: str | None = None
+    last_passing: str | None = None
+    skipped: list[str] = field(default_factory=list)
+    inconclusive: bool = False
+    builds: int = 0
+    rounds: int = 0
+
+
+def _outcome(outcomes: dict[str, dict], version: str) -> str | None:
+    return outcomes.get(version, {}).get('outcome')
+
+
+def _narrow(versions: list[str], outcomes: dict[str, dict], lo: int, hi: int) -> tuple[int, int]:
+    """ Moves `hi` to the first known failure after `lo`, then `lo` to the last known pass before `hi`. """
+    hi = next((i for i in range(lo + 1, hi) if _outcome(outcomes, versions[i]) == "fail"), hi)
+    lo = next((i for i in range(hi - 1, lo, -1) if _outcome(outcomes, versions[i]) == "pass"), lo)
+    return lo, hi
+
+
+def _pick(pending: list[int], k: int) -> list[int]:
+    """ Picks `k` indexes splitting `pending` into k + 1 parts of about the same size. """
+    if len(pending) <= k:
+        return pending
+    return list(dict.fromkeys(pending[(j + 1) * len(pending) // (k + 1)] for j in range(k)))
+
+
+def bisect(client_info: dict, workers: int | None = None, keep_checkouts: bool = False, stop_early: bool = False,
+           repository: str | None = None, index_file: str = VERSION_INDEX_FILE,
+           include_pre_releases: bool = False) -> BisectionResult:
+    """
+    Finds the first version of the library between 'old' and 'new' that fails the client's test.
+
+    The search is k-ary: every round tests `workers` versions splitting the remaining range evenly, each in its own
+    worktree on a process pool, so a range of n versions takes about log(n) / log(workers + 1) rounds. 'old' is
+    taken to pass; 'new' is tested in the first round unless its outcome is known. The client is installed once before
+    the first round. Versions whose build errors are skipped, and the result is inconclusive if 'new' is one of them.
+    Outcomes are cached in the knowledge store, so a repeated bisection only runs the builds it lacks, and
+    the first failing and last passing versions are recorded on the knowledge record.
+
+    Args:
+        client_info (dict): The incompatibility to bisect.
+        workers (int | None): Versions tested per round. Defaults to the number of CPUs.
+        keep_checkouts (bool): Keep the worktree of every version tested.
+        stop_early (bool): Stop every test build as soon as its target test has failed.
+        repository (str | None): The local Maven repository to list versions from.
+        index_file (str): Local version index to list versions from.
+        include_pre_releases (bool): Also test alpha, beta, milestone, RC and snapshot versions.
+
+    Returns:
+        BisectionResult: The versions tested and the versions around the break.
+    """
+    store = get_knowledge_store()
+    key = get_bisection_key(client_info)
+    versions = candidate_versions(client_info, list_versions(client_info['lib'], repository, index_file),
+                                  include_pre_releases)
+    result = BisectionResult(client_info['id'], client_info['lib'], versions, store.get_version_outcomes(key))
+    outcomes = result.outcomes
+    k = max(1, workers or os.cpu_count() or 1)
+    print(f"Bisecting {len(versions)} versions of {client_info['lib']} after {client_info['old']} "
+          f"with {k} workers...")
+    lo, hi = -1, len(versions) - 1
+    executor = None
+    try:
+        while _outcome(outcomes, versions[-1]) != "pass":
+            lo, hi = _narrow(versions, outcomes, lo, hi)
+            pending = [i for i in range(lo + 1, hi) if _outcome(outcomes, versions[i]) != "error"]
+            picks = _pick(pending, k) if _outcome(outcomes, versions[-1]) else _pick(pending, k - 1) + [hi]
+            if not picks:
+                break
+            if executor is None:
+                client_info = install_client(client_info, keep_checkouts)
+                executor = ProcessPoolExecutor(max_workers=k)
+            result.rounds += 1
+            print(f"Round {result.rounds}: testing {', '.join(versions[i] for i in picks)}")
+            futures = {executor.submit(test_version, client_info, versions[i], keep_checkouts, stop_early): versions[i]
+                       for i in picks}
+            for future in as_completed(futures):
+                version = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = {'version': version, 'outcome': "error", 'error': str(e)}
+                outcomes[version] = outcome
+                result.builds += 1
+                print(f"  {version}: {outcome['outcome']} ({outcome.get('duration', 0)}s)")
+                if outcome['outcome'] != "error":
+                    store.put_version_outcome(key, version, dict(outcome, tested=time.time()))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if _outcome(outcomes, versions[-1]) != "pass":
+        result.last_passing = versions[lo] if lo >= 0 else client_info['old']
+        result.skipped = [versions[i] for i in range(lo + 1, hi)]
+        # Only a failure of the test bounds the range: when 'new' itself cannot be tested, nothing is known to fail.
+        if _outcome(outcomes, versions[hi]) != "fail":
+            result.inconclusive = True
+            return result
+        result.first_failing = versions[hi]
+        record = store.get(client_info['id']) or dict(client_info)
+        record.update(first_failing_version=result.first_failing, last_passing_version=result.last_passing)
+        write_knowledge_info(record)
+    return result
+
+
+def print_result(result: BisectionResult, client_info: dict) -> None:
+    print(f"{client_info['old']:<20} pass (assumed)")
+    for version in result.versions:
+        outcome = result.outcomes.get(version)
+        if outcome:
+            exception = f"  {outcome['exception']}: {outcome['exception_info'][:80]}" if outcome.get('exception') \
+                else f"  {outcome['error'][:80]}" if outcome.get('error') else ""
+            print(f"{version:<20} {outcome['outcome']}{exception}")
+    if result.inconclusive:
+        print(f"Inconclusive: {client_info['lib']} {client_info['new']} could not be tested, so no version is known to "
+              f"fail. Last passing: {result.last_passing}. {result.builds} builds in {result.rounds} rounds.")
+        return
+    if result.first_failing is None:
+        print(f"{client_info['lib']} {client_info['new']} passes the test, there is no failing version to find.")
+        return
+    skipped = f" ({', '.join(result.skipped)} could not be tested)" if result.skipped else ""
+    print(f"First failing version of {client_info['lib']}: {result.first_failing}, last passing: "
+          f"{result.last_passing}{skipped}. {result.builds} builds in {result.rounds} rounds.")
+
+
+def run(id: str, workers: int | None = None, keep_checkouts: bool = False, stop_early: bool = False,
+        index_file: str = VERSION_INDEX_FILE, include_pre_releases: bool = False) -> BisectionResult | None:
+    client_info = get_knowledge_info(id, INCOMPATIBILITIES_JSON_FILE)
+    if not client_info:
+        print(f"Unable to find incompatibility id {id}..")
+        return None
+    if not TEST_ENABLED:
+        print("Testing is disabled, versions cannot be bisected.")
+        return None
+    result = bisect(client_info, workers, keep_checkouts, stop_early, index_file=index_file,
+                    include_pre_releases=include_pre_releases)
+    print_result(result, client_info)
+    return result
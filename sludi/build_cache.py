@@ -0,0 +1,177 @@
+""" Content-Addressed Maven Build Result Cache """
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess as sub
+import time
+
+from git_cache import git
+from sqlite_cache import SqliteCache
+
+BUILD_CACHE_DIR = os.path.dirname(os.path.realpath(__file__)) + '/knowledge/_build_cache'
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+PRUNED_DIRS = {'.git', 'node_modules', '.idea'}
+# Build output directories, pruned only directly under a module: a `build` package of the sources is kept.
+BUILD_OUTPUT_DIRS = {'target', 'build'}
+
+_build_caches = {}
+
+
+def is_pruned_dir(name: str, in_module: bool) -> bool:
+    """
+    Whether a directory is left out of the walks of a checkout: VCS and IDE directories anywhere, and build output
+    directories whose parent is a module (holds a pom.xml).
+    """
+    return name in PRUNED_DIRS or (in_module and name in BUILD_OUTPUT_DIRS)
+
+
+def is_pruned(rel_path: str, client_dir: str) -> bool:
+    """ Whether a file of the checkout lies in a directory `is_pruned_dir` leaves out. """
+    parts = rel_path.split('/')[:-1]
+    for i, part in enumerate(parts):
+        in_module = part in BUILD_OUTPUT_DIRS and os.path.isfile(os.path.join(client_dir, *parts[:i], 'pom.xml'))
+        if is_pruned_dir(part, in_module):
+            return True
+    return False
+
+
+def get_changed_files(client_dir: str) -> dict[str, str]:
+    """
+    Returns every file of the checkout that differs from HEAD, mapped to the hash of its current content.
+
+    Tracked files that were modified or deleted and untracked files that are not ignored are included. Build output
+    directories of modules such as `<module>/target/` are skipped.
+    """
+    changed = git("diff", "HEAD", "--name-only", "-z", cwd=client_dir).stdout.split('\0')
+    untracked = git("ls-files", "--others", "--exclude-standard", "-z", cwd=client_dir).stdout.split('\0')
+    paths = sorted({p for p in changed + untracked if p and not is_pruned(p, client_dir)})
+    existing = [p for p in paths if os.path.isfile(os.path.join(client_dir, p))]
+    hashes = {}
+    if existing:
+        hashed = sub.run(["git", "hash-object", "--stdin-paths"], cwd=client_dir, input='\n'.join(existing) + '\n',
+                         stdout=sub.PIPE, stderr=sub.PIPE, text=True, check=True).stdout.split()
+        hashes = dict(zip(existing, hashed))
+    return {p: hashes.get(p, "deleted") for p in paths}
+
+
+def tree_fingerprint(client_dir: str) -> str:
+    """ Returns a hash of the checkout's HEAD commit and every uncommitted change in it. """
+    head = git("rev-parse", "HEAD", cwd=client_dir).stdout.strip()
+    return hash_key(head, get_changed_files(client_dir))
+
+
+def get_module_dirs(client_dir: str) -> list[str]:
+    """ Returns the directory of every Maven module, relative to `client_dir` ('' for the root module). """
+    modules = []
+    for dir_path, subpaths, files in os.walk(client_dir):
+        subpaths[:] = [d for d in subpaths if not is_pruned_dir(d, 'pom.xml' in files)]
+        if 'pom.xml' in files:
+            rel_path = os.path.relpath(dir_path, client_dir).replace(os.sep, '/')
+            modules.append('' if rel_path == '.' else rel_path)
+    return modules
+
+
+def module_fingerprints(client_dir: str, modules: list[str]) -> dict[str, str]:
+    """ Returns a hash of the uncommitted changes owned by each module, keyed by module directory. """
+    owned = {module: {} for module in modules}
+    by_depth = sorted(modules, key=len, reverse=True)
+    for path, digest in get_changed_files(client_dir).items():
+        for module in by_depth:
+            if not module or path.startswith(module + '/'):
+                owned[module][path] = digest
+                break
+    return {module: hash_key(files) for module, files in owned.items()}
+
+
+def hash_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class BuildCache(SqliteCache):
+    """
+    Records the outcome and log of Maven steps under a key derived from their inputs.
+
+    Keys are built with `hash_key` from the repository SHA, the working tree fingerprint and the step's parameters
+    (lib, version, test), so a hit means the step would run on identical inputs. Entries are indexed in SQLite with
+    their last use time; logs are stored next to the index and the least recently used entries are evicted once the
+    total size exceeds `max_bytes`. Hit and miss counters are kept in the same database.
+    """
+    table = "entries"
+
+    def __init__(self, cache_dir: str = BUILD_CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        super().__init__(f"{cache_dir}/index.db", max_bytes)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, grp TEXT, success INTEGER, "
+                           "size INTEGER, created REAL, last_used REAL, meta TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_grp ON entries (grp, created)")
+
+    def log_path(self, key: str) -> str:
+        return f"{self.cache_dir}/{key[:2]}/{key}.log"
+
+    def get(self, key: str) -> dict | None:
+        """
+        Returns the cached entry for `key`, or None on a miss.
+
+        The entry holds 'success', 'meta' and 'log' (the path of the cached log, or None if no log was stored).
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT success, size, meta FROM entries WHERE key = ?", (key,)).fetchone()
+            log = self.log_path(key)
+            if row and row[1] and not os.path.exists(log):
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            self._count("hits" if row else "misses")
+            if row is None:
+                return None
+            self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return {'success': bool(row[0]), 'meta': json.loads(row[2]), 'log': log if row[1] else None}
+
+    def latest(self, group: str, successful: bool = False) -> dict | None:
+        """
+        Returns the most recently recorded entry of a group, or only of its successful entries, without counting it
+        as a hit or miss.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT success, meta FROM entries WHERE grp = ? AND success >= ? "
+                                     "ORDER BY created DESC LIMIT 1", (group, int(successful))).fetchone()
+        return {'success': bool(row[0]), 'meta': json.loads(row[1])} if row else None
+
+    def put(self, key: str, success: bool, log_file: str | None = None, group: str = "", **meta) -> None:
+        """
+        Records the outcome of a step, copying its log into the cache if one is given.
+
+        Args:
+            key (str): The key of the step, from `hash_key`.
+            success (bool): Whether the step succeeded.
+            log_file (str | None): The log the step produced.
+            group (str): Name used by `latest` to find the previous entry of the same kind.
+            **meta: Extra JSON-serialisable data stored with the entry.
+        """
+        size = 0
+        if log_file and os.path.exists(log_file):
+            log = self.log_path(key)
+            os.makedirs(os.path.dirname(log), exist_ok=True)
+            shutil.copyfile(log_file, log)
+            size = os.path.getsize(log)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (key, group, int(success), size, now, now, json.dumps(meta)))
+        self.evict()
+
+    def _evicted(self, key: str, size: int) -> None:
+        if size and os.path.exists(self.log_path(key)):
+            os.remove(self.log_path(key))
+
+
+def get_build_cache(cache_dir: str = BUILD_CACHE_DIR) -> BuildCache:
+    """ Returns the build cache for `cache_dir`, opened once per process. """
+    key = (os.path.abspath(cache_dir), os.getpid())
+    if key not in _build_caches:
+        _build_caches[key] = BuildCache(cache_dir)
+    return _build_caches[key]
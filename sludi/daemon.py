@@ -0,0 +1,185 @@
+""" Long-Lived SLUDI Daemon and Thin Client """
+
+import json
+import os
+import socket
+import stat
+import sys
+
+SOCKET_FILE = os.path.dirname(os.path.realpath(__file__)) + '/knowledge/_daemon.sock'
+SOCKET_ENV = 'SLUDI_SOCKET'
+
+
+def get_socket_file() -> str:
+    return os.environ.get(SOCKET_ENV, SOCKET_FILE)
+
+
+class SocketWriter:
+    """ File-like object forwarding everything written to it to the client as output messages. """
+
+    def __init__(self, connection: socket.socket) -> None:
+        self.connection = connection
+
+    def write(self, text: str) -> int:
+        if text:
+            send_message(self.connection, {'type': 'output', 'text': text})
+        return len(text)
+
+    def flush(self) -> None:
+        pass
+
+
+def send_message(connection: socket.socket, message: dict) -> None:
+    try:
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+    except OSError:
+        pass
+
+
+def serve(socket_file: str) -> bool:
+    """
+    Serves jobs on a Unix socket until a 'stop' request arrives.
+
+    The daemon imports the pipeline once and keeps everything it caches per process in memory between jobs: the
+    parsed JSON files, knowledge store connections, file, method and POM indexes, and the pooled LLM connections.
+    When `mvnd` is installed it is used for every Maven command, so builds also reuse warm JVMs. Jobs are command
+    lines of main.py and run one at a time, always headless, with their output streamed back to the client.
+
+    Returns:
+        bool: False if the daemon could not start.
+    """
+    import contextlib
+    import shutil
+    import socketserver
+    import threading
+    import time
+
+    import file_index
+    import main
+    import method_index
+    import pom
+    import utils
+
+    if utils.MAVEN_ENV not in os.environ and shutil.which('mvnd'):
+        os.environ[utils.MAVEN_ENV] = 'mvnd'
+    job_lock = threading.Lock()
+    started, jobs = time.time(), [0]
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self) -> None:
+            request = json.loads(self.rfile.readline() or b'{}')
+            command = request.get('command')
+            if command == 'status':
+                send_message(self.connection, {'type': 'status', 'pid': os.getpid(), 'jobs': jobs[0],
+                                               'uptime': round(time.time() - started, 1), 'busy': job_lock.locked(),
+                                               'maven': os.environ.get(utils.MAVEN_ENV, 'mvn'),
+                                               'file_indexes': file_index.file_index_count(),
+                                               'method_indexes': method_index.method_index_count(),
+                                               'pom_indexes': pom.pom_index_count()})
+            elif command == 'stop':
+                send_message(self.connection, {'type': 'exit', 'code': 0})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            elif command == 'run':
+                send_message(self.connection, {'type': 'exit', 'code': self.run_job(request.get('argv', []))})
+            else:
+                send_message(self.connection, {'type': 'error', 'text': f"Unknown command {command}"})
+
+        def run_job(self, argv: list[str]) -> int:
+            writer = SocketWriter(self.connection)
+            # redirect_stdout swaps sys.stdout for the whole process, not just this thread: it is only safe because
+            # job_lock runs one job at a time and the status and stop requests never print.
+            with job_lock, contextlib.redirect_stdout(writer), contextlib.redirect_stderr(writer):
+                jobs[0] += 1
+                try:
+                    opts = main.parseArgs(argv)
+                    opts.headless = True
+                    main.execute(opts)
+                    return 0
+                except SystemExit as e:
+                    return e.code if isinstance(e.code, int) else 1
+                except Exception as e:
+                    print(f"{type(e).__name__}: {e}")
+                    return 1
+
+    if os.path.exists(socket_file):
+        if ping(socket_file):
+            print(f"A daemon is already listening on {socket_file}")
+            return False
+        os.remove(socket_file)
+    socket_dir = os.path.dirname(os.path.abspath(socket_file))
+    os.makedirs(socket_dir, exist_ok=True)
+    if os.stat(socket_dir).st_mode & stat.S_IWOTH:
+        print(f"Refusing to listen in {socket_dir}, which every user can write to..")
+        return False
+    # Any local user who can connect may run jobs as this user, so the socket is created accessible to the owner only.
+    umask = os.umask(0o077)
+    try:
+        server = socketserver.ThreadingUnixStreamServer(socket_file, Handler)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_file, 0o600)
+    with server:
+        print(f"SLUDI daemon listening on {socket_file} (maven: {os.environ.get(utils.MAVEN_ENV, 'mvn')})")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_file)
+    return True
+
+
+def request(socket_file: str, message: dict) -> int:
+    """
+    Sends one request to the daemon, printing its output as it arrives.
+
+    Returns:
+        int: The exit code of the job.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_file)
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        for line in connection.makefile('rb'):
+            reply = json.loads(line)
+            if reply['type'] == 'output':
+                sys.stdout.write(reply['text'])
+                sys.stdout.flush()
+            elif reply['type'] == 'status':
+                print(json.dumps({k: v for k, v in reply.items() if k != 'type'}, indent=2))
+                return 0
+            elif reply['type'] == 'error':
+                print(reply['text'])
+                return 1
+            elif reply['type'] == 'exit':
+                return reply['code']
+    return 1
+
+
+def ping(socket_file: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(socket_file)
+            return True
+    except OSError:
+        return False
+
+
+def main():
+    """
+    `daemon.py serve` starts the daemon, `daemon.py status` and `daemon.py stop` control it, and any other
+    arguments are a main.py command line to run in the daemon, e.g. `daemon.py --id i-1 --diagnose`.
+    """
+    argv = sys.argv[1:]
+    socket_file = get_socket_file()
+    if not hasattr(socket, 'AF_UNIX'):
+        print("The daemon needs Unix domain sockets, which this platform does not support.")
+        exit(1)
+    if argv[:1] == ['serve']:
+        exit(0 if serve(socket_file) else 1)
+    if not ping(socket_file):
+        print(f"No daemon is listening on {socket_file}, start one with 'python daemon.py serve'.")
+        exit(1)
+    if argv[:1] in (['status'], ['stop']):
+        exit(request(socket_file, {'command': argv[0]}))
+    exit(request(socket_file, {'command': 'run', 'argv': argv}))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+""" Near-Duplicate Index of Known Failure Signatures """
+
+import argparse
+import hashlib
+import os
+import random
+import re
+import sys
+from dataclasses import asdict, dataclass, field
+
+from knowledge_store import KnowledgeStore
+from log_analyzer import analyze_test_log
+from log_store import TEST_LOG_DIR, latest_run
+
+SIGNATURE_FRAMES = 5
+NUM_HASHES = 64
+BANDS = 16
+MATCH_THRESHOLD = 0.6
+MAX_MESSAGE_CHARS = 500
+MAX_MATCHES = 5
+# Meta key set once every record of a store has been indexed, so records added since are indexed one by one.
+INDEXED_META_KEY = 'failure_index_built'
+
+# Frames of the JDK's reflection machinery and of the test runner say nothing about the failure.
+IGNORED_FRAME_PREFIXES = ('java.lang.reflect.', 'sun.reflect.', 'jdk.internal.', 'org.apache.maven.surefire.',
+                          'org.junit.runners.', 'org.junit.internal.runners.', 'org.junit.platform.')
+HEX_ADDRESS = re.compile(r'@[0-9a-fA-F]{4,}\b|\b0x[0-9a-fA-F]+\b')
+UUID = re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b')
+NUMBER = re.compile(r'(?<![\w$])\d+(?:\.\d+)*(?![\w$])')
+WHITESPACE = re.compile(r'\s+')
+FRAME_LOCATION = re.compile(r'\s*\([^)]*\)\s*$')
+SYNTHETIC_SUFFIX = re.compile(r'\$\d+')
+MESSAGE_TOKEN = re.compile(r'[A-Za-z_$#][\w$.#]*')
+
+# MinHash permutations h(x) = (a * x + b) mod p, seeded so that stored signatures stay comparable across runs.
+_PRIME = (1 << 61) - 1
+_rng = random.Random(0x51D1)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_HASHES)]
+
+_failure_indexes = {}
+
+
+def normalize_message(message: str) -> str:
+    """ Replaces the parts of an exception message that vary between runs (numbers, addresses, ids) by '#'. """
+    text = message.strip()[:MAX_MESSAGE_CHARS]
+    text = UUID.sub('#', text)
+    text = HEX_ADDRESS.sub('#', text)
+    text = NUMBER.sub('#', text)
+    return WHITESPACE.sub(' ', text)
+
+
+def normalize_frame(frame: str) -> str:
+    """ `a.B$1.call(B.java:12)` -> `a.B$#.call`: the method without its source line or anonymous class number. """
+    return SYNTHETIC_SUFFIX.sub('$#', FRAME_LOCATION.sub('', frame.strip()))
+
+
+def top_frames(frames: list[str], count: int = SIGNATURE_FRAMES) -> list[str]:
+    """ Returns the first `count` stack frames, skipping reflection and test runner frames. """
+    return [f for f in frames if not f.startswith(IGNORED_FRAME_PREFIXES)][:count]
+
+
+@dataclass
+class FailureSignature:
+    """ What identifies a failure across runs and clients: exception class, normalised message and top frames. """
+    exception: str
+    message: str
+    frames: list[str] = field(default_factory=list)
+    location: str = ""
+
+    @classmethod
+    def from_record(cls, record: dict) -> 'FailureSignature | None':
+        """ Returns the signature of a knowledge record, or None if the record has no exception. """
+        if not record.get('exception'):
+            return None
+        return cls(record['exception'], normalize_message(record.get('exception_info', "")),
+                   [normalize_frame(f) for f in top_frames(record.get('frames', []))], record.get('file_name', ""))
+
+    def tokens(self) -> set[str]:
+        """
+        The features compared between signatures: the exception class, the words and word pairs of the message,
+        the frames and the caller/callee pairs of frames, and the source file the failure was located in.
+        """
+        tokens = {f"exception:{self.exception}"}
+        words = MESSAGE_TOKEN.findall(self.message)
+        tokens.update(f"word:{w}" for w in words)
+        tokens.update(f"pair:{a} {b}" for a, b in zip(words, words[1:]))
+        tokens.update(f"frame:{f}" for f in self.frames)
+        tokens.update(f"call:{a}<{b}" for a, b in zip(self.frames, self.frames[1:]))
+        if self.location:
+            tokens.add(f"location:{self.location}")
+        return tokens
+
+
+def minhash(tokens: set[str]) -> list[int]:
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode('utf-8'), digest_size=8).digest(), 'big') for t in tokens]
+    return [min((a * h + b) % _PRIME for h in hashes) for a, b in PERMUTATIONS]
+
+
+def lsh_buckets(signature: list[int]) -> list[str]:
+    """
+    Splits a MinHash signature into `BANDS` bands and hashes each band to a bucket. Two signatures with Jaccard
+    similarity s share at least one bucket with probability 1 - (1 - s^r)^b, r being the rows per band: about 0.5 at
+    s = 0.5 and over 0.99 from s = 0.8 with the defaults.
+    """
+    rows = len(signature) // BANDS
+    return [f"{band}:{hashlib.blake2b(repr(signature[band * rows:(band + 1) * rows]).encode(), digest_size=8).hexdigest()}"
+            for band in range(BANDS)]
+
+
+def logged_frames(id: str, exception: str) -> list[str]:
+    """
+    Returns the top frames of the failure of `id` from its latest archived test log, or from its plain test log when
+    nothing is archived, provided the failure's exception is `exception`.
+    """
+    run = latest_run(id, "test")
+    if run is not None:
+        failures = [(f['exception'], f['frames']) for f in run.index['failures']]
+    elif os.path.isfile(f"{TEST_LOG_DIR}/{id}/test.log"):
+        failures = [(f.exception, f.frames) for f in analyze_test_log(f"{TEST_LOG_DIR}/{id}/test.log").failures]
+    else:
+        return []
+    return top_frames(failures[0][1]) if failures and failures[0][0] == exception else []
+
+
+def jaccard(a: set[str], b: set[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+@dataclass
+class Match:
+    """ A known failure similar to the one looked up, with the diagnosis and fix recorded for it. """
+    id: str
+    similarity: float
+    exception: str = ""
+    exception_info: str = ""
+    diagnosis: str = ""
+    fix: str = ""
+
+
+class FailureIndex:
+    """
+    Locality-sensitive hash index of the failure signatures of the knowledge records.
+
+    Every record with an exception is indexed under the LSH buckets of the MinHash of its signature, in tables of
+    the knowledge store. A lookup only fetches the records sharing a bucket with the failure looked up and ranks
+    them by the exact Jaccard similarity of their features, so its cost depends on the number of near-duplicates
+    rather than on the size of the corpus.
+    """
+
+    def __init__(self, store: KnowledgeStore) -> None:
+        self.store = store
+
+    def add(self, record: dict) -> bool:
+        """
+        Indexes, or re-indexes, the signature of a knowledge record.
+
+        Returns:
+            bool: True if the record has a signature, False if it has no exception (and was removed from the index).
+        """
+        signature = FailureSignature.from_record(record)
+        if signature is None:
+            self.store.delete_signature(record['id'])
+            return False
+        tokens = signature.tokens()
+        hashes = minhash(tokens)
+        self.store.put_signature(record['id'], {'signature': asdict(signature), 'tokens': sorted(tokens)},
+                                 lsh_buckets(hashes))
+        return True
+
+    def rebuild(self) -> int:
+        """
+        Re-indexes every knowledge record. Records without stack frames take them from their test log, when there is
+        one.
+
+        Returns:
+            int: The number of records indexed.
+        """
+        indexed = 0
+        for record in self.store.all():
+            if record.get('exception') and not record.get('frames'):
+                record = dict(record, frames=logged_frames(record['id'], record['exception']))
+            indexed += self.add(record)
+        self.store.put_meta(INDEXED_META_KEY, "1")
+        return indexed
+
+    def lookup(self, signature: FailureSignature, exclude: str | None = None, threshold: float = MATCH_THRESHOLD,
+               limit: int = MAX_MATCHES) -> list[Match]:
+        """
+        Finds the known failures most similar to `signature`.
+
+        Args:
+            signature (FailureSignature): The failure to look up.
+            exclude (str | None): An id to leave out, usually the incompatibility being diagnosed.
+            threshold (float): Minimum Jaccard similarity of the features.
+            limit (int): Maximum number of matches.
+
+        Returns:
+            list[Match]: The matches, most similar first.
+        """
+        tokens = signature.tokens()
+        candidates = self.store.find_signatures(lsh_buckets(minhash(tokens)))
+        scored = sorted(((jaccard(tokens, set(data['tokens'])), id) for id, data in candidates.items() if id != exclude),
+                        reverse=True)
+        matches = []
+        for similarity, id in scored[:limit]:
+            if similarity < threshold:
+                break
+            record = self.store.get(id) or {}
+            matches.append(Match(id, round(similarity, 3), record.get('exception', ""), record.get('exception_info', ""),
+                                 record.get('diagnosis', ""), record.get('fix', "")))
+        return matches
+
+
+def get_failure_index(store: KnowledgeStore, migrate: bool = False) -> FailureIndex:
+    """
+    Returns the failure index of a knowledge store.
+
+    Records are indexed as they are written. With `migrate`, the records of a store that were never indexed, e.g.
+    those imported from knowledge.json or written before the index existed, are indexed once; the store records that
+    it was done, so it never happens again. Re-index with `failure_index.py --rebuild` otherwise.
+    """
+    index = _failure_indexes.get(id(store))
+    if index is None or index.store is not store:
+        index = _failure_indexes[id(store)] = FailureIndex(store)
+    if migrate and store.get_meta(INDEXED_META_KEY) is None:
+        print(f"Indexing the failures of {len(store)} knowledge records, once...")
+        index.rebuild()
+    return index
+
+
+def find_known_failure(client_info: dict, store: KnowledgeStore) -> list[Match]:
+    """ Returns the known failures similar to the failure of `client_info`, excluding the incompatibility itself. """
+    signature = FailureSignature.from_record(client_info)
+    if signature is None:
+        return []
+    return get_failure_index(store, migrate=True).lookup(signature, exclude=client_info['id'])
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Finds the known failures similar to the failure of an incompatibility')
+    parser.add_argument('--id', help='The Subject ID whose failure to look up', required=False)
+    parser.add_argument('--threshold', help='Minimum similarity of a match', type=float, default=MATCH_THRESHOLD)
+    parser.add_argument('--rebuild', help='Re-index every knowledge record', action='store_true')
+    opts = parser.parse_args(argv)
+    if not opts.id and not opts.rebuild:
+        parser.print_help()
+        exit(1)
+    return opts
+
+
+def main():
+    from utils import get_knowledge_store
+
+    opts = parseArgs(sys.argv[1:])
+    store = get_knowledge_store()
+    index = get_failure_index(store, migrate=not opts.rebuild)
+    if opts.rebuild:
+        print(f"Indexed {index.rebuild()} of {len(store)} knowledge records.")
+    if opts.id:
+        record = store.get(opts.id)
+        signature = FailureSignature.from_record(record) if record else None
+        if signature is None:
+            print(f"No failure recorded for {opts.id}..")
+            exit(1)
+        matches = index.lookup(signature, exclude=opts.id, threshold=opts.threshold)
+        if not matches:
+            print(f"No known failure similar to {opts.id}.")
+        for match in matches:
+            print(f"{match.id:<10} {match.similarity:.3f}  {match.exception}: {match.exception_info[:100]}"
+                  f"{'  [diagnosed]' if match.diagnosis else ''}{'  [fixed]' if match.fix else ''}")
+    exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+""" Cached Per-Client Source File Index """
+
+import json
+import os
+import tempfile
+
+from build_cache import is_pruned, is_pruned_dir
+from git_cache import git
+
+# Bumped whenever the files an index holds change, so indexes of older versions are rebuilt.
+FILE_INDEX_VERSION = 2
+
+_file_indexes = {}
+_validated = set()
+
+
+def get_index_state(client_dir: str) -> tuple[str, dict[str, str]] | None:
+    """
+    Returns the checkout's HEAD commit and the status of the files it adds, deletes or renames, keyed by path, or
+    None if it is not a git checkout.
+
+    Files that are merely edited are left out, so the state changes whenever the set of files does but not when a
+    file's content does.
+    """
+    head = git("rev-parse", "HEAD", cwd=client_dir, check=False)
+    if head.returncode != 0:
+        return None
+    tokens = git("status", "--porcelain", "-z", "--untracked-files=all", cwd=client_dir, check=False).stdout.split('\0')
+    status, i = {}, 0
+    while i < len(tokens):
+        entry = tokens[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        code, path = entry[:2], entry[3:]
+        if 'R' in code or 'C' in code:
+            status[tokens[i]] = code
+            i += 1
+        if code.replace('M', ' ').strip():
+            status[path] = code
+    return head.stdout.strip(), status
+
+
+def invalidate_file_indexes() -> None:
+    """
+    Makes the next `get_file_index` of every checkout check the checkout's git state again. The pipeline calls it
+    before every stage, since stages are what add and remove files.
+    """
+    _validated.clear()
+
+
+class FileIndex:
+    """
+    Maps the file names of a checkout to their paths relative to the checkout.
+
+    Build output and VCS directories are skipped. The index is stored next to the checkout as
+    `.<client>.files.json` together with the git state it was built from. It is rebuilt when the HEAD commit changes;
+    otherwise only the paths whose status changed are re-checked.
+    """
+
+    def __init__(self, client_dir: str) -> None:
+        self.client_dir = os.path.abspath(client_dir)
+        self.index_file = os.path.join(os.path.dirname(self.client_dir),
+                                       f".{os.path.basename(self.client_dir)}.files.json")
+        self.head: str | None = None
+        self.status: dict[str, str] = {}
+        self.files: dict[str, list[str]] = {}
+
+    def load(self) -> bool:
+        try:
+            with open(self.index_file, 'r') as file:
+                data = json.load(file)
+            if data.get('version') != FILE_INDEX_VERSION:
+                return False
+            self.head, self.status, self.files = data['head'], data['status'], data['files']
+            return True
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return False
+
+    def save(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_file), suffix='.tmp')
+        with os.fdopen(fd, 'w') as fw:
+            json.dump({'version': FILE_INDEX_VERSION, 'head': self.head, 'status': self.status, 'files': self.files},
+                      fw)
+        os.replace(tmp_path, self.index_file)
+
+    def build(self, state: tuple[str, dict[str, str]] | None) -> None:
+        files = {}
+        for dir_path, subpaths, names in os.walk(self.client_dir):
+            subpaths[:] = sorted(d for d in subpaths if not is_pruned_dir(d, 'pom.xml' in names))
+            rel_dir = os.path.relpath(dir_path, self.client_dir).replace(os.sep, '/')
+            for name in names:
+                files.setdefault(name, []).append(name if rel_dir == '.' else f"{rel_dir}/{name}")
+        self.files = files
+        self.head, self.status = state if state is not None else (None, {})
+        if state is not None:
+            self.save()
+
+    def update(self, state: tuple[str, dict[str, str]]) -> bool:
+        """
+        Brings the index up to date with a state of the same HEAD commit, re-checking only the paths whose status
+        changed.
+
+        Returns:
+            bool: True if the index changed.
+        """
+        head, status = state
+        changed = {path for path in status.keys() | self.status.keys() if status.get(path) != self.status.get(path)}
+        for path in changed:
+            name = path.rsplit('/', 1)[-1]
+            paths = self.files.get(name, [])
+            exists = not is_pruned(path, self.client_dir) and os.path.isfile(os.path.join(self.client_dir, path))
+            if exists and path not in paths:
+                self.files[name] = sorted(paths + [path])
+            elif not exists and path in paths:
+                paths.remove(path)
+                if not paths:
+                    del self.files[name]
+        self.status = status
+        if changed:
+            self.save()
+        return bool(changed)
+
+    def lookup(self, file_name: str, package: str | None = None) -> str | None:
+        """
+        Returns the absolute path of `file_name`, or None if the checkout has no such file.
+
+        When several files share the name, the one whose directory matches the package path (e.g. `retrofit2/http`
+        for package `retrofit2.http`) is preferred, followed by sources under `src/`.
+        """
+        candidates = self.files.get(file_name)
+        if not candidates:
+            return None
+        if len(candidates) > 1:
+            package_path = '/' + package.replace('.', '/') + '/' + file_name if package else None
+
+            def rank(path: str) -> tuple[bool, bool]:
+                in_package = bool(package_path) and ('/' + path).endswith(package_path)
+                in_sources = path.startswith('src/') or '/src/' in path
+                return not in_package, not in_sources
+            candidates = sorted(candidates, key=rank)
+        return os.path.join(self.client_dir, candidates[0])
+
+
+def file_index_count() -> int:
+    """ Returns the number of file indexes cached in memory. """
+    return len(_file_indexes)
+
+
+def get_file_index(client_dir: str) -> FileIndex:
+    """
+    Returns the file index of a checkout, loading it from disk or bringing it up to date when the checkout changed.
+
+    The git state of a checkout is checked on the first call after `invalidate_file_indexes`, and later calls return
+    the index without running git. Checkouts that are not git repositories are indexed in memory on every call.
+    """
+    key = os.path.abspath(client_dir)
+    index = _file_indexes.get(key)
+    if index is not None and key in _validated:
+        return index
+    state = get_index_state(client_dir)
+    if index is None:
+        index = FileIndex(client_dir)
+        if state is not None:
+            index.load()
+    if state is None or index.head != state[0]:
+        index.build(state)
+    else:
+        index.update(state)
+    _file_indexes[key] = index
+    if state is not None:
+        _validated.add(key)
+    return index
@@ -0,0 +1,133 @@
+""" Shared Git Mirror Cache with Per-Incompatibility Worktrees """
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess as sub
+import time
+from contextlib import contextmanager
+
+MIRRORS_DIR = os.path.dirname(os.path.realpath(__file__)) + '/knowledge/_mirrors'
+LOCK_TIMEOUT = 600
+STALE_LOCK_AGE = 3600
+
+
+def git(*args: str, cwd: str | None = None, check: bool = True) -> sub.CompletedProcess:
+    return sub.run(["git", *args], cwd=cwd, check=check, stdout=sub.PIPE, stderr=sub.PIPE, text=True)
+
+
+def get_mirror_dir(url: str, mirrors_dir: str = MIRRORS_DIR) -> str:
+    """ Returns the bare mirror directory for a repository URL, e.g. `_mirrors/retrofit-1a2b3c4d.git`. """
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', url.rstrip('/').split('/')[-1].removesuffix('.git')) or "repo"
+    digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+    return f"{mirrors_dir}/{name}-{digest}.git"
+
+
+@contextmanager
+def mirror_lock(mirror_dir: str):
+    """
+    Serialises fetches and worktree changes on one mirror across threads and processes.
+
+    The lock is a file created with O_EXCL next to the mirror, which works the same on every platform. Locks older
+    than `STALE_LOCK_AGE` seconds are assumed to belong to a crashed process and are broken.
+    """
+    lock_file = mirror_dir + '.lock'
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while True:
+        try:
+            fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_file) > STALE_LOCK_AGE:
+                    os.remove(lock_file)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Timed out waiting for {lock_file}")
+            time.sleep(0.2)
+    try:
+        yield
+    finally:
+        os.remove(lock_file)
+
+
+def has_commit(mirror_dir: str, sha: str) -> bool:
+    return git("cat-file", "-e", f"{sha}^{{commit}}", cwd=mirror_dir, check=False).returncode == 0
+
+
+def ensure_mirror(url: str, sha: str, mirrors_dir: str = MIRRORS_DIR) -> str:
+    """
+    Makes sure the bare mirror of `url` exists and contains commit `sha`.
+
+    Only the requested commit is fetched. If the remote refuses to serve a commit by SHA, all branches and tags are
+    fetched instead. Fetched commits are pinned under `refs/sludi/` so they survive garbage collection.
+
+    Args:
+        url (str): The URL of the repository.
+        sha (str): The commit that must be available.
+        mirrors_dir (str): Directory holding the mirrors. Defaults to `MIRRORS_DIR`.
+
+    Returns:
+        str: The path of the bare mirror.
+
+    Raises:
+        RuntimeError: If the commit cannot be fetched.
+    """
+    mirror_dir = get_mirror_dir(url, mirrors_dir)
+    if not os.path.exists(mirrors_dir):
+        os.makedirs(mirrors_dir, exist_ok=True)
+    with mirror_lock(mirror_dir):
+        if not os.path.isdir(mirror_dir):
+            print(f"Creating mirror of {url}")
+            git("init", "--bare", "--quiet", mirror_dir)
+            git("remote", "add", "origin", url, cwd=mirror_dir)
+        if not has_commit(mirror_dir, sha):
+            print(f"Fetching {sha} from {url}")
+            fetched = git("fetch", "--quiet", "--no-tags", "origin", sha, cwd=mirror_dir, check=False)
+            if fetched.returncode != 0:
+                git("fetch", "--quiet", "origin", "+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*",
+                    cwd=mirror_dir, check=False)
+            if not has_commit(mirror_dir, sha):
+                raise RuntimeError(f"Unable to fetch commit {sha} from {url}: {fetched.stderr.strip()}")
+            git("update-ref", f"refs/sludi/{sha}", sha, cwd=mirror_dir)
+    return mirror_dir
+
+
+def add_worktree(url: str, sha: str, worktree_dir: str, mirrors_dir: str = MIRRORS_DIR) -> None:
+    """
+    Checks out commit `sha` of `url` into `worktree_dir` as a detached worktree of the shared mirror.
+
+    Args:
+        url (str): The URL of the repository.
+        sha (str): The commit to check out.
+        worktree_dir (str): Directory of the new worktree. It must not exist yet.
+        mirrors_dir (str): Directory holding the mirrors. Defaults to `MIRRORS_DIR`.
+    """
+    mirror_dir = ensure_mirror(url, sha, mirrors_dir)
+    parent_dir = os.path.dirname(os.path.abspath(worktree_dir))
+    if not os.path.exists(parent_dir):
+        os.makedirs(parent_dir, exist_ok=True)
+    with mirror_lock(mirror_dir):
+        git("worktree", "prune", cwd=mirror_dir)
+        git("worktree", "add", "--quiet", "--detach", "--force", os.path.abspath(worktree_dir), sha, cwd=mirror_dir)
+
+
+def remove_worktree(worktree_dir: str) -> None:
+    """ Deletes a worktree created by `add_worktree` and unregisters it from its mirror. """
+    if not os.path.isdir(worktree_dir):
+        return
+    common_dir = git("rev-parse", "--git-common-dir", cwd=worktree_dir, check=False).stdout.strip()
+    mirror_dir = os.path.abspath(os.path.join(worktree_dir, common_dir)) if common_dir else ""
+    if not os.path.isdir(mirror_dir):
+        shutil.rmtree(worktree_dir, ignore_errors=True)
+        return
+    with mirror_lock(mirror_dir):
+        removed = git("worktree", "remove", "--force", os.path.abspath(worktree_dir), cwd=mirror_dir, check=False)
+        if removed.returncode != 0:
+            shutil.rmtree(worktree_dir, ignore_errors=True)
+            git("worktree", "prune", cwd=mirror_dir)
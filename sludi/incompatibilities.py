@@ -1,112 +1,211 @@
 from utils import *
-from services import openai_service
-from services import anthropic_service
 
-import subprocess
+from api_diff import artifact_file, get_m2_repository
+from build_cache import BuildCache, get_build_cache, get_module_dirs, hash_key, module_fingerprints, tree_fingerprint
+from failure_index import top_frames
+from log_analyzer import BUILD_FAILURE, run_test_build
+from log_store import archive_test_log
+from pom import get_reactor_graph
+from tracing import span
 
 TEST_ENABLED = True
+MVN_INSTALL_CMD = 'mvn install -DskipTests -fn -Denforcer.skip -Dgpg.skip -Drat.skip -Dcheckstyle.skip -Danimal.sniffer.skip'
 
-def run(id: str) -> None:
-    client_info = get_knowledge_info(id, INCOMPATIBILITIES_JSON_FILE)
-    if not client_info:
-        print(f"Unable to find incompatibility id {id}..")
-        return
-    discover_client(client_info)
-    change_version = True
-
-    while True:
-        user_input = input("Type 'test' to run Maven test build or 'exit' to quit: ")
-        if user_input == "exit":
-            break
-        elif user_input != "test":
-            print("Invalid input. Please type 'test' or 'exit'.")
-            continue
-        
-        if TEST_ENABLED:
-            test_success = test_upgrade_incompatibility(client_info, change_version)
-            if test_success:
-                print("Test successful!.")
-                return
-        # End of Discovery -------------------------------
-        try:
-            extract_info(client_info)
-        except Exception as e:
-            print(e)
-            return
-        code = get_code_from_source(client_info)
-        file_path = search_for_file(client_info["client"], client_info["file_name"])
-        if code:
-            query = f"{client_info['exception']}\n{client_info['exception_info']}\n{code.strip()}"
-            print(query)
-            send_AI = input("Send to AI to diagnose and resolve this issue? (Y/N): ")
-            if send_AI.strip() == "Y":
-                #query += f"\nthis occurred after upgrading {client_info['lib']} from {client_info['old']} to {client_info['new']}"
-                response = openai_service.query(query)
-                print('\n' + response)
-                if "pom.xml" in response:
-                    open_pom_file(client_info)
-                else:
-                    subprocess.Popen(["notepad.exe", file_path])
-                change_version = False
-            prompt = input("Enter prompt manually? (Y/N): ")
-            if prompt.strip() == "Y":
-                prompt = input("Prompt: ")
-                response = anthropic_service.query(prompt)
-                print('\n' + response)
-        else:
-            print(f"Unable to automatically extract information, please refer to {TEST_LOG_DIR}/{id}/test.log for details.")
-            break
+def discover_client(client_info: dict, downloads_dir=DOWNLOADS_DIR) -> None:
+    checkout_client(client_info, downloads_dir)
+    write_knowledge_info(client_info)
 
 
-def discover_client(client_info: dict) -> None:
+def checkout_client(client_info: dict, downloads_dir=DOWNLOADS_DIR) -> None:
     client, sha, url = client_info["client"], client_info["sha"], client_info["url"]
 
-    if not os.path.exists(DOWNLOADS_DIR):
-        os.makedirs(DOWNLOADS_DIR)
+    if not os.path.exists(downloads_dir):
+        os.makedirs(downloads_dir)
     
-    client_dir = f"{DOWNLOADS_DIR}/{client}"
+    client_dir = f"{downloads_dir}/{client}"
     if not os.path.isdir(client_dir):
-        clone_project(client, url, sha)
+        clone_project(client, url, sha, downloads_dir)
     else:
         print(f"{client_dir} already exists, reverting changes...")
-        cwd = os.getcwd()
-        os.chdir(f"{DOWNLOADS_DIR}/{client}")
-        sub.run("git checkout .", shell=True)
-        os.chdir(cwd)
-    
-    if not os.path.exists(KNOWLEDGE_JSON_FILE):
-        with open(KNOWLEDGE_JSON_FILE, 'w') as file:
-            json.dump([], file, indent=2)
-    write_knowledge_info(client_info)
+        with span("revert", client=client) as s:
+            s.set(exit_code=sub.run("git checkout .", shell=True, cwd=client_dir).returncode)
     
 
-def test_upgrade_incompatibility(client_info: dict, change_version: bool) -> bool:
-    id, client, lib, new, test = client_info['id'], client_info['client'], client_info['lib'], client_info['new'], client_info['test']
-    submodule, test_cmd = client_info['submodule'], client_info['test_cmd']
-    print(f"Running Test for Maven Project '{client}' with id: {id}...")
+def test_upgrade_incompatibility(client_info: dict, change_version: bool, downloads_dir=DOWNLOADS_DIR,
+                                 stop_early: bool = False) -> bool:
+    print(f"Running Test for Maven Project '{client_info['client']}' with id: {client_info['id']}...")
+    run_baseline(client_info, downloads_dir)
+    if change_version:
+        changeLibVersion(client_info['client'], client_info['lib'], client_info['new'], downloads_dir)
+    return run_upgraded_test(client_info, downloads_dir, stop_early)
 
-    cwd = os.getcwd()
-    os.chdir(f"{DOWNLOADS_DIR}/{client}")
-    sub.run('mvn install -DskipTests -fn -Denforcer.skip -Dgpg.skip -Drat.skip -Dcheckstyle.skip -Danimal.sniffer.skip', shell=True, stdout=open(os.devnull, 'w'), stderr=sub.STDOUT)
-    if submodule != "N/A":
-        os.chdir(f"{DOWNLOADS_DIR}/{client}/{submodule}")
-    sub.run(f"mvn test -fn -Drat.ignoreErrors=true -DtrimStackTrace=false -Dtest={test}", shell=True, stdout=open(os.devnull, 'w'), stderr=sub.STDOUT)
 
-    if change_version:
-        changeLibVersion(client, lib, new)
+def run_baseline(client_info: dict, downloads_dir=DOWNLOADS_DIR) -> None:
+    """
+    Installs the client and runs its test before the library upgrade, finding the test's module if needed.
+    """
+    client, test, sha = client_info['client'], client_info['test'], client_info['sha']
+    client_dir = f"{downloads_dir}/{client}"
+    test_dir, test_cmd = get_test_command(client_info, client_dir)
+    cache = get_build_cache()
+    install_project(sha, client_dir, cache, get_test_module(client_info, client_dir))
+    baseline_key = hash_key('baseline', sha, tree_fingerprint(client_dir), test, client_info['submodule'], test_cmd)
+    with span("baseline_test", test=test) as s:
+        s.set(cached=bool(cache.get(baseline_key)))
+        if s.attrs['cached']:
+            print("Baseline test unchanged since last run, skipping...")
+        else:
+            os.makedirs(f"{TEST_LOG_DIR}/{client_info['id']}", exist_ok=True)
+            baseline_log_file = f"{TEST_LOG_DIR}/{client_info['id']}/baseline.log"
+            with open(baseline_log_file, 'w') as log:
+                result = sub.run(get_maven_command(test_cmd), shell=True, cwd=test_dir, stdout=log, stderr=sub.STDOUT)
+            archive_test_log(client_info['id'], baseline_log_file, test.split('#')[0], "baseline", log_dir=TEST_LOG_DIR)
+            os.remove(baseline_log_file)
+            cache.put(baseline_key, result.returncode == 0, group=f"baseline:{sha}")
+            s.set(exit_code=result.returncode)
+
+
+def run_upgraded_test(client_info: dict, downloads_dir=DOWNLOADS_DIR, stop_early: bool = False) -> bool:
+    """
+    Runs the client's test against the upgraded library, archiving the output in the incompatibility's test log runs.
 
+    Returns:
+        bool: True if the build succeeded.
+    """
+    id, client, lib, new, test = client_info['id'], client_info['client'], client_info['lib'], client_info['new'], client_info['test']
+    sha, submodule = client_info['sha'], client_info['submodule']
+    client_dir = f"{downloads_dir}/{client}"
+    test_dir, test_cmd = get_test_command(client_info, client_dir)
+    cache = get_build_cache()
     if not os.path.isdir(f"{TEST_LOG_DIR}/{id}"):
         os.makedirs(f"{TEST_LOG_DIR}/{id}")
     test_log_file = f"{TEST_LOG_DIR}/{id}/test.log"
 
-    if submodule != "N/A":
-        os.chdir(f"{DOWNLOADS_DIR}/{client}/{submodule}")
+    test_key = hash_key('test', sha, tree_fingerprint(client_dir), lib, new, test, submodule, test_cmd, stop_early)
+    with span("test", test=test, lib=lib, version=new) as s:
+        cached = cache.get(test_key)
+        s.set(cached=bool(cached and cached['log']))
+        if s.attrs['cached']:
+            print("Project unchanged since last test, reusing cached test log...")
+            archive_test_log(id, cached['log'], test.split('#')[0], "test", log_dir=TEST_LOG_DIR)
+            s.set(success=cached['success'])
+            return cached['success']
+        report = run_test_build(get_maven_command(test_cmd), test_dir, test_log_file, test.split('#')[0], stop_early)
+        if report.stopped_early:
+            print(f"Test {test} failed, stopped the build early...")
+        test_success = report.success
+        archive_test_log(id, test_log_file, test.split('#')[0], "test", log_dir=TEST_LOG_DIR)
+        s.set(exit_code=report.exit_code, log_bytes=report.bytes, success=test_success,
+              stopped_early=report.stopped_early)
+    cache.put(test_key, test_success, test_log_file, group=f"test:{id}")
+    # The archived run replaces the plain log; `python log_store.py <id> --full` prints it.
+    os.remove(test_log_file)
+    return test_success
+
+
+def find_submodule(client_info: dict, client_dir: str) -> str:
+    """
+    Finds the reactor module that owns the test class of 'client_info' and records it as the 'test_module' field.
+
+    Returns:
+        str: The module directory relative to the project root, or "N/A" if the test is in the root module or
+             cannot be found.
+    """
+    graph = get_reactor_graph(client_dir)
+    module = graph.find_test_module(client_info['test'].split('#')[0]) or "N/A"
+    if module != "N/A":
+        required = graph.required_modules(module)
+        print(f"Found test {client_info['test']} in module '{module}', building {len(required)} of {len(graph.modules)} modules")
+    client_info['test_module'] = module
+    return module
+
+
+def get_test_module(client_info: dict, client_dir: str) -> str:
+    """
+    Returns the module the client's test lives in: the configured 'submodule', else the 'test_module' found by
+    `find_submodule` (looked up on first use), else "N/A". A configured 'test_cmd' is trusted to find the test itself.
+    """
+    if client_info['submodule'] != "N/A" or client_info['test_cmd'] != "N/A":
+        return client_info['submodule']
+    if 'test_module' not in client_info:
+        find_submodule(client_info, client_dir)
+    return client_info['test_module']
+
+
+def get_test_command(client_info: dict, client_dir: str) -> tuple[str, str]:
+    """
+    Builds the command running the client's test and the directory to run it in.
+
+    A configured 'submodule' runs the test inside that module's directory and a configured 'test_cmd' runs as is.
+    A 'test_module' found by `find_submodule` runs from the project root with `-pl <module> -am`, so the reactor
+    modules the test depends on are built from the checkout, with the bumped library version, instead of being
+    resolved from the copies installed before the bump.
+
+    Returns:
+        tuple[str, str]: The directory to run the test in and the test command.
+    """
+    test, submodule, test_cmd = client_info['test'], client_info['submodule'], client_info['test_cmd']
+    test_dir = f"{client_dir}/{submodule}" if submodule != "N/A" else client_dir
     if test_cmd == "N/A":
         test_cmd = f"mvn test -fn -Drat.ignoreErrors=true -DtrimStackTrace=false -Dtest={test}"
-    sub.run(test_cmd, shell=True, stdout=open(test_log_file, 'w'), stderr=sub.STDOUT)
-    os.chdir(cwd)
+        test_module = get_test_module(client_info, client_dir)
+        if submodule == "N/A" and test_module != "N/A":
+            # Without these, the upstream modules fail the build for not containing the test.
+            test_cmd += f" -pl {test_module} -am -Dsurefire.failIfNoSpecifiedTests=false -DfailIfNoTests=false"
+    return test_dir, test_cmd
+
+
+def install_project(sha: str, client_dir: str, cache: BuildCache, submodule: str = "N/A") -> None:
+    """
+    Installs the client's modules into the local Maven repository, skipping work the build cache says is done.
+
+    When the test lives in a submodule, only that module and the reactor modules it depends on are built
+    (`-pl <module> -am`). The install is skipped when no module changed since the last successful install of this
+    commit and the POMs it installed are still in the local repository. Otherwise only the modules whose files
+    changed, and the modules depending on them, are rebuilt, unless the root POM itself changed.
+    """
+    modules = get_module_dirs(client_dir)
+    fingerprints = module_fingerprints(client_dir, modules)
+    install_key = hash_key('install', sha, fingerprints, submodule)
+    with span("install", modules=len(modules)) as s:
+        cached = cache.get(install_key)
+        s.set(cached=bool(cached and cached['success'] and
+                          all(os.path.exists(path) for path in cached['meta'].get('artifacts', []))))
+        if s.attrs['cached']:
+            print("Modules unchanged since last install, skipping install...")
+            return
+        install_cmd = MVN_INSTALL_CMD
+        # Only a successful install says which module versions are in the local repository.
+        previous = cache.latest(f"install:{sha}", successful=True)
+        if submodule != "N/A":
+            install_cmd += f" -pl {submodule} -am"
+        elif previous:
+            changed = [m for m in modules if previous['meta']['modules'].get(m) != fingerprints[m]]
+            if changed and '' not in changed:
+                install_cmd += f" -pl {','.join(changed)} -amd"
+        # With -fn Maven exits 0 even when a module fails, so the outcome is read from the output.
+        failed = False
+        with sub.Popen(get_maven_command(install_cmd), shell=True, cwd=client_dir, stdout=sub.PIPE,
+                       stderr=sub.STDOUT, text=True, errors='replace') as process:
+            for line in process.stdout:
+                failed = failed or BUILD_FAILURE in line
+        success = process.returncode == 0 and not failed
+        s.set(cmd=install_cmd, exit_code=process.returncode, success=success)
+    cache.put(install_key, success, group=f"install:{sha}", modules=fingerprints,
+              artifacts=installed_artifacts(client_dir, submodule))
+
 
-    return get_test_result(id)
+def installed_artifacts(client_dir: str, submodule: str = "N/A") -> list[str]:
+    """
+    Returns the POMs of the reactor modules an install builds that are present in the local Maven repository, so a
+    cached install is only trusted while they are still there.
+    """
+    graph = get_reactor_graph(client_dir)
+    built = graph.required_modules(submodule) if submodule != "N/A" else graph.modules
+    repository = get_m2_repository()
+    paths = [artifact_file(graph.modules[m].group_id, graph.modules[m].artifact_id, graph.modules[m].version, 'pom',
+                           repository) for m in built if m in graph.modules]
+    return [path for path in paths if os.path.exists(path)]
 
 
 def extract_info(client_info: dict) -> None:
@@ -126,47 +225,34 @@ def extract_info(client_info: dict) -> None:
         None: This function modifies the 'client_info' dictionary in place and does not return any value.
     """
     print("Extracting Exception and Error Information...\n")
-    client_info["exception"], client_info["exception_info"] = find_exception(client_info["id"])
-    error_location = find_error_location(client_info['id'], client_info['test'].split('#')[0])
+    read_failure_info(client_info)
+    write_knowledge_info(client_info)
+    return
+
+
+def read_failure_info(client_info: dict) -> None:
+    """
+    Fills in the exception, exception_info, frames, file_name, package and line_no fields of 'client_info' from its
+    test log, without writing them to knowledge.json.
+
+    Raises:
+        ValueError: If no exception is found in the test log.
+    """
+    report = get_test_log_report(client_info["id"], client_info['test'].split('#')[0])
+    client_info["exception"], client_info["exception_info"] = report.exception
+    client_info["frames"] = top_frames(report.failures[0].frames)
+    error_location = report.error_location
     if error_location:    
         client_info["file_name"] = error_location.strip().split('(')[-1].split(':')[0]
+        client_info["package"] = '.'.join(error_location.strip().split('(')[0].split('.')[:-2])
         client_info['line_no'] = error_location.strip().split(')')[0].split(':')[-1]
     else:
-        client_info["file_name"], client_info['line_no'] = "", ""
-    write_knowledge_info(client_info)
-    return
+        client_info["file_name"], client_info["package"], client_info['line_no'] = "", "", ""
 
 
 def find_exception(id: str) -> tuple[str, str]:
-    test_log_path = f"{TEST_LOG_DIR}/{id}/test.log"
-    with open(test_log_path, 'r') as fr:
-        lines = fr.readlines()
-    for i in range(len(lines)):
-        if lines[i].strip().endswith("<<< ERROR!") or lines[i].strip().endswith("<<< FAILURE!"):
-            n = i+1
-            exception = ""
-            while not lines[n].strip().startswith("at "):
-                exception += lines[n]
-                n+= 1
-            
-            if not exception:
-                raise ValueError("No exception found.")
-
-            exception = exception.split(":")
-            if len(exception) == 1:
-                return exception[0].strip(), ""
-            else:
-                return exception[0].strip(), "".join(exception[1:]).strip()
-    raise ValueError("No exception found.")
+    return get_test_log_report(id).exception
 
 
 def find_error_location(id: str, test_name: str) -> str:
-    test_log_path = f"{TEST_LOG_DIR}/{id}/test.log"
-    with open(test_log_path, 'r') as fr:
-        lines = fr.readlines()
-
-    for line in lines:
-        if line.strip().startswith("at ") and line.strip().endswith(")"):
-            line = line.strip().split("at ")[-1]
-            if test_name in line.split('(')[1]:
-                return line
\ No newline at end of file
+    return get_test_log_report(id, test_name).error_location
@@ -0,0 +1,248 @@
+""" Indexed, Transactional Knowledge Store """
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+class KnowledgeStore:
+    """
+    SQLite-backed store of knowledge records keyed by incompatibility id.
+
+    Records are kept in an indexed table, so reads and upserts cost O(1) instead of re-reading and rewriting the whole
+    of knowledge.json. Every write runs in its own transaction on a WAL-mode database, which makes writes crash-safe
+    and lets several worker processes share one store. The store imports from, and exports to, the knowledge.json
+    format.
+    """
+
+    def __init__(self, db_path: str, json_path: str | None = None) -> None:
+        """
+        Args:
+            db_path (str): Path to the SQLite database, created if it does not exist.
+            json_path (str | None): knowledge.json to import from when the database is still empty, or when the file
+                was edited since it was last exported or imported.
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS records "
+                           "(id TEXT PRIMARY KEY, seq INTEGER NOT NULL, data TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_seq ON records (seq)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sessions "
+                           "(id TEXT NOT NULL, name TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (id, name))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS checkpoints "
+                           "(id TEXT NOT NULL, stage TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (id, stage))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS signatures (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS signature_buckets "
+                           "(bucket TEXT NOT NULL, id TEXT NOT NULL, PRIMARY KEY (bucket, id))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS signature_buckets_id ON signature_buckets (id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS version_outcomes "
+                           "(key TEXT NOT NULL, version TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (key, version))")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        if json_path:
+            self.sync_json(json_path)
+
+    @contextmanager
+    def _transaction(self):
+        """ Runs a block of statements as one immediate (write-locked) transaction. """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn.cursor()
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def get(self, id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM records WHERE id = ?", (id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def upsert(self, record: dict) -> None:
+        """ Inserts the record, or replaces the stored record with the same id. """
+        with self._transaction() as cur:
+            self._upsert(cur, record)
+
+    def delete(self, id: str) -> bool:
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM signature_buckets WHERE id = ?", (id,))
+            cur.execute("DELETE FROM signatures WHERE id = ?", (id,))
+            return cur.execute("DELETE FROM records WHERE id = ?", (id,)).rowcount > 0
+
+    def all(self) -> list[dict]:
+        """ Returns every record, in the order they were first added. """
+        with self._lock:
+            rows = self._conn.execute("SELECT data FROM records ORDER BY seq").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_session(self, id: str, name: str) -> dict | None:
+        """ Returns the saved state of the named conversation session of an incompatibility, if any. """
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE id = ? AND name = ?", (id, name)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_session(self, id: str, name: str, data: dict) -> None:
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO sessions (id, name, data) VALUES (?, ?, ?)",
+                        (id, name, json.dumps(data)))
+
+    def delete_session(self, id: str, name: str) -> bool:
+        with self._transaction() as cur:
+            return cur.execute("DELETE FROM sessions WHERE id = ? AND name = ?", (id, name)).rowcount > 0
+
+    def get_checkpoints(self, id: str) -> dict[str, dict]:
+        """ Returns the checkpoint of every completed pipeline stage of an incompatibility, keyed by stage. """
+        with self._lock:
+            rows = self._conn.execute("SELECT stage, data FROM checkpoints WHERE id = ?", (id,)).fetchall()
+        return {stage: json.loads(data) for stage, data in rows}
+
+    def put_checkpoint(self, id: str, stage: str, data: dict) -> None:
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO checkpoints (id, stage, data) VALUES (?, ?, ?)",
+                        (id, stage, json.dumps(data)))
+
+    def clear_checkpoints(self, id: str, stages: list[str] | None = None) -> None:
+        """ Removes the checkpoints of the given stages of an incompatibility, or of every stage. """
+        with self._transaction() as cur:
+            if stages is None:
+                cur.execute("DELETE FROM checkpoints WHERE id = ?", (id,))
+            else:
+                cur.executemany("DELETE FROM checkpoints WHERE id = ? AND stage = ?", [(id, s) for s in stages])
+
+    def put_signature(self, id: str, data: dict, buckets: list[str]) -> None:
+        """ Stores the failure signature of an incompatibility under its locality-sensitive hash buckets. """
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO signatures (id, data) VALUES (?, ?)", (id, json.dumps(data)))
+            cur.execute("DELETE FROM signature_buckets WHERE id = ?", (id,))
+            cur.executemany("INSERT OR IGNORE INTO signature_buckets (bucket, id) VALUES (?, ?)",
+                            [(bucket, id) for bucket in buckets])
+
+    def delete_signature(self, id: str) -> bool:
+        with self._transaction() as cur:
+            cur.execute("DELETE FROM signature_buckets WHERE id = ?", (id,))
+            return cur.execute("DELETE FROM signatures WHERE id = ?", (id,)).rowcount > 0
+
+    def find_signatures(self, buckets: list[str]) -> dict[str, dict]:
+        """ Returns the signatures sharing at least one bucket with `buckets`, keyed by incompatibility id. """
+        if not buckets:
+            return {}
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM signatures WHERE id IN (SELECT id FROM signature_buckets "
+                                      f"WHERE bucket IN ({', '.join('?' * len(buckets))}))", buckets).fetchall()
+        return {id: json.loads(data) for id, data in rows}
+
+    def count_signatures(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def get_version_outcomes(self, key: str) -> dict[str, dict]:
+        """ Returns the recorded test outcomes of every library version tried for a bisection key, keyed by version. """
+        with self._lock:
+            rows = self._conn.execute("SELECT version, data FROM version_outcomes WHERE key = ?", (key,)).fetchall()
+        return {version: json.loads(data) for version, data in rows}
+
+    def put_version_outcome(self, key: str, version: str, data: dict) -> None:
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO version_outcomes (key, version, data) VALUES (?, ?, ?)",
+                        (key, version, json.dumps(data)))
+
+    def get_meta(self, key: str) -> str | None:
+        """ Returns a value the store keeps about itself, such as a migration marker. """
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put_meta(self, key: str, value: str) -> None:
+        with self._transaction() as cur:
+            cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def import_json(self, json_path: str) -> int:
+        """
+        Upserts every record of a knowledge.json-format file.
+
+        Returns:
+            int: The number of records imported.
+        """
+        with self._transaction() as cur:
+            return self._import(cur, json_path)
+
+    def sync_json(self, json_path: str) -> int:
+        """
+        Imports a knowledge.json-format file if the store is empty or the file changed since it was last exported or
+        imported, e.g. because it was edited by hand. Records of the file replace the stored records with the same id.
+
+        Returns:
+            int: The number of records imported, 0 if the file is unchanged.
+        """
+        if not os.path.exists(json_path):
+            return 0
+        mtime = os.stat(json_path).st_mtime_ns
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+        if row is not None and int(row[0]) >= mtime:
+            return 0
+        with self._transaction() as cur:
+            row = cur.execute("SELECT value FROM meta WHERE key = 'json_mtime'").fetchone()
+            empty = cur.execute("SELECT COUNT(*) FROM records").fetchone()[0] == 0
+            # A store created before the JSON's mtime was recorded may hold records newer than the file.
+            if not empty and (row is None or int(row[0]) >= mtime):
+                if row is None:
+                    self._set_json_mtime(cur, mtime)
+                return 0
+            imported = self._import(cur, json_path)
+            self._set_json_mtime(cur, mtime)
+            return imported
+
+    def export_json(self, json_path: str) -> None:
+        """
+        Writes every record to a knowledge.json-format file.
+
+        The file is written to a temporary file in the same directory and then renamed over the target, so readers
+        never see a partially written file. The file's modification time is recorded, so only later edits of the file
+        are imported back by `sync_json`.
+        """
+        records = self.all()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(json_path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fw:
+                json.dump(records, fw, indent=2)
+            os.replace(tmp_path, json_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._transaction() as cur:
+            self._set_json_mtime(cur, os.stat(json_path).st_mtime_ns)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _import(self, cur: sqlite3.Cursor, json_path: str) -> int:
+        with open(json_path, 'r') as file:
+            records = json.load(file)
+        for record in records:
+            self._upsert(cur, record)
+        return len(records)
+
+    @staticmethod
+    def _set_json_mtime(cur: sqlite3.Cursor, mtime: int) -> None:
+        cur.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_mtime', ?)", (str(mtime),))
+
+    @staticmethod
+    def _upsert(cur: sqlite3.Cursor, record: dict) -> None:
+        cur.execute("INSERT INTO records (id, seq, data) "
+                    "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM records), ?) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                    (record['id'], json.dumps(record)))
+
@@ -0,0 +1,223 @@
+""" Streaming Maven Test Log Analyzer """
+
+import os
+import re
+import signal
+import subprocess
+from dataclasses import dataclass, field
+
+FAILURE_MARKERS = ("<<< ERROR!", "<<< FAILURE!")
+BUILD_SUCCESS = "BUILD SUCCESS"
+BUILD_FAILURE = "BUILD FAILURE"
+STOPPED_EARLY = "[INFO] BUILD FAILURE (stopped early after the failure of {test})\n"
+
+# Upper bounds on what is kept from the log, so memory stays flat however large the log grows.
+MAX_FAILURE_BLOCKS = 256
+MAX_EXCEPTION_LINES = 64
+MAX_BLOCK_FRAMES = 64
+
+
+@dataclass
+class FailureBlock:
+    """ A single `<<< ERROR!` / `<<< FAILURE!` block of a surefire report. """
+    header: str
+    line_no: int
+    trace_line_no: int = 0
+    end_line_no: int = 0
+    exception: str = ""
+    exception_info: str = ""
+    causes: list[str] = field(default_factory=list)
+    frames: list[str] = field(default_factory=list)
+
+
+@dataclass
+class TestLogReport:
+    """ Structured result of a single pass over a Maven test log. """
+    build_status: str | None = None
+    failures: list[FailureBlock] = field(default_factory=list)
+    failure_count: int = 0
+    error_location: str | None = None
+    lines: int = 0
+    bytes: int = 0
+    stopped_early: bool = False
+    exit_code: int | None = None
+    build_line_no: int = 0
+
+    @property
+    def success(self) -> bool:
+        return self.build_status != "FAILURE"
+
+    @property
+    def exception(self) -> tuple[str, str]:
+        """
+        Returns the exception class and message of the first failure block.
+
+        Raises:
+            ValueError: If the log does not contain an exception.
+        """
+        if not self.failures or not self.failures[0].exception:
+            raise ValueError("No exception found.")
+        return self.failures[0].exception, self.failures[0].exception_info
+
+
+class TestLogAnalyzer:
+    """
+    Incremental parser for Maven/surefire output.
+
+    Lines are fed one at a time with `feed`, either from a log file or directly from a running build, and the
+    analyzer keeps only the build status, the failure blocks and the first stack frame belonging to `test_name`.
+    `target_failure` is set as soon as the failure block of `test_name` and its stack frames are complete.
+    """
+
+    def __init__(self, test_name: str | None = None) -> None:
+        self.test_name = test_name
+        self.report = TestLogReport()
+        self.target_failure: FailureBlock | None = None
+        self._target_pattern = re.compile(r'\b' + re.escape(test_name) + r'\b') if test_name else None
+        self._block: FailureBlock | None = None
+        self._exception_lines: list[str] = []
+        self._in_frames = False
+
+    def feed(self, line: str) -> None:
+        report = self.report
+        report.lines += 1
+        report.bytes += len(line)
+        stripped = line.strip()
+
+        if BUILD_FAILURE in stripped:
+            report.build_status = "FAILURE"
+            report.build_line_no = report.lines
+        elif BUILD_SUCCESS in stripped and report.build_status is None:
+            report.build_status = "SUCCESS"
+            report.build_line_no = report.lines
+
+        is_frame = stripped.startswith("at ")
+        if is_frame and report.error_location is None and self.test_name and stripped.endswith(")"):
+            location = stripped[3:]
+            if '(' in location and self.test_name in location.split('(')[1]:
+                report.error_location = location
+
+        if stripped.endswith(FAILURE_MARKERS):
+            self._close_block(report.lines - 1)
+            report.failure_count += 1
+            if len(report.failures) < MAX_FAILURE_BLOCKS:
+                self._block = FailureBlock(header=stripped, line_no=report.lines)
+            return
+
+        block = self._block
+        if block is None:
+            return
+        if is_frame:
+            if not self._in_frames:
+                self._set_exception()
+                self._in_frames = True
+                block.trace_line_no = report.lines
+            if len(block.frames) < MAX_BLOCK_FRAMES:
+                block.frames.append(stripped[3:])
+        elif not self._in_frames:
+            if len(self._exception_lines) < MAX_EXCEPTION_LINES:
+                self._exception_lines.append(line)
+        elif stripped.startswith("Caused by:"):
+            block.causes.append(stripped[len("Caused by:"):].strip())
+        elif not stripped.startswith("..."):
+            self._close_block(report.lines - 1)
+
+    def close(self) -> TestLogReport:
+        self._close_block(self.report.lines)
+        return self.report
+
+    def _set_exception(self) -> None:
+        exception = "".join(self._exception_lines)
+        self._exception_lines = []
+        if exception:
+            name, _, info = exception.partition(":")
+            self._block.exception, self._block.exception_info = name.strip(), info.strip()
+
+    def _close_block(self, end_line_no: int) -> None:
+        """ Ends the open failure block, whose last line is `end_line_no`. """
+        if self._block is None:
+            return
+        if not self._in_frames:
+            self._set_exception()
+        self._block.end_line_no = end_line_no
+        self.report.failures.append(self._block)
+        if self.target_failure is None and self._target_pattern and self._target_pattern.search(self._block.header):
+            self.target_failure = self._block
+        self._block = None
+        self._exception_lines = []
+        self._in_frames = False
+
+
+def analyze_test_log(test_log_path: str, test_name: str | None = None) -> TestLogReport:
+    """
+    Reads a Maven test log in a single streaming pass and returns a structured report.
+
+    The report holds the build status, every `<<< ERROR!`/`<<< FAILURE!` block with its exception and stack frames,
+    and the first stack frame whose source file contains `test_name`. The log is never held in memory as a whole.
+
+    Args:
+        test_log_path (str): Path to the test log.
+        test_name (str | None): Test class name used to locate the error in the client's code.
+
+    Returns:
+        TestLogReport: The analysis of the log.
+    """
+    analyzer = TestLogAnalyzer(test_name)
+    with open(test_log_path, 'r', encoding='utf-8', errors='replace') as fr:
+        for line in fr:
+            analyzer.feed(line)
+    return analyzer.close()
+
+
+def run_test_build(cmd: str, cwd: str, test_log_path: str, test_name: str | None = None,
+                   stop_early: bool = False) -> TestLogReport:
+    """
+    Runs a Maven build, writing its output to a test log while analyzing it line by line as it is produced.
+
+    With `stop_early`, the build is terminated as soon as the failure block of `test_name` and its stack frames have
+    been read, instead of waiting for the rest of the reactor. A BUILD FAILURE line noting the early stop is then
+    appended to the log, so the log reads as a failed build when it is analyzed again later.
+
+    Args:
+        cmd (str): The Maven command, run through the shell.
+        cwd (str): Directory to run the build in.
+        test_log_path (str): Path of the test log to write.
+        test_name (str | None): Test class name used to locate the error and, with `stop_early`, to stop the build.
+        stop_early (bool): Terminate the build once the failure of `test_name` has been captured.
+
+    Returns:
+        TestLogReport: The analysis of the build output.
+    """
+    analyzer = TestLogAnalyzer(test_name)
+    with open(test_log_path, 'w') as log:
+        process = subprocess.Popen(cmd, shell=True, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, encoding='utf-8', errors='replace', start_new_session=os.name == 'posix')
+        try:
+            for line in process.stdout:
+                log.write(line)
+                analyzer.feed(line)
+                if stop_early and analyzer.target_failure is not None:
+                    _terminate(process)
+                    line = STOPPED_EARLY.format(test=test_name)
+                    log.write(line)
+                    analyzer.feed(line)
+                    analyzer.report.stopped_early = True
+                    break
+        finally:
+            process.stdout.close()
+            analyzer.report.exit_code = process.wait()
+    return analyzer.close()
+
+
+def _terminate(process: subprocess.Popen) -> None:
+    """ Stops the build together with the JVMs the shell started. """
+    if process.poll() is not None:
+        return
+    if os.name == 'posix':
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    else:
+        subprocess.run(f"taskkill /F /T /PID {process.pid}", shell=True, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
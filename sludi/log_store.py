@@ -0,0 +1,309 @@
+""" Compressed, Offset-Indexed Test Log History """
+
+import argparse
+import bisect
+import gzip
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from array import array
+
+from log_analyzer import FailureBlock, TestLogAnalyzer, TestLogReport
+
+TEST_LOG_DIR = os.path.dirname(os.path.realpath(__file__)) + '/knowledge/_test_logs'
+CHUNK_SIZE = 64 * 1024
+# Lines between two of the line offsets kept while a log is archived; the offsets in between are re-read on demand.
+LINE_OFFSET_STEP = 256
+MAX_RUNS_PER_ID = 20
+MAX_BYTES_PER_ID = 32 * 1024 * 1024
+INDEX_VERSION = 1
+
+
+class GzipCodec:
+    name, suffix = "gzip", ".log.gz"
+
+    def compress(self, data: bytes) -> bytes:
+        return gzip.compress(data, mtime=0)
+
+    def decompress(self, data: bytes) -> bytes:
+        return gzip.decompress(data)
+
+
+class ZstdCodec:
+    """ Zstandard frames, when the optional `zstandard` package is installed. """
+    name, suffix = "zstd", ".log.zst"
+
+    def __init__(self) -> None:
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=6)
+        self._decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return self._decompressor.decompress(data)
+
+
+def get_codec(name: str | None = None):
+    """
+    Returns the codec called `name`, falling back to gzip when zstd is asked for but not installed. Without a name,
+    zstd is used when it is installed.
+    """
+    if name in ("zstd", None):
+        try:
+            return ZstdCodec()
+        except ImportError:
+            pass
+    return GzipCodec()
+
+
+def get_runs_dir(id: str, log_dir: str = TEST_LOG_DIR) -> str:
+    return f"{log_dir}/{id}/runs"
+
+
+class LogRun:
+    """
+    One archived log: independently compressed chunks of about `CHUNK_SIZE` bytes plus a JSON sidecar index.
+
+    The index holds the offsets of every chunk, of the BUILD result line and of every failure block and its stack
+    trace, together with the analysis of the log. The report is rebuilt from the index alone, and any section of the
+    log is read by decompressing only the chunks that cover it.
+    """
+
+    def __init__(self, index_file: str) -> None:
+        self.index_file = index_file
+        with open(index_file, 'r') as file:
+            self.index = json.load(file)
+        self.log_file = os.path.join(os.path.dirname(index_file), self.index['log_file'])
+        self.codec = get_codec(self.index['codec'])
+        self._chunk_starts = [chunk[0] for chunk in self.index['chunks']]
+
+    @property
+    def name(self) -> str:
+        return os.path.basename(self.index_file)[:-len('.idx.json')]
+
+    def report(self) -> TestLogReport:
+        """ Returns the analysis of the log, read from the index without decompressing anything. """
+        index = self.index
+        failures = [FailureBlock(f['header'], f['line_no'], f['trace_line_no'], f['end_line_no'], f['exception'],
+                                 f['exception_info'], f['causes'], f['frames']) for f in index['failures']]
+        return TestLogReport(index['build']['status'], failures, index['failure_count'], index['error_location'],
+                             index['lines'], index['size'], build_line_no=index['build']['line_no'])
+
+    def analyze(self, test_name: str | None = None) -> TestLogReport:
+        """ Analyzes the log again, e.g. for another test name, decompressing one chunk at a time. """
+        analyzer = TestLogAnalyzer(test_name)
+        with open(self.log_file, 'rb') as fr:
+            # Chunks end at line ends, so every chunk holds whole lines.
+            for _, compressed_offset, length in self.index['chunks']:
+                fr.seek(compressed_offset)
+                for line in io.StringIO(self.codec.decompress(fr.read(length)).decode('utf-8', errors='replace')):
+                    analyzer.feed(line)
+        return analyzer.close()
+
+    def read(self, start: int, end: int) -> str:
+        """ Returns the text between two byte offsets of the uncompressed log. """
+        chunks = self.index['chunks']
+        if start >= end or not chunks:
+            return ""
+        first = max(0, bisect.bisect_right(self._chunk_starts, start) - 1)
+        last = max(first, bisect.bisect_left(self._chunk_starts, end) - 1)
+        data = bytearray()
+        with open(self.log_file, 'rb') as fr:
+            fr.seek(chunks[first][1])
+            for offset, _, length in chunks[first:last + 1]:
+                data += self.codec.decompress(fr.read(length))
+        base = chunks[first][0]
+        return bytes(data[start - base:end - base]).decode('utf-8', errors='replace')
+
+    def failure_text(self, i: int = 0) -> str:
+        """ Returns the full text of the i-th failure block: header, exception message and stack trace. """
+        failure = self.index['failures'][i]
+        return self.read(failure['offset'], failure['end_offset'])
+
+    def stack_trace(self, i: int = 0) -> str:
+        failure = self.index['failures'][i]
+        return self.read(failure['trace_offset'], failure['end_offset']) if failure['trace_offset'] >= 0 else ""
+
+    def build_line(self) -> str:
+        build = self.index['build']
+        return self.read(build['offset'], build['end_offset']).strip() if build['offset'] >= 0 else ""
+
+    def text(self) -> str:
+        return self.read(0, self.index['size'])
+
+
+def archive_test_log(id: str, test_log_path: str, test_name: str | None = None, kind: str = "test",
+                     codec_name: str | None = None, log_dir: str = TEST_LOG_DIR) -> LogRun:
+    """
+    Compresses a test log into the run history of an incompatibility and indexes it in the same pass.
+
+    Args:
+        id (str): The incompatibility id.
+        test_log_path (str): The plain test log to archive.
+        test_name (str | None): Test class name used to locate the error location.
+        kind (str): What the log is of, e.g. "baseline" or "test".
+        codec_name (str | None): "gzip" or "zstd". Defaults to zstd if the zstandard package is installed, else gzip.
+        log_dir (str): Directory holding the logs of every id. Defaults to `TEST_LOG_DIR`.
+
+    Returns:
+        LogRun: The archived run.
+    """
+    codec = get_codec(codec_name)
+    runs_dir = get_runs_dir(id, log_dir)
+    os.makedirs(runs_dir, exist_ok=True)
+    created = time.time()
+    timestamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(created))
+    name = f"{timestamp}_{int(created * 1e6) % 1_000_000:06d}_{kind}"
+    analyzer = TestLogAnalyzer(test_name)
+    line_offsets = array('q')
+    chunks, buffer, offset, compressed_offset = [], bytearray(), 0, 0
+    fd, tmp_path = tempfile.mkstemp(dir=runs_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as fw, open(test_log_path, 'rb') as fr:
+        def flush() -> None:
+            nonlocal compressed_offset
+            data = codec.compress(bytes(buffer))
+            fw.write(data)
+            chunks.append([offset - len(buffer), compressed_offset, len(data)])
+            compressed_offset += len(data)
+            buffer.clear()
+
+        for line_no, line in enumerate(fr):
+            if line_no % LINE_OFFSET_STEP == 0:
+                line_offsets.append(offset)
+            analyzer.feed(line.decode('utf-8', errors='replace'))
+            buffer += line
+            offset += len(line)
+            if len(buffer) >= CHUNK_SIZE:
+                flush()
+        if buffer:
+            flush()
+    log_file = f"{runs_dir}/{name}{codec.suffix}"
+    os.replace(tmp_path, log_file)
+    report = analyzer.close()
+
+    def line_offset(line_no: int) -> int:
+        """ Offset of the start of a 1-based line, or of the end of the log for the line after the last. """
+        if line_no <= 0:
+            return -1
+        step, rest = divmod(line_no - 1, LINE_OFFSET_STEP)
+        if step >= len(line_offsets):
+            return offset
+        with open(test_log_path, 'rb') as fr:
+            fr.seek(line_offsets[step])
+            for _ in range(rest):
+                if not fr.readline():
+                    break
+            return fr.tell()
+
+    index = {'version': INDEX_VERSION, 'id': id, 'kind': kind, 'created': created, 'codec': codec.name,
+             'log_file': os.path.basename(log_file), 'test_name': test_name, 'size': offset, 'lines': report.lines,
+             'compressed_size': compressed_offset, 'chunks': chunks,
+             'build': {'status': report.build_status, 'line_no': report.build_line_no,
+                       'offset': line_offset(report.build_line_no),
+                       'end_offset': line_offset(report.build_line_no + 1) if report.build_line_no else -1},
+             'failure_count': report.failure_count, 'error_location': report.error_location,
+             'failures': [{'header': f.header, 'exception': f.exception, 'exception_info': f.exception_info,
+                           'causes': f.causes, 'frames': f.frames, 'line_no': f.line_no,
+                           'trace_line_no': f.trace_line_no, 'end_line_no': f.end_line_no,
+                           'offset': line_offset(f.line_no), 'trace_offset': line_offset(f.trace_line_no),
+                           'end_offset': line_offset(f.end_line_no + 1)} for f in report.failures]}
+    index_file = f"{runs_dir}/{name}.idx.json"
+    fd, tmp_path = tempfile.mkstemp(dir=runs_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as fw:
+        json.dump(index, fw)
+    os.replace(tmp_path, index_file)
+    prune_runs(id, log_dir=log_dir)
+    return LogRun(index_file)
+
+
+def list_runs(id: str, kind: str | None = None, log_dir: str = TEST_LOG_DIR) -> list[LogRun]:
+    """ Returns the archived runs of an incompatibility, oldest first, optionally only those of one kind. """
+    runs_dir = get_runs_dir(id, log_dir)
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = []
+    for file_name in sorted(os.listdir(runs_dir)):
+        if file_name.endswith('.idx.json'):
+            try:
+                run = LogRun(f"{runs_dir}/{file_name}")
+            except (json.JSONDecodeError, KeyError, OSError):
+                continue
+            if kind is None or run.index['kind'] == kind:
+                runs.append(run)
+    return sorted(runs, key=lambda run: run.index['created'])
+
+
+def latest_run(id: str, kind: str | None = None, log_dir: str = TEST_LOG_DIR) -> LogRun | None:
+    runs = list_runs(id, kind, log_dir)
+    return runs[-1] if runs else None
+
+
+def prune_runs(id: str, max_runs: int = MAX_RUNS_PER_ID, max_bytes: int = MAX_BYTES_PER_ID,
+               log_dir: str = TEST_LOG_DIR) -> int:
+    """
+    Removes the oldest runs of an incompatibility until at most `max_runs` runs using at most `max_bytes` of
+    compressed logs are left. The latest run is always kept.
+
+    Returns:
+        int: The number of runs removed.
+    """
+    runs = list_runs(id, log_dir=log_dir)
+    total = sum(run.index['compressed_size'] for run in runs)
+    removed = 0
+    while len(runs) > 1 and (len(runs) > max_runs or total > max_bytes):
+        run = runs.pop(0)
+        total -= run.index['compressed_size']
+        for path in (run.log_file, run.index_file):
+            if os.path.exists(path):
+                os.remove(path)
+        removed += 1
+    return removed
+
+
+def parseArgs(argv):
+    parser = argparse.ArgumentParser(description='Inspects the archived test logs of an incompatibility')
+    parser.add_argument('id', help='The Subject ID whose runs to inspect')
+    parser.add_argument('--run', help='Run to show, by name or position (default: the latest)', default='-1')
+    parser.add_argument('--failure', help='Print the i-th failure block of the run', type=int, required=False)
+    parser.add_argument('--trace', help='Print only the stack trace of the failure block', action='store_true')
+    parser.add_argument('--full', help='Print the whole log of the run', action='store_true')
+    return parser.parse_args(argv)
+
+
+def main():
+    opts = parseArgs(sys.argv[1:])
+    runs = list_runs(opts.id)
+    if not runs:
+        print(f"No archived runs for {opts.id}..")
+        exit(1)
+    if opts.failure is None and not opts.full:
+        for run in runs:
+            index = run.index
+            first = index['failures'][0] if index['failures'] else None
+            exception = f"{first['exception']}: {first['exception_info']}"[:100] if first else ""
+            print(f"{run.name:<40} {index['build']['status'] or '-':<8} {index['failure_count']:>3} failures  "
+                  f"{index['size']:>10} -> {index['compressed_size']:>8} bytes  {exception}")
+        exit(0)
+    run = next((r for r in runs if r.name == opts.run), None)
+    if run is None:
+        try:
+            run = runs[int(opts.run)]
+        except (ValueError, IndexError):
+            print(f"No run {opts.run} for {opts.id}..")
+            exit(1)
+    if opts.full:
+        sys.stdout.write(run.text())
+    elif opts.failure >= len(run.index['failures']):
+        print(f"Run {run.name} has {len(run.index['failures'])} failure blocks..")
+        exit(1)
+    else:
+        sys.stdout.write(run.stack_trace(opts.failure) if opts.trace else run.failure_text(opts.failure))
+    exit(0)
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,62 @@
 import argparse
+import cProfile
+import json
+import os
+import pstats
 import sys
+from datetime import datetime
 
-import incompatibilities
+import batch
+import bisection
+from build_cache import get_build_cache
+import pipeline
+from pipeline import STAGES, PipelineOptions
+from services.conversation import DEFAULT_TOKEN_BUDGET
+from services.response_cache import get_response_cache, set_replay_mode
+from tracing import TRACE_FILE, configure, export_prometheus, get_trace_file, trace_context
+from utils import RESULTS_DIR, export_knowledge_info
 
 
 def parseArgs(argv):
     parser = argparse.ArgumentParser()
     parser.add_argument('--id', help='The Subject ID for CompCheck to discover', required=False)
+    parser.add_argument('--ids', help='Comma-separated Subject IDs to run as a batch, e.g. i-1,i-2', required=False)
+    parser.add_argument('--all', help='Run every Subject ID in incompatibilities.json as a batch', action='store_true')
+    parser.add_argument('--workers', help='Number of parallel workers for batch runs and bisections', type=int, required=False)
+    parser.add_argument('--keep-checkouts', help='Keep the checkout of every batch job and bisected version', action='store_true')
+    parser.add_argument('--cache-stats', help='Print build and LLM response cache statistics', action='store_true')
+    parser.add_argument('--stop-early', help='Stop the test build as soon as the target test has failed',
+                        action='store_true')
+    parser.add_argument('--token-budget', help='Token budget of each LLM conversation session', type=int,
+                        default=DEFAULT_TOKEN_BUDGET)
+    parser.add_argument('--replay', help='Answer LLM queries only from the response cache', action='store_true')
+    parser.add_argument('--headless', help='Run without prompts, answering them with --diagnose and --prompt',
+                        action='store_true')
+    parser.add_argument('--diagnose', help='In headless mode, send the failing code to the AI for a diagnosis',
+                        action='store_true')
+    parser.add_argument('--prompt', help='In headless mode, a prompt to send to the AI after the diagnosis',
+                        required=False)
+    parser.add_argument('--restart', help='Discard the checkpoints of a previous run and start over',
+                        action='store_true')
+    parser.add_argument('--prescreen-only', help='Only predict linkage errors from the library jars, without building',
+                        action='store_true')
+    parser.add_argument('--skip-clean', help='Skip the batch jobs whose pre-screen found no API change of the library',
+                        action='store_true')
+    parser.add_argument('--bisect', help='Find the first version of the library after old that fails the test',
+                        action='store_true')
+    parser.add_argument('--include-prereleases', help='Also bisect alpha, beta, milestone, RC and snapshot versions',
+                        action='store_true')
+    parser.add_argument('--version-index', help='JSON file listing the versions of libraries, by groupId:artifactId',
+                        default=bisection.VERSION_INDEX_FILE)
+    parser.add_argument('--from-stage', help='Re-run the pipeline from this stage', choices=STAGES, required=False)
+    parser.add_argument('--trace-file', help='JSON-lines file the timing of every pipeline stage is appended to, '
+                        'rotated to <file>.1 above 32 MiB',
+                        default=TRACE_FILE)
+    parser.add_argument('--no-trace', help='Do not record pipeline stage timings', action='store_true')
+    parser.add_argument('--prometheus', help='Write per-stage totals of the trace file to this Prometheus textfile',
+                        required=False)
+    parser.add_argument('--profile', help='Profile the run with cProfile (the parent process only in batch runs) '
+                        'and write the stats to this file', nargs='?', const='', required=False)
     if len(argv) == 0:
         parser.print_help()
         exit(1)
@@ -14,9 +64,56 @@ def parseArgs(argv):
     return opts
 
 
+def dispatch(opts) -> None:
+    if opts.all or opts.ids:
+        ids = None if opts.all else [id.strip() for id in opts.ids.split(',') if id.strip()]
+        batch.run_batch(ids, opts.workers, opts.keep_checkouts, opts.stop_early, opts.prescreen_only,
+                        opts.skip_clean)
+    elif opts.id and opts.bisect:
+        with trace_context(opts.id):
+            bisection.run(opts.id, opts.workers, opts.keep_checkouts, opts.stop_early, opts.version_index,
+                          opts.include_prereleases)
+        export_knowledge_info()
+    elif opts.id:
+        options = PipelineOptions(headless=opts.headless, diagnose=opts.diagnose, prompt=opts.prompt,
+                                  stop_early=opts.stop_early, token_budget=opts.token_budget, restart=opts.restart,
+                                  from_stage=opts.from_stage, prescreen_only=opts.prescreen_only)
+        with trace_context(opts.id):
+            pipeline.run(opts.id, options)
+        export_knowledge_info()
+
+
+def profile(opts) -> None:
+    """ Runs the command under cProfile, saving the stats and printing the functions with the most cumulative time. """
+    profile_file = opts.profile or f"{RESULTS_DIR}/profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof"
+    os.makedirs(os.path.dirname(os.path.abspath(profile_file)), exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(dispatch, opts)
+    finally:
+        profiler.dump_stats(profile_file)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(25)
+        print(f"Profile written to {profile_file}")
+
+
+def execute(opts) -> None:
+    """ Runs a parsed command line; shared by main and the daemon. """
+    configure(None if opts.no_trace else opts.trace_file)
+    if opts.cache_stats:
+        print(json.dumps({'build': get_build_cache().stats(), 'llm': get_response_cache().stats()}, indent=2))
+    set_replay_mode(opts.replay)
+    if opts.profile is not None:
+        profile(opts)
+    else:
+        dispatch(opts)
+    trace_file = get_trace_file()
+    if opts.prometheus and trace_file and os.path.exists(trace_file):
+        export_prometheus(trace_file, opts.prometheus)
+
+
 def main():
     opts = parseArgs(sys.argv[1:])
-    incompatibilities.run(opts.id)
+    execute(opts)
     exit(0)
 
 if __name__ == "__main__":
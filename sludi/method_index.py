@@ -0,0 +1,237 @@
+""" Method-Span Interval Index for Java Sources """
+
+import bisect
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+METHOD_INDEX_DIR = os.path.dirname(os.path.realpath(__file__)) + '/knowledge/_method_index'
+MAX_CACHED_INDEXES = 256
+INDEX_VERSION = 2
+
+TYPE_KEYWORDS = {'class', 'interface', 'enum', 'record'}
+TYPE_NAME_TOKENS = re.compile(r'[A-Za-z_$][\w$]*|[.<>,?\[\]]')
+TOKEN_PATTERN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<literal>""".*?(?:"""|\Z)|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<token>[A-Za-z_$][\w$]*|\d[\w.]*|->|::|\.\.\.|.)
+''', re.S | re.X)
+
+_method_indexes = {}
+
+
+def tokenize(source: str, path: str = "") -> list[tuple[str, int]]:
+    """
+    Splits Java source into (value, line) tokens, dropping whitespace and comments.
+
+    javalang's tokenizer is used when it can read the file. Otherwise a small regex lexer takes over, which only needs
+    to get comments, literals, identifiers and separators right to recover the structure of the file.
+
+    Args:
+        source (str): The Java source code.
+        path (str): The file the source was read from, named when javalang cannot read it.
+    """
+    import javalang
+    try:
+        tokens = []
+        for token in javalang.tokenizer.tokenize(source):
+            position = token.position
+            tokens.append((token.value, position.line if hasattr(position, 'line') else position[0]))
+        return tokens
+    except javalang.tokenizer.LexerError as e:
+        print(f"javalang is unable to tokenize {path or 'the source'} ({e}), using the regex lexer instead..")
+    tokens, line = [], 1
+    for match in TOKEN_PATTERN.finditer(source):
+        value = match.group()
+        if match.lastgroup == 'literal' or match.lastgroup == 'token':
+            tokens.append((value, line))
+        line += value.count('\n')
+    return tokens
+
+
+def find_spans(tokens: list[tuple[str, int]]) -> list[tuple[int, int, str, str]]:
+    """
+    Finds the spans of every type, method, constructor, initializer and block lambda in a token stream.
+
+    Each '{' is classified by the tokens before it, and its matching '}' gives the exact end line, so multi-line
+    final statements, anonymous classes and nested lambdas are all handled.
+
+    Spans are collected as (start line, end line, kind, name, order closed) so that spans starting and ending on the
+    same lines sort outer first; the order is dropped from the result.
+
+    An enum body stays open as 'enum' on the stack until the ';' ending its constants, so that the body of a constant
+    (`A { void f() {...} }`) is classified as a class named after the constant. Enums are reported as classes.
+
+    Returns:
+        list[tuple[int, int, str, str]]: (start line, end line, kind, name) sorted by start line, outer spans first.
+    """
+    spans = []
+    stack = []  # (kind, name, start line) of every open brace
+    decl_start = 0
+    last_line = tokens[-1][1] if tokens else 1
+    for i, (value, line) in enumerate(tokens):
+        if value == '{':
+            in_type_body = not stack or stack[-1][0] in ('class', 'enum')
+            kind, name, start = _classify(tokens, i, decl_start, in_type_body, stack)
+            stack.append((kind, name, start))
+            if kind != 'array':
+                decl_start = i + 1
+        elif value == '}':
+            if stack:
+                kind, name, start = stack.pop()
+                if kind not in ('block', 'array'):
+                    spans.append((start, line, 'class' if kind == 'enum' else kind, name, len(spans)))
+                if kind == 'array':
+                    continue
+            decl_start = i + 1
+        elif value == ';':
+            if stack and stack[-1][0] == 'enum':
+                stack[-1] = ('class',) + stack[-1][1:]
+            decl_start = i + 1
+    while stack:
+        kind, name, start = stack.pop()
+        if kind not in ('block', 'array'):
+            spans.append((start, last_line, 'class' if kind == 'enum' else kind, name, len(spans)))
+    # Inner spans are closed, and so appended, before the spans enclosing them.
+    spans.sort(key=lambda span: (span[0], -span[1], -span[4]))
+    return [span[:4] for span in spans]
+
+
+def _classify(tokens: list[tuple[str, int]], i: int, decl_start: int, in_type_body: bool,
+              stack: list[tuple[str, str, int]]) -> tuple[str, str, int]:
+    """ Returns the kind, name and start line of the construct opened by the '{' at index `i`. """
+    previous = tokens[i - 1][0] if i > 0 else ''
+    if previous == '->':
+        return 'lambda', '', _lambda_start(tokens, i - 1)
+    header, depth = _top_level(tokens, decl_start, i)
+    values = [tokens[j][0] for j in header]
+    for j in header:
+        if tokens[j][0] in TYPE_KEYWORDS and (j == 0 or tokens[j - 1][0] != '.'):
+            name = tokens[j + 1][0] if j + 1 < i else ''
+            return 'enum' if tokens[j][0] == 'enum' else 'class', name, tokens[decl_start][1]
+    if stack and stack[-1][0] == 'enum' and depth == 0 and header:
+        # The body of an enum constant, `A {` or `A(args) {`.
+        constant = _matching_open(tokens, i - 1) - 1 if previous == ')' else i - 1
+        return 'class', tokens[constant][0], tokens[constant][1]
+    if in_type_body and '=' not in values:
+        if depth > 0:
+            return 'array', '', tokens[i][1]
+        if not header or previous in ('static', ';', '{', '}'):
+            return 'initializer', '', tokens[i - 1][1] if previous == 'static' else tokens[i][1]
+        open_paren = max((j for j in header if tokens[j][0] == '('), default=None)
+        if open_paren is not None and open_paren > decl_start:
+            name = tokens[open_paren - 1][0]
+            class_name = next((n for k, n, _ in reversed(stack) if k in ('class', 'enum')), '')
+            return 'constructor' if name == class_name else 'method', name, tokens[decl_start][1]
+        return 'block', '', tokens[i][1]
+    if previous == ')':
+        open_paren = _matching_open(tokens, i - 1)
+        j = open_paren - 1
+        while j >= 0 and TYPE_NAME_TOKENS.fullmatch(tokens[j][0]) and tokens[j][0] != 'new':
+            j -= 1
+        if j >= 0 and tokens[j][0] == 'new' and j < open_paren - 1:
+            return 'class', '', tokens[j][1]
+    return 'array' if in_type_body else 'block', '', tokens[i][1]
+
+
+def _top_level(tokens: list[tuple[str, int]], start: int, end: int) -> tuple[list[int], int]:
+    """
+    Returns the indexes of the tokens in [start, end) that are not inside parentheses, plus every outermost '(',
+    together with the parenthesis depth reached at `end`.
+    """
+    indexes, depth = [], 0
+    for j in range(start, end):
+        value = tokens[j][0]
+        if value == '(':
+            if depth == 0:
+                indexes.append(j)
+            depth += 1
+        elif value == ')':
+            depth -= 1
+        elif depth == 0:
+            indexes.append(j)
+    return indexes, depth
+
+
+def _matching_open(tokens: list[tuple[str, int]], close: int) -> int:
+    depth = 0
+    for j in range(close, -1, -1):
+        if tokens[j][0] == ')':
+            depth += 1
+        elif tokens[j][0] == '(':
+            depth -= 1
+            if depth == 0:
+                return j
+    return 0
+
+
+def _lambda_start(tokens: list[tuple[str, int]], arrow: int) -> int:
+    if arrow > 0 and tokens[arrow - 1][0] == ')':
+        return tokens[_matching_open(tokens, arrow - 1)][1]
+    return tokens[arrow - 1][1] if arrow > 0 else tokens[arrow][1]
+
+
+class MethodIndex:
+    """ Interval index over the spans of one Java file, queried by line number with a binary search. """
+
+    def __init__(self, spans: list[tuple[int, int, str, str]]) -> None:
+        self.spans = spans
+        self.starts = [span[0] for span in spans]
+
+    def find(self, line_no: int, kinds: tuple[str, ...] = ('method', 'constructor', 'initializer')) \
+            -> tuple[int, int, str, str] | None:
+        """ Returns the innermost span of one of `kinds` containing `line_no`, or None if there is none. """
+        for i in range(bisect.bisect_right(self.starts, line_no) - 1, -1, -1):
+            start, end, kind, name = self.spans[i]
+            if kind in kinds and end >= line_no:
+                return self.spans[i]
+        return None
+
+
+def get_method_index(source: str, index_dir: str = METHOD_INDEX_DIR, path: str = "") -> MethodIndex:
+    """
+    Returns the method index of a Java source, cached in memory and on disk by the hash of its content.
+
+    Args:
+        source (str): The Java source code.
+        index_dir (str): Directory of the on-disk cache. Defaults to `METHOD_INDEX_DIR`.
+        path (str): The file the source was read from, for messages.
+
+    Returns:
+        MethodIndex: The index of the source's spans.
+    """
+    digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    index = _method_indexes.get(digest)
+    if index is not None:
+        return index
+    index_file = f"{index_dir}/{digest[:2]}/{digest}.json"
+    try:
+        with open(index_file, 'r') as file:
+            data = json.load(file)
+        if data['version'] != INDEX_VERSION:
+            raise ValueError(data['version'])
+        spans = [tuple(span) for span in data['spans']]
+    except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError):
+        spans = find_spans(tokenize(source, path))
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_file), suffix='.tmp')
+        with os.fdopen(fd, 'w') as fw:
+            json.dump({'version': INDEX_VERSION, 'spans': spans}, fw)
+        os.replace(tmp_path, index_file)
+    if len(_method_indexes) >= MAX_CACHED_INDEXES:
+        _method_indexes.pop(next(iter(_method_indexes)))
+    index = _method_indexes[digest] = MethodIndex(spans)
+    return index
+
+
+def clear_method_indexes() -> None:
+    """ Drops the method indexes cached in memory; the on-disk cache is kept. """
+    _method_indexes.clear()
+
+
+def method_index_count() -> int:
+    """ Returns the number of method indexes cached in memory. """
+    return len(_method_indexes)
@@ -0,0 +1,299 @@
+""" Resumable Staged Pipeline for One Incompatibility """
+
+import subprocess
+import time
+from dataclasses import dataclass
+
+from utils import *
+import api_diff
+from failure_index import find_known_failure
+from file_index import invalidate_file_indexes
+from build_cache import get_build_cache
+from git_cache import git
+from incompatibilities import TEST_ENABLED, discover_client, extract_info, get_test_module, install_project, run_baseline, \
+    run_upgraded_test
+from services import anthropic_service
+from services import openai_service
+from services import response_cache
+from services.conversation import DEFAULT_TOKEN_BUDGET, ConversationSession
+from tracing import span
+
+STAGES = ("discover", "prescreen", "baseline", "bump", "test", "extract", "locate", "diagnose")
+MAX_FIX_CHARS = 20000
+
+
+@dataclass
+class PipelineOptions:
+    """
+    How a pipeline run behaves. In headless mode no question is asked: `diagnose` and `prompt` stand in for the
+    Y/N prompts and no editor is opened.
+    """
+    headless: bool = False
+    diagnose: bool = False
+    prompt: str | None = None
+    stop_early: bool = False
+    token_budget: int = DEFAULT_TOKEN_BUDGET
+    restart: bool = False
+    from_stage: str | None = None
+    prescreen_only: bool = False
+
+
+class Pipeline:
+    """
+    Runs the stages of an incompatibility in order, checkpointing each completed stage in the knowledge store.
+
+    A checkpoint holds the client info as it was when the stage completed, plus the stage's own results (the code
+    located, the diagnosis...). A re-run restores the checkpoints and resumes at the first incomplete stage, unless
+    the checkout has disappeared, in which case the run starts over. A stage that cannot complete (e.g. no exception
+    in the test log) stops the run without a checkpoint, so it is retried next time.
+    """
+
+    def __init__(self, client_info: dict, options: PipelineOptions, downloads_dir=DOWNLOADS_DIR) -> None:
+        self.client_info = client_info
+        self.options = options
+        self.downloads_dir = downloads_dir
+        self.id = client_info['id']
+        self.store = get_knowledge_store()
+        self.state: dict = {}
+        self.finished = False
+        if response_cache.replay_mode:
+            # Earlier turns would change the requests, and so their response cache keys, of a replayed run. The
+            # sessions are kept in memory only, leaving the saved ones as they were.
+            self.openai_session = ConversationSession(self.id, "openai", options.token_budget)
+            self.anthropic_session = ConversationSession(self.id, "anthropic", options.token_budget)
+        else:
+            self.openai_session = ConversationSession.load(self.store, self.id, "openai", options.token_budget)
+            self.anthropic_session = ConversationSession.load(self.store, self.id, "anthropic", options.token_budget)
+
+    def resume_stage(self) -> str | None:
+        """ Returns the first stage without a checkpoint, or None if every stage is complete. """
+        checkpoints = self.store.get_checkpoints(self.id)
+        if checkpoints and not os.path.isdir(f"{self.downloads_dir}/{self.client_info['client']}"):
+            print("Checkout of a previous run is missing, starting over...")
+            self.store.clear_checkpoints(self.id)
+            return STAGES[0]
+        return next((stage for stage in STAGES if stage not in checkpoints), None)
+
+    def run(self, start: str | None = None, until: str | None = None) -> bool:
+        """
+        Runs the pipeline from `start`, or from the first incomplete stage, restoring the checkpoints before it.
+
+        Args:
+            start (str | None): Stage to run from, discarding its checkpoint and those of the later stages.
+            until (str | None): Last stage to run, or None to run to the end.
+
+        Returns:
+            bool: True if every stage that was run completed.
+        """
+        if start is not None:
+            if start == "baseline" and "bump" in self.store.get_checkpoints(self.id):
+                # The baseline must run on the client as checked out, without the version bump.
+                self.reset_checkout()
+            self.store.clear_checkpoints(self.id, list(STAGES[STAGES.index(start):]))
+        checkpoints = self.store.get_checkpoints(self.id)
+        start = self.resume_stage()
+        for stage in STAGES:
+            checkpoint = checkpoints.get(stage)
+            if start is None or STAGES.index(stage) < STAGES.index(start):
+                if checkpoint:
+                    self.client_info.update(checkpoint['client_info'])
+                    self.state.update(checkpoint['state'])
+                    self.finished = self.finished or checkpoint.get('finished', False)
+                continue
+            if self.finished:
+                if stage == start:
+                    print(f"[{self.id}] The upgraded test already passed, nothing left to do.")
+                break
+            print(f"[{self.id}] Stage '{stage}'...")
+            invalidate_file_indexes()
+            with span("stage", stage=stage) as s:
+                result = getattr(self, stage)()
+                s.set(completed=result is not None)
+            if result is None:
+                return False
+            self.state.update(result)
+            self.store.put_checkpoint(self.id, stage, {'completed': time.time(), 'client_info': self.client_info,
+                                                        'state': result, 'finished': self.finished})
+            if stage == until:
+                break
+        if start is None:
+            print(f"[{self.id}] Every stage is complete, use --restart or --from-stage to run again.")
+        return True
+
+    def discover(self) -> dict:
+        discover_client(self.client_info, self.downloads_dir)
+        return {}
+
+    def prescreen(self) -> dict:
+        report = api_diff.prescreen(self.client_info, self.downloads_dir)
+        api_diff.print_report(report)
+        self.client_info['prescreen'] = report.summary()
+        return {}
+
+    def baseline(self) -> dict:
+        if not TEST_ENABLED:
+            return {}
+        print(f"Running Test for Maven Project '{self.client_info['client']}' with id: {self.id}...")
+        run_baseline(self.client_info, self.downloads_dir)
+        return {}
+
+    def bump(self) -> dict:
+        if not TEST_ENABLED:
+            return {}
+        ci = self.client_info
+        bumped_files = changeLibVersion(ci['client'], ci['lib'], ci['new'], self.downloads_dir)
+        # A commit of the bumped tree that leaves the checkout and the stash list alone, for record_fix to diff against.
+        snapshot = git("stash", "create", cwd=f"{self.downloads_dir}/{ci['client']}", check=False).stdout.strip()
+        return {'bumped_files': bumped_files, 'bump_snapshot': snapshot}
+
+    def install(self) -> None:
+        """
+        Re-installs the client modules changed since the last install: the bumped POMs before the first test, and a fix
+        made after a failed test before a re-test.
+        """
+        if TEST_ENABLED:
+            ci = self.client_info
+            client_dir = f"{self.downloads_dir}/{ci['client']}"
+            install_project(ci['sha'], client_dir, get_build_cache(), get_test_module(ci, client_dir))
+
+    def reset_checkout(self) -> None:
+        """ Discards every change to the tracked files of the checkout. """
+        git("checkout", "--", ".", cwd=f"{self.downloads_dir}/{self.client_info['client']}", check=False)
+
+    def test(self) -> dict:
+        if not TEST_ENABLED:
+            print(f"Testing is disabled, using the existing test log {TEST_LOG_DIR}/{self.id}/test.log...")
+            return {}
+        self.install()
+        success = run_upgraded_test(self.client_info, self.downloads_dir, self.options.stop_early)
+        if success:
+            print("Test successful!.")
+            self.finished = True
+            if self.state.get('diagnosis') or self.client_info.get('diagnosis'):
+                self.record_fix()
+        return {'test_success': success}
+
+    def record_fix(self) -> None:
+        """
+        Records the changes that made the test pass after a diagnosis, so similar failures can reuse them. The version
+        bump is not part of the fix.
+        """
+        client_dir = f"{self.downloads_dir}/{self.client_info['client']}"
+        result = git("diff", self.state['bump_snapshot'], cwd=client_dir, check=False) \
+            if self.state.get('bump_snapshot') else None
+        if result is None or result.returncode != 0:
+            # No snapshot of the bumped tree (or it was garbage collected): leave the bumped POMs out.
+            excluded = [f":(exclude){os.path.relpath(path, client_dir)}" for path in self.state.get('bumped_files', [])]
+            result = git("diff", "--", ".", *excluded, cwd=client_dir, check=False)
+        diff = result.stdout
+        if diff:
+            self.client_info['fix'] = diff[:MAX_FIX_CHARS]
+            self.client_info['diagnosis'] = self.state.get('diagnosis') or self.client_info['diagnosis']
+            write_knowledge_info(self.client_info)
+
+    def extract(self) -> dict | None:
+        try:
+            extract_info(self.client_info)
+        except Exception as e:
+            print(e)
+            return None
+        return {}
+
+    def locate(self) -> dict | None:
+        ci = self.client_info
+        code = get_code_from_source(ci, self.downloads_dir)
+        if not code:
+            print(f"Unable to automatically extract information, please refer to the test log "
+                  f"('python log_store.py {self.id} --full') for details.")
+            return None
+        file_path = search_for_file(ci["client"], ci["file_name"], self.downloads_dir, ci.get("package"))
+        return {'code': code, 'file_path': file_path}
+
+    def diagnose(self) -> dict:
+        ci = self.client_info
+        query = f"{ci['exception']}\n{ci['exception_info']}\n{self.state['code'].strip()}"
+        print(query)
+        result = {}
+        matches = find_known_failure(ci, self.store)
+        known = next((match for match in matches if match.diagnosis), None)
+        if matches:
+            print("\nSimilar known failures: " + ", ".join(f"{m.id} ({m.similarity:.2f})" for m in matches))
+        if known:
+            print(f"\nReusing the diagnosis of {known.id}:\n{known.diagnosis}")
+            if known.fix:
+                print(f"\nFix applied to {known.id}:\n{known.fix}")
+            result['diagnosis'], result['similar_to'] = known.diagnosis, known.id
+        question = "Send to AI anyway? (Y/N): " if known else "Send to AI to diagnose and resolve this issue? (Y/N): "
+        if self.ask(question, self.options.diagnose and not known):
+            result['diagnosis'] = openai_service.query(query, self.openai_session)
+            result.pop('similar_to', None)
+            print('\n' + result['diagnosis'])
+            if not self.options.headless:
+                if "pom.xml" in result['diagnosis']:
+                    open_pom_file(ci, self.downloads_dir)
+                elif self.state.get('file_path'):
+                    subprocess.Popen(["notepad.exe", self.state['file_path']])
+        prompt = self.options.prompt
+        if not self.options.headless and self.ask("Enter prompt manually? (Y/N): ", False):
+            prompt = input("Prompt: ")
+        if prompt:
+            result['prompt_response'] = anthropic_service.query(prompt, self.anthropic_session)
+            print('\n' + result['prompt_response'])
+        if result.get('diagnosis'):
+            ci['diagnosis'] = result['diagnosis']
+            if 'similar_to' in result:
+                ci['similar_to'] = result['similar_to']
+            write_knowledge_info(ci)
+        return result
+
+    def ask(self, question: str, headless_answer: bool) -> bool:
+        if self.options.headless:
+            return headless_answer
+        return input(question).strip() == "Y"
+
+
+def run(id: str, options: PipelineOptions) -> bool:
+    """
+    Runs the pipeline of one incompatibility, resuming from its checkpoints.
+
+    Interactively, the user is asked before the builds start, and once the diagnosis is done may re-run the upgraded
+    test (without reverting the checkout or bumping the version again, but re-installing the modules changed) after
+    fixing the client. With
+    `prescreen_only`, the client is checked out if needed and only the API pre-screen is run, without any build.
+
+    Returns:
+        bool: True if the pipeline completed.
+    """
+    client_info = get_knowledge_info(id, INCOMPATIBILITIES_JSON_FILE)
+    if not client_info:
+        print(f"Unable to find incompatibility id {id}..")
+        return False
+    pipeline = Pipeline(client_info, options)
+    if options.restart:
+        pipeline.store.clear_checkpoints(id)
+        pipeline.openai_session.clear()
+        pipeline.anthropic_session.clear()
+    start = options.from_stage
+    if options.prescreen_only:
+        if pipeline.resume_stage() == STAGES[0] and not pipeline.run(until=STAGES[0]):
+            return False
+        pipeline.prescreen()
+        write_knowledge_info(pipeline.client_info)
+        return True
+    if options.headless:
+        return pipeline.run(start)
+
+    if (start or pipeline.resume_stage()) == STAGES[0]:
+        if not pipeline.run(start, until=STAGES[0]):
+            return False
+        start = None
+    while True:
+        user_input = input("Type 'test' to run Maven test build or 'exit' to quit: ")
+        if user_input == "exit":
+            return pipeline.finished
+        elif user_input != "test":
+            print("Invalid input. Please type 'test' or 'exit'.")
+            continue
+        if not pipeline.run(start) or pipeline.finished:
+            return pipeline.finished
+        start = "test"
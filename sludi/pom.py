@@ -0,0 +1,361 @@
+""" Maven POM Model and Reactor Graph """
+
+import os
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+from build_cache import is_pruned_dir
+
+PROPERTY_REF = re.compile(r'\$\{([^}]+)\}')
+COMMENT = re.compile(r'<!--.*?-->', re.S)
+EXCLUSIONS_BLOCK = re.compile(r'<exclusions>.*?</exclusions>', re.S)
+# Comments are matched first so that blocks commented out as a whole are skipped.
+DEPENDENCY_BLOCK = re.compile(r'<!--.*?-->|<dependency>.*?</dependency>', re.S)
+PROPERTIES_BLOCK = re.compile(r'<!--.*?-->|<properties>.*?</properties>', re.S)
+VERSION_ELEMENT = re.compile(r'<version>\s*(.*?)\s*</version>', re.S)
+
+_reactor_graphs = {}
+_pom_indexes = {}
+
+
+@dataclass
+class Dependency:
+    group_id: str
+    artifact_id: str
+    version: str = ""
+    scope: str = ""
+    optional: bool = False
+
+    @property
+    def coordinates(self) -> str:
+        return f"{self.group_id}:{self.artifact_id}"
+
+
+@dataclass
+class PomModel:
+    """ The parts of a pom.xml that SLUDI needs, with groupId and version inherited from the parent. """
+    path: str
+    group_id: str = ""
+    artifact_id: str = ""
+    version: str = ""
+    packaging: str = "jar"
+    parent: Dependency | None = None
+    parent_path: str = ""
+    modules: list[str] = field(default_factory=list)
+    dependencies: list[Dependency] = field(default_factory=list)
+    managed_dependencies: list[Dependency] = field(default_factory=list)
+    all_dependencies: list[Dependency] = field(default_factory=list)
+    properties: dict[str, str] = field(default_factory=dict)
+    mtime: float = 0.0
+
+    @property
+    def coordinates(self) -> str:
+        return f"{self.group_id}:{self.artifact_id}"
+
+    def declarations(self, lib: str) -> list[Dependency]:
+        """ Returns every dependency on `lib` declared anywhere in the POM, including dependencyManagement,
+        profiles and plugin dependencies. """
+        return [d for d in self.all_dependencies if d.coordinates == lib]
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def _child(element: ET.Element | None, name: str) -> ET.Element | None:
+    if element is None:
+        return None
+    for child in element:
+        if isinstance(child.tag, str) and _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def _children(element: ET.Element | None, name: str) -> list[ET.Element]:
+    if element is None:
+        return []
+    return [child for child in element if isinstance(child.tag, str) and _local_name(child.tag) == name]
+
+
+def _text(element: ET.Element | None, name: str) -> str:
+    child = _child(element, name)
+    return (child.text or "").strip() if child is not None else ""
+
+
+def _parse_dependency(element: ET.Element) -> Dependency:
+    return Dependency(_text(element, 'groupId'), _text(element, 'artifactId'), _text(element, 'version'),
+                      _text(element, 'scope'), _text(element, 'optional') == 'true')
+
+
+def parse_pom(pom_file: str) -> PomModel:
+    """
+    Parses a pom.xml into a `PomModel`.
+
+    Args:
+        pom_file (str): Path to the pom.xml.
+
+    Returns:
+        PomModel: The parsed model.
+
+    Raises:
+        ET.ParseError: If the file is not well-formed XML.
+    """
+    root = ET.parse(pom_file).getroot()
+    model = PomModel(path=pom_file)
+    parent = _child(root, 'parent')
+    if parent is not None:
+        model.parent = _parse_dependency(parent)
+        relative_path = _text(parent, 'relativePath') or '../pom.xml'
+        parent_path = os.path.normpath(os.path.join(os.path.dirname(pom_file), relative_path))
+        if os.path.isdir(parent_path):
+            parent_path = os.path.join(parent_path, 'pom.xml')
+        model.parent_path = parent_path
+    model.group_id = _text(root, 'groupId') or (model.parent.group_id if model.parent else "")
+    model.artifact_id = _text(root, 'artifactId')
+    model.version = _text(root, 'version') or (model.parent.version if model.parent else "")
+    model.packaging = _text(root, 'packaging') or "jar"
+    model.modules = [(m.text or "").strip() for m in _children(_child(root, 'modules'), 'module')]
+    dependency_elements = _children(_child(root, 'dependencies'), 'dependency')
+    managed_elements = _children(_child(_child(root, 'dependencyManagement'), 'dependencies'), 'dependency')
+    other_elements = [d for d in root.iter() if isinstance(d.tag, str) and _local_name(d.tag) == 'dependency'
+                      and d not in dependency_elements and d not in managed_elements]
+    model.dependencies = [_parse_dependency(d) for d in dependency_elements]
+    model.managed_dependencies = [_parse_dependency(d) for d in managed_elements]
+    model.all_dependencies = model.dependencies + model.managed_dependencies + [_parse_dependency(d) for d in
+                                                                                other_elements]
+    for dependency in model.all_dependencies:
+        dependency.group_id = dependency.group_id.replace('${project.groupId}', model.group_id)
+    properties = _child(root, 'properties')
+    if properties is not None:
+        model.properties = {_local_name(p.tag): (p.text or "").strip() for p in properties if isinstance(p.tag, str)}
+    model.mtime = os.path.getmtime(pom_file)
+    return model
+
+
+def _blank(text: str, pattern: re.Pattern) -> str:
+    """ Replaces every match of `pattern` by as many spaces, so offsets into the text stay valid. """
+    return pattern.sub(lambda m: ' ' * len(m.group(0)), text)
+
+
+def _declares(block: str, lib: str) -> bool:
+    """ Whether a `<dependency>` block, with its comments and exclusions blanked out, is a dependency on `lib`. """
+    group_id, artifact_id = lib.split(':')[:2]
+    return bool(re.search(rf'<groupId>\s*{re.escape(group_id)}\s*</groupId>', block)
+                and re.search(rf'<artifactId>\s*{re.escape(artifact_id)}\s*</artifactId>', block))
+
+
+def rewrite_dependency_version(text: str, lib: str, version: str, replace_refs: bool = False) -> str:
+    """
+    Sets the version of every `<dependency>` block on `lib` in the text of a POM.
+
+    Only the block's own groupId, artifactId and version count: its `<exclusions>` and comments are ignored, and
+    blocks that are commented out are left alone. Versions given as a property reference (`${okhttp.version}`) are
+    left alone unless `replace_refs` is set, in which case they are replaced by the literal version.
+    """
+    def replace(match: re.Match) -> str:
+        block = match.group(0)
+        if block.startswith('<!--'):
+            return block
+        own = _blank(_blank(block, COMMENT), EXCLUSIONS_BLOCK)
+        current = VERSION_ELEMENT.search(own)
+        if current is None or not _declares(own, lib):
+            return block
+        if PROPERTY_REF.search(current.group(1)) and not replace_refs:
+            return block
+        return block[:current.start()] + f'<version>{version}</version>' + block[current.end():]
+    return DEPENDENCY_BLOCK.sub(replace, text)
+
+
+def rewrite_property(text: str, name: str, value: str) -> str:
+    """ Sets the value of property `name` in every `<properties>` block of the text of a POM, outside comments. """
+    element = re.compile(rf'<!--.*?-->|<{re.escape(name)}>.*?</{re.escape(name)}>', re.S)
+
+    def replace(match: re.Match) -> str:
+        return match.group(0) if match.group(0).startswith('<!--') else f'<{name}>{value}</{name}>'
+
+    def replace_block(match: re.Match) -> str:
+        block = match.group(0)
+        return block if block.startswith('<!--') else element.sub(replace, block)
+    return PROPERTIES_BLOCK.sub(replace_block, text)
+
+
+class PomIndex:
+    """
+    Every pom.xml of a checkout, parsed once and keyed by path.
+
+    The tree is walked once when the index is built (skipping build output and VCS directories). Afterwards
+    `refresh` only stats the known POMs and re-parses the ones whose modification time changed.
+    """
+
+    def __init__(self, client_dir: str) -> None:
+        self.client_dir = os.path.abspath(client_dir)
+        self.poms: dict[str, PomModel] = {}
+        for dir_path, subpaths, files in os.walk(self.client_dir):
+            subpaths[:] = [d for d in subpaths if not is_pruned_dir(d, 'pom.xml' in files)]
+            if 'pom.xml' in files:
+                self._parse(os.path.join(dir_path, 'pom.xml'))
+
+    def _parse(self, pom_file: str) -> None:
+        try:
+            self.poms[pom_file] = parse_pom(pom_file)
+        except (ET.ParseError, OSError) as e:
+            print(f"Unable to parse {pom_file}: {e}")
+            self.poms.pop(pom_file, None)
+
+    def refresh(self) -> None:
+        for pom_file, model in list(self.poms.items()):
+            try:
+                if os.path.getmtime(pom_file) != model.mtime:
+                    self._parse(pom_file)
+            except FileNotFoundError:
+                del self.poms[pom_file]
+
+    def get(self, pom_file: str) -> PomModel | None:
+        return self.poms.get(os.path.normpath(os.path.abspath(pom_file)))
+
+    def find_property(self, pom_file: str, name: str) -> str | None:
+        """ Returns the POM defining property `name` for `pom_file`, looking up its parent chain. """
+        model, seen = self.get(pom_file), set()
+        while model is not None and model.path not in seen:
+            if name in model.properties:
+                return model.path
+            seen.add(model.path)
+            model = self.get(model.parent_path) if model.parent_path else None
+        return None
+
+    def find_version_files(self, lib: str) -> dict[str, set[str]]:
+        """
+        Returns the POMs where the version of `lib` is set, mapped to the properties holding it.
+
+        A POM mapped to an empty set declares the version literally. A property reference that cannot be resolved
+        inside the checkout is mapped to the declaring POM under the name '' so the caller can inline the version.
+        """
+        files: dict[str, set[str]] = {}
+        for pom_file, model in sorted(self.poms.items()):
+            for dependency in model.declarations(lib):
+                reference = PROPERTY_REF.fullmatch(dependency.version)
+                if not dependency.version:
+                    continue
+                if reference is None:
+                    files.setdefault(pom_file, set())
+                    continue
+                defining_file = self.find_property(pom_file, reference.group(1))
+                if defining_file:
+                    files.setdefault(defining_file, set()).add(reference.group(1))
+                else:
+                    files.setdefault(pom_file, set()).add('')
+        return files
+
+    def set_version(self, lib: str, version: str) -> list[str]:
+        """
+        Sets every version of `lib` in the checkout to `version`, following property indirection.
+
+        Only POMs whose content actually changes are written.
+
+        Returns:
+            list[str]: The POMs that were rewritten.
+        """
+        changed = []
+        for pom_file, properties in self.find_version_files(lib).items():
+            with open(pom_file, 'r', encoding='utf-8') as fr:
+                text = fr.read()
+            new_text = rewrite_dependency_version(text, lib, version, replace_refs='' in properties)
+            for name in properties - {''}:
+                new_text = rewrite_property(new_text, name, version)
+            if new_text != text:
+                with open(pom_file, 'w', encoding='utf-8') as fw:
+                    fw.write(new_text)
+                self._parse(pom_file)
+                changed.append(pom_file)
+        return changed
+
+
+def pom_index_count() -> int:
+    """ Returns the number of POM indexes cached in memory. """
+    return len(_pom_indexes)
+
+
+def get_pom_index(client_dir: str) -> PomIndex:
+    """ Returns the POM index of a checkout, walking the tree only once per process. """
+    key = os.path.abspath(client_dir)
+    index = _pom_indexes.get(key)
+    if index is None:
+        index = _pom_indexes[key] = PomIndex(client_dir)
+    else:
+        index.refresh()
+    return index
+
+
+class ReactorGraph:
+    """
+    Module dependency graph of a multi-module Maven project.
+
+    Modules are keyed by their directory relative to the project root ('' for the root). A module depends on another
+    reactor module when it declares it as a dependency or as its parent.
+    """
+
+    def __init__(self, client_dir: str) -> None:
+        self.client_dir = os.path.abspath(client_dir)
+        self.modules: dict[str, PomModel] = {}
+        self.order: list[str] = []
+        self._index = get_pom_index(client_dir)
+        self._load('')
+        by_coordinates = {model.coordinates: module for module, model in self.modules.items()}
+        by_path = {os.path.normpath(model.path): module for module, model in self.modules.items()}
+        self.upstream: dict[str, set[str]] = {}
+        for module, model in self.modules.items():
+            direct = {by_coordinates[d.coordinates] for d in model.dependencies if d.coordinates in by_coordinates}
+            if model.parent_path and os.path.normpath(model.parent_path) in by_path:
+                direct.add(by_path[os.path.normpath(model.parent_path)])
+            direct.discard(module)
+            self.upstream[module] = direct
+
+    def _load(self, module: str) -> None:
+        model = self._index.get(os.path.join(self.client_dir, module, 'pom.xml'))
+        if module in self.modules or model is None:
+            return
+        self.modules[module] = model
+        self.order.append(module)
+        for child in model.modules:
+            child_module = os.path.normpath(os.path.join(module, child)).replace(os.sep, '/')
+            self._load('' if child_module == '.' else child_module)
+
+    def required_modules(self, module: str) -> set[str]:
+        """ Returns `module` together with every reactor module it transitively depends on. """
+        required, pending = set(), [module]
+        while pending:
+            current = pending.pop()
+            if current not in required:
+                required.add(current)
+                pending.extend(self.upstream.get(current, ()))
+        return required
+
+    def find_test_module(self, test_class: str) -> str | None:
+        """
+        Returns the module whose `src/test` tree contains `<test_class>.java`, or None if no module does.
+
+        Modules are searched in reactor order; directories of nested modules are left to those modules.
+        """
+        file_name = test_class.split('.')[-1] + '.java'
+        for module in self.order:
+            test_dir = os.path.join(self.client_dir, module, 'src', 'test')
+            for dir_path, subpaths, files in os.walk(test_dir):
+                subpaths[:] = [d for d in subpaths if not is_pruned_dir(d, 'pom.xml' in files)]
+                if file_name in files:
+                    return module
+        return None
+
+
+def get_reactor_graph(client_dir: str) -> ReactorGraph:
+    """
+    Returns the reactor graph of a checkout, built from its POM index only once per process.
+
+    The graph is rebuilt when any POM of the reactor has been modified since it was built.
+    """
+    key = os.path.abspath(client_dir)
+    graph = _reactor_graphs.get(key)
+    index = get_pom_index(client_dir)
+    if graph is None or any(index.get(model.path) is not model for model in graph.modules.values()):
+        graph = _reactor_graphs[key] = ReactorGraph(client_dir)
+    return graph
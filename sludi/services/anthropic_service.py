@@ -1,11 +1,12 @@
 """ Anthropic API Commons """
 
 import os
-import json
-import httplib2 as http
 
 from dotenv import load_dotenv
 
+from services.conversation import ConversationSession
+from services.llm_client import ANTHROPIC, LLMClient
+
 load_dotenv()
 API_KEY = os.getenv('ANTHROPIC_API_KEY')
 MODEL = "claude-3-5-sonnet-20240620"
@@ -14,33 +15,30 @@ MODEL = "claude-3-5-sonnet-20240620"
 # SYSTEM prompt
 SYSTEM = "You are an automated repair tool for Maven projects. You will receive two inputs: the exception details and the relevant block of code. Respond in two sections: 1. Error Analysis: Provide a concise explanation (maximum 100 words) identifying the root cause of the error based on the given exception and code. 2. Code Correction: Present the corrected version of the code, clearly indicating new or modified lines. Ensure the explanation is precise and that the corrected code adheres to best practices."
 
-conversation_history = []
 url = "https://api.anthropic.com/v1/messages"
+client = LLMClient(ANTHROPIC, API_KEY, MODEL, url)
 
-def query(prompt: str) -> str:
+def query(prompt: str, session: ConversationSession | None = None) -> str:
     """
     Anthropic API for Claude AI
 
+    @param prompt: string
+    @param session: conversation the prompt continues, trimmed to its token budget; None for a single-turn query
+    """
+    if session is None:
+        return client.complete([{"role": "user", "content": prompt}], system=SYSTEM, max_tokens=800, temperature=0)
+    system, messages = session.request(prompt, SYSTEM)
+    ai_response = client.complete(messages, system=system, max_tokens=800, temperature=0)
+    session.record(prompt, ai_response)
+    return ai_response
+
+
+async def aquery(prompt: str) -> str:
+    """
+    Asynchronous single-turn query to Claude AI, independent of the conversation history, so that many prompts can
+    be diagnosed concurrently.
+
     @param prompt: string
     """
-    conversation_history.append({"role": "user", "content": prompt})
-    headers = {
-        "x-api-key": API_KEY,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    
-    data = {
-        "model": MODEL,
-        "system": SYSTEM,
-        "messages": conversation_history,
-        "max_tokens": 800,
-        "temperature": 0,
-    }
-    h = http.Http()
-    response, content = h.request(url, "POST", json.dumps(data), headers)
-    content_text = content.decode("utf-8")
-    content_json = json.loads(content_text)
-    ai_response = content_json['content'][0]['text']
-    conversation_history.append({"role": "assistant", "content": ai_response})
-    return ai_response
\ No newline at end of file
+    return await client.acomplete([{"role": "user", "content": prompt}], system=SYSTEM, max_tokens=800,
+                                  temperature=0)
@@ -0,0 +1,106 @@
+""" Bounded Per-Incompatibility Conversation Sessions """
+
+DEFAULT_TOKEN_BUDGET = 3000
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_EXCERPT_CHARS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    """ Cheap local token estimate (about four characters per token), good enough to budget a request. """
+    return len(text) // 4 + 1
+
+
+class ConversationSession:
+    """
+    The conversation with one LLM provider about one incompatibility.
+
+    Every request is built from the system prompt, a summary of trimmed turns and the most recent turns, and is kept
+    within `token_budget` estimated tokens: the oldest turns are folded into the summary until the request fits, and
+    the summary itself is cut from the front if it outgrows a quarter of the budget. The session only changes once a
+    reply has arrived, so a failed request leaves it as it was. Sessions are saved to a knowledge store after every
+    turn, so a later run for the same incompatibility continues where the previous one stopped, unless the run is
+    restarted or replayed from the response cache, which start from an empty session.
+    """
+
+    def __init__(self, id: str, name: str, token_budget: int = DEFAULT_TOKEN_BUDGET, store=None) -> None:
+        """
+        Args:
+            id (str): The incompatibility id.
+            name (str): The session name, normally the provider it talks to.
+            token_budget (int): Maximum estimated tokens of a request, not counting the reply.
+            store (KnowledgeStore | None): Store the session is saved to, or None to keep it in memory only.
+        """
+        self.id = id
+        self.name = name
+        self.token_budget = token_budget
+        self.store = store
+        self.turns: list[dict] = []
+        self.summary: list[str] = []
+        self._pending: tuple[str, list[dict], list[str]] | None = None
+
+    @classmethod
+    def load(cls, store, id: str, name: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> 'ConversationSession':
+        """ Returns the session saved in `store`, or a new empty session if there is none. """
+        session = cls(id, name, token_budget, store)
+        data = store.get_session(id, name)
+        if data:
+            session.turns, session.summary = data['turns'], data['summary']
+        return session
+
+    def save(self) -> None:
+        if self.store is not None:
+            self.store.put_session(self.id, self.name, {'turns': self.turns, 'summary': self.summary})
+
+    def clear(self) -> None:
+        self.turns, self.summary, self._pending = [], [], None
+        self.save()
+
+    def system_prompt(self, system: str | None, summary: list[str] | None = None) -> str | None:
+        """ Returns the system prompt extended with the summary of trimmed turns. """
+        summary = self.summary if summary is None else summary
+        if not summary:
+            return system
+        text = "Summary of earlier turns in this session:\n" + "\n".join(summary)
+        return f"{system}\n\n{text}" if system else text
+
+    def request(self, prompt: str, system: str | None = None) -> tuple[str | None, list[dict]]:
+        """
+        Returns the system prompt and messages to send for a new prompt, trimming old turns to fit the budget.
+
+        The trimming is only applied to the session by `record`, once the reply has arrived.
+
+        Returns:
+            tuple[str | None, list[dict]]: The system prompt and the messages, ending with the new prompt.
+        """
+        message = {"role": "user", "content": prompt}
+        turns, summary = list(self.turns), list(self.summary)
+        while turns and self.estimate(system, turns + [message], summary) > self.token_budget:
+            self._trim_oldest_turn(turns, summary)
+        self._pending = (prompt, turns, summary)
+        return self.system_prompt(system, summary), turns + [message]
+
+    def record(self, prompt: str, reply: str) -> None:
+        """ Appends a completed turn, applying the trimming of the request it answers, and saves the session. """
+        if self._pending is not None and self._pending[0] == prompt:
+            _, self.turns, self.summary = self._pending
+        self._pending = None
+        self.turns = self.turns + [{"role": "user", "content": prompt}, {"role": "assistant", "content": reply}]
+        self.save()
+
+    def estimate(self, system: str | None, messages: list[dict], summary: list[str] | None = None) -> int:
+        """ Returns the estimated tokens of a request with the given system prompt and messages. """
+        tokens = estimate_tokens(self.system_prompt(system, summary) or "")
+        return tokens + sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+    def _trim_oldest_turn(self, turns: list[dict], summary: list[str]) -> None:
+        """ Replaces the oldest user/assistant turn of `turns` with a one-line summary appended to `summary`. """
+        prompt = turns.pop(0)["content"]
+        reply = turns.pop(0)["content"] if turns and turns[0]["role"] == "assistant" else ""
+        summary.append(f"- Asked: {_excerpt(prompt)} | Answered: {_excerpt(reply)}")
+        while len(summary) > 1 and estimate_tokens("\n".join(summary)) > self.token_budget // 4:
+            summary.pop(0)
+
+
+def _excerpt(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= SUMMARY_EXCERPT_CHARS else text[:SUMMARY_EXCERPT_CHARS - 3] + "..."
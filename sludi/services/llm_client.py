@@ -0,0 +1,347 @@
+""" Shared Pooled LLM Client """
+
+import asyncio
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from urllib.parse import urlsplit
+
+from services import response_cache
+from services.conversation import estimate_tokens
+from services.response_cache import ResponseCache, get_response_cache, request_key
+from tracing import span
+
+RETRY_STATUSES = {429, 500, 502, 503, 504, 529}
+MAX_RETRY_DELAY = 60
+
+
+class LLMError(RuntimeError):
+    def __init__(self, message: str, status: int | None = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class CacheMiss(LLMError):
+    """ Raised in replay mode when a request has no cached reply. """
+
+
+class Provider(ABC):
+    """ Request and response format of one LLM API. """
+    name = ""
+    url = ""
+
+    @abstractmethod
+    def headers(self, api_key: str) -> dict:
+        pass
+
+    @abstractmethod
+    def payload(self, model: str, system: str | None, messages: list[dict], max_tokens: int,
+                temperature: float | None, stream: bool) -> dict:
+        pass
+
+    @abstractmethod
+    def parse(self, content_json: dict) -> str:
+        pass
+
+    @abstractmethod
+    def parse_delta(self, event_json: dict) -> str:
+        pass
+
+    @abstractmethod
+    def parse_usage(self, content_json: dict) -> tuple[int, int] | None:
+        """ Returns the (input, output) token counts reported in a response, if any. """
+
+
+class OpenAIProvider(Provider):
+    name = "openai"
+    url = "https://api.openai.com/v1/chat/completions"
+
+    def headers(self, api_key: str) -> dict:
+        return {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+
+    def payload(self, model, system, messages, max_tokens, temperature, stream) -> dict:
+        if system and (not messages or messages[0]["role"] != "system"):
+            messages = [{"role": "system", "content": system}] + messages
+        data = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if temperature is not None:
+            data["temperature"] = temperature
+        if stream:
+            data["stream"] = True
+        return data
+
+    def parse(self, content_json: dict) -> str:
+        return content_json["choices"][0]["message"]["content"]
+
+    def parse_delta(self, event_json: dict) -> str:
+        choices = event_json.get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or ""
+
+    def parse_usage(self, content_json: dict) -> tuple[int, int] | None:
+        usage = content_json.get("usage")
+        return (usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)) if usage else None
+
+
+class AnthropicProvider(Provider):
+    name = "anthropic"
+    url = "https://api.anthropic.com/v1/messages"
+
+    def headers(self, api_key: str) -> dict:
+        return {"x-api-key": api_key, "anthropic-version": "2023-06-01", "content-type": "application/json"}
+
+    def payload(self, model, system, messages, max_tokens, temperature, stream) -> dict:
+        data = {"model": model, "messages": messages, "max_tokens": max_tokens}
+        if system:
+            data["system"] = system
+        if temperature is not None:
+            data["temperature"] = temperature
+        if stream:
+            data["stream"] = True
+        return data
+
+    def parse(self, content_json: dict) -> str:
+        return content_json["content"][0]["text"]
+
+    def parse_delta(self, event_json: dict) -> str:
+        if event_json.get("type") == "content_block_delta":
+            return event_json.get("delta", {}).get("text", "")
+        return ""
+
+    def parse_usage(self, content_json: dict) -> tuple[int, int] | None:
+        usage = content_json.get("usage")
+        return (usage.get("input_tokens", 0), usage.get("output_tokens", 0)) if usage else None
+
+
+OPENAI = OpenAIProvider()
+ANTHROPIC = AnthropicProvider()
+
+
+class ConnectionPool:
+    """ Keep-alive HTTP(S) connections to one host, reused across requests and threads. """
+
+    def __init__(self, url: str, max_size: int, timeout: float) -> None:
+        parts = urlsplit(url)
+        self.https = parts.scheme == "https"
+        self.host, self.port = parts.hostname, parts.port
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=max_size)
+
+    def acquire(self) -> http.client.HTTPConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def release(self, connection: http.client.HTTPConnection) -> None:
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+class TokenBucket:
+    """ Allows `rate` requests per second on average, with bursts of up to `capacity` requests. """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate, self.capacity = rate, capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """ Takes one token and returns how many seconds the caller must wait before using it. """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+
+class LLMClient:
+    """
+    Provider-agnostic LLM client shared by the service modules.
+
+    Connections are pooled and kept alive, requests are rate limited with a token bucket and retried with exponential
+    backoff (honouring Retry-After, up to `MAX_RETRY_DELAY` seconds) on 429/5xx responses and connection errors. A
+    reply that cannot be parsed fails at once and its connection is discarded. `complete` is synchronous;
+    `acomplete` and `acomplete_many` run requests from asyncio with at most `max_concurrency` in flight.
+
+    Replies are stored in a content-addressed response cache, so a repeated request is answered without calling the
+    API. In replay mode (`response_cache.set_replay_mode`) only cached replies are served.
+    """
+
+    def __init__(self, provider: Provider, api_key: str | None, model: str, url: str | None = None,
+                 max_concurrency: int = 4, requests_per_minute: float = 50, max_retries: int = 5,
+                 timeout: float = 120, backoff: float = 1.0, cache: ResponseCache | None = None) -> None:
+        self.provider = provider
+        self.cache = cache
+        self.api_key = api_key or ""
+        self.model = model
+        self.url = url or provider.url
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.path = urlsplit(self.url).path or "/"
+        self.pool = ConnectionPool(self.url, max_concurrency, timeout)
+        self.bucket = TokenBucket(requests_per_minute / 60, max(1.0, min(max_concurrency, requests_per_minute / 60)))
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        self._semaphores = {}
+
+    def complete(self, messages: list[dict], system: str | None = None, max_tokens: int = 800,
+                 temperature: float | None = None, stream: bool = False,
+                 on_delta: Callable[[str], None] | None = None) -> str:
+        """
+        Sends one request and returns the text of the model's reply.
+
+        Args:
+            messages (list[dict]): The conversation, as a list of {"role", "content"} messages.
+            system (str | None): The system prompt.
+            max_tokens (int): Maximum number of tokens in the reply.
+            temperature (float | None): Sampling temperature, or None for the provider's default.
+            stream (bool): Stream the reply, calling `on_delta` with every piece of text as it arrives.
+            on_delta (Callable[[str], None] | None): Callback for streamed text.
+
+        Returns:
+            str: The reply.
+
+        Raises:
+            LLMError: If the request fails after all retries.
+            CacheMiss: If replay mode is on and the request is not cached.
+        """
+        with span("llm", provider=self.provider.name, model=self.model, stream=stream) as s:
+            cache = self.cache or get_response_cache()
+            key = request_key(self.provider.name, self.model, system, messages, max_tokens, temperature)
+            cached = cache.get(key)
+            s.set(cached=cached is not None)
+            if cached is not None:
+                if stream and on_delta:
+                    on_delta(cached)
+                return cached
+            if response_cache.replay_mode:
+                raise CacheMiss(f"No cached {self.provider.name} reply for request {key[:12]} in replay mode")
+            text, usage = self._send(messages, system, max_tokens, temperature, stream, on_delta)
+            if usage is None:
+                prompt = (system or "") + "".join(m["content"] for m in messages)
+                usage = (estimate_tokens(prompt), estimate_tokens(text))
+            s.set(input_tokens=usage[0], output_tokens=usage[1])
+            cache.put(key, text, self.provider.name, self.model)
+            return text
+
+    def _send(self, messages: list[dict], system: str | None, max_tokens: int, temperature: float | None,
+              stream: bool, on_delta: Callable[[str], None] | None) -> tuple[str, tuple[int, int] | None]:
+        """
+        Sends a request, retrying on transient errors, and returns the reply and its reported token usage.
+
+        A stream that breaks after text was passed to `on_delta` is not retried, as the retry would pass it again.
+        """
+        body = json.dumps(self.provider.payload(self.model, system, messages, max_tokens, temperature, stream))
+        forwarded = False
+
+        def forward(delta: str) -> None:
+            nonlocal forwarded
+            forwarded = True
+            on_delta(delta)
+
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            connection = self.pool.acquire()
+            retry_after = None
+            try:
+                connection.request("POST", self.path, body, self.provider.headers(self.api_key))
+                response = connection.getresponse()
+                if response.status == 200:
+                    try:
+                        if stream:
+                            text, usage = self._read_stream(response, forward if on_delta else None), None
+                        else:
+                            content_json = json.load(response)
+                            text, usage = self.provider.parse(content_json), self.provider.parse_usage(content_json)
+                    except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                        connection.close()
+                        raise LLMError(f"{self.provider.name} returned a malformed response: {e!r}",
+                                       response.status) from e
+                    self.pool.release(connection)
+                    return text, usage
+                error = response.read().decode("utf-8", errors="replace")
+                self.pool.release(connection)
+                if response.status not in RETRY_STATUSES or attempt == self.max_retries:
+                    raise LLMError(f"{self.provider.name} request failed with {response.status}: {error}",
+                                   response.status)
+                retry_after = response.getheader("retry-after")
+            except (OSError, http.client.HTTPException) as e:
+                connection.close()
+                if forwarded:
+                    raise LLMError(f"{self.provider.name} stream broke after part of the reply was delivered: "
+                                   f"{e!r}") from e
+                if attempt == self.max_retries:
+                    raise LLMError(f"{self.provider.name} request failed: {e}") from e
+            time.sleep(self._delay(attempt, retry_after))
+        raise LLMError(f"{self.provider.name} request failed")
+
+    def _delay(self, attempt: int, retry_after: str | None) -> float:
+        """ Returns the seconds to wait before retrying: Retry-After if the server sent it, else a jittered backoff. """
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+        return min(delay, MAX_RETRY_DELAY) if delay > 0 else 0.0
+
+    def _read_stream(self, response: http.client.HTTPResponse, on_delta: Callable[[str], None] | None) -> str:
+        """ Reads a server-sent event stream, joining the text deltas of every event. """
+        parts = []
+        while True:
+            line = response.readline()
+            if not line:
+                if response.length:
+                    # http.client returns what arrived of a body cut short instead of raising.
+                    raise http.client.IncompleteRead(b"", response.length)
+                break
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            delta = self.provider.parse_delta(json.loads(data))
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        response.read()
+        return "".join(parts)
+
+    async def acomplete(self, messages: list[dict], **kwargs) -> str:
+        """ Asynchronous `complete`; at most `max_concurrency` requests run at once. """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, lambda: self.complete(messages, **kwargs))
+
+    async def acomplete_many(self, conversations: list[list[dict]], **kwargs) -> list[str | LLMError]:
+        """ Completes many conversations concurrently, returning each reply or the error it failed with. """
+        async def complete_one(messages: list[dict]) -> str | LLMError:
+            try:
+                return await self.acomplete(messages, **kwargs)
+            except LLMError as e:
+                return e
+        return await asyncio.gather(*(complete_one(messages) for messages in conversations))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.pool.close()
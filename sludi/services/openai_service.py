@@ -1,11 +1,12 @@
 """ OpenAI API Commons """
 
 import os
-import json
-import httplib2 as http
 
 from dotenv import load_dotenv
 
+from services.conversation import ConversationSession
+from services.llm_client import OPENAI, LLMClient
+
 load_dotenv()
 API_KEY = os.getenv('OPENAI_API_KEY')
 #MODEL = "gpt-4o-mini"
@@ -15,31 +16,30 @@ MODEL = "gpt-3.5-turbo"
 # 1. TASK + CONTEXT - You are an automated repair tool for Maven projects.
 # 2. Format - You will receive two inputs: the exception details and the relevant block of code. Respond in two sections: 1. Error Analysis: Provide a concise explanation (maximum 100 words) identifying the root cause of the error based on the given exception and code. 2. Code Correction: Present the corrected version of the code, with changes clearly indicated by bolding the new or modified lines. Ensure the explanation is precise and that the corrected code adheres to best practices.
 SYSTEM = "You are an automated repair tool for Maven projects. You will receive two inputs: the exception details and the relevant block of code. Respond in two sections: 1. Error Analysis: Provide a concise explanation (maximum 100 words) identifying the root cause of the error based on the given exception and code. 2. Code Correction: Present the corrected version of the code, clearly indicating new or modified lines. Ensure the explanation is precise and that the corrected code adheres to best practices."
-conversation_history = [{"role": "system", "content": SYSTEM}]
 
 url = "https://api.openai.com/v1/chat/completions"
+client = LLMClient(OPENAI, API_KEY, MODEL, url)
 
-def query(prompt: str) -> str:
+def query(prompt: str, session: ConversationSession | None = None) -> str:
     """
     OpenAI API for ChatGPT
 
+    @param prompt: string
+    @param session: conversation the prompt continues, trimmed to its token budget; None for a single-turn query
+    """
+    if session is None:
+        return client.complete([{"role": "user", "content": prompt}], system=SYSTEM, max_tokens=800)
+    system, messages = session.request(prompt, SYSTEM)
+    assistant_response = client.complete(messages, system=system, max_tokens=800)
+    session.record(prompt, assistant_response)
+    return assistant_response
+
+
+async def aquery(prompt: str) -> str:
+    """
+    Asynchronous single-turn query to ChatGPT, independent of the conversation history, so that many prompts can be
+    diagnosed concurrently.
+
     @param prompt: string
     """
-    conversation_history.append({"role": "user", "content": prompt})
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Content-Type": f"application/json"
-    }
-    
-    data = {
-        "model": MODEL,
-        "messages": conversation_history,
-        "max_tokens": 800
-    }
-    h = http.Http()
-    response, content = h.request(url, "POST", json.dumps(data), headers)
-    content_text = content.decode("utf-8")
-    content_json = json.loads(content_text)
-    assistant_response = content_json["choices"][0]["message"]["content"]
-    conversation_history.append({"role": "assistant", "content": assistant_response})
-    return assistant_response
\ No newline at end of file
+    return await client.acomplete([{"role": "user", "content": prompt}], system=SYSTEM, max_tokens=800)
@@ -0,0 +1,70 @@
+""" Content-Addressed LLM Response Cache """
+
+import hashlib
+import json
+import os
+import time
+
+from sqlite_cache import SqliteCache
+
+LLM_CACHE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/knowledge/_llm_cache'
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+replay_mode = False
+_response_caches = {}
+
+
+def set_replay_mode(enabled: bool) -> None:
+    """ In replay mode every LLM request must be answered from the cache; a miss raises instead of calling the API. """
+    global replay_mode
+    replay_mode = enabled
+
+
+def request_key(provider: str, model: str, system: str | None, messages: list[dict], max_tokens: int,
+                temperature: float | None) -> str:
+    """ Returns the content address of a request: a hash of everything that determines the model's reply. """
+    request = {"provider": provider, "model": model, "system": system, "messages": messages,
+               "max_tokens": max_tokens, "temperature": temperature}
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResponseCache(SqliteCache):
+    """
+    Persistent cache of LLM replies keyed by `request_key`.
+
+    Replies are stored in SQLite with their last use time, and the least recently used replies are evicted once their
+    total size exceeds `max_bytes`. Hit and miss counters are kept in the same database.
+    """
+    table = "responses"
+
+    def __init__(self, cache_dir: str = LLM_CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES) -> None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        super().__init__(f"{cache_dir}/responses.db", max_bytes)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, provider TEXT, model TEXT, "
+                           "response TEXT, size INTEGER, created REAL, last_used REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            self._count("hits" if row else "misses")
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, response: str, provider: str = "", model: str = "") -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (key, provider, model, response, len(response.encode('utf-8')), now, now))
+        self.evict()
+
+
+def get_response_cache(cache_dir: str = LLM_CACHE_DIR) -> ResponseCache:
+    """ Returns the response cache for `cache_dir`, opened once per process. """
+    key = (os.path.abspath(cache_dir), os.getpid())
+    if key not in _response_caches:
+        _response_caches[key] = ResponseCache(cache_dir)
+    return _response_caches[key]
@@ -0,0 +1,60 @@
+""" Size-Bounded SQLite Cache Index """
+
+import sqlite3
+import threading
+
+
+class SqliteCache:
+    """
+    Base of the caches that index their entries in SQLite with a size and a last use time.
+
+    A subclass creates its entry table, with at least `key`, `size` and `last_used` columns, and names it in `table`.
+    The least recently used entries are evicted once their total size exceeds `max_bytes`, and hit, miss and eviction
+    counters are kept in a `stats` table of the same database.
+    """
+    table = ""
+
+    def __init__(self, db_path: str, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def evict(self) -> int:
+        """
+        Removes least recently used entries until their total size fits in `max_bytes`.
+
+        Returns:
+            int: The number of entries removed.
+        """
+        removed = 0
+        with self._lock:
+            total = self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            for key, size in self._conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._evicted(key, size)
+                total -= size
+                removed += 1
+            self._count("evictions", removed)
+        return removed
+
+    def _evicted(self, key: str, size: int) -> None:
+        """ Called with the lock held for every evicted entry, to remove what the cache stores outside SQLite. """
+
+    def stats(self) -> dict:
+        """ Returns the hit, miss and eviction counters together with the current number of entries and bytes. """
+        with self._lock:
+            stats = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, size = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        return {'hits': hits, 'misses': misses, 'evictions': stats.get("evictions", 0), 'entries': entries,
+                'bytes': size, 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else 0.0}
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        self._conn.execute("INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                           (name, amount, amount))
@@ -0,0 +1,104 @@
+""" Shared Test Fixtures """
+
+import os
+import stat
+import subprocess as sub
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+ROOT_POM = """<project>
+  <groupId>a</groupId>
+  <artifactId>proj</artifactId>
+  <version>1.0</version>
+  <packaging>pom</packaging>
+  <modules>
+    <module>core</module>
+    <module>app</module>
+  </modules>
+</project>
+"""
+CORE_POM = """<project>
+  <parent><groupId>a</groupId><artifactId>proj</artifactId><version>1.0</version></parent>
+  <artifactId>core</artifactId>
+  <dependencies>
+    <dependency>
+      <groupId>x</groupId>
+      <artifactId>y</artifactId>
+      <version>1.0</version>
+    </dependency>
+  </dependencies>
+</project>
+"""
+APP_POM = """<project>
+  <parent><groupId>a</groupId><artifactId>proj</artifactId><version>1.0</version></parent>
+  <artifactId>app</artifactId>
+  <dependencies>
+    <dependency><groupId>a</groupId><artifactId>core</artifactId><version>1.0</version></dependency>
+  </dependencies>
+</project>
+"""
+
+
+@pytest.fixture(autouse=True)
+def no_trace(monkeypatch) -> None:
+    """ Keeps the stages run by the tests out of the trace file of real runs. """
+    monkeypatch.setenv('SLUDI_TRACE_FILE', '')
+
+
+def git(*args: str, cwd: str) -> str:
+    return sub.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=cwd, check=True,
+                   stdout=sub.PIPE, stderr=sub.PIPE, text=True).stdout.strip()
+
+
+def write_file(path: str, text: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as fw:
+        fw.write(text)
+
+
+@pytest.fixture
+def maven_repo(tmp_path) -> tuple[str, str]:
+    """ A git repository holding a two-module Maven project, `app` depending on `core`. Returns (url, sha). """
+    repo_dir = str(tmp_path / "proj")
+    write_file(f"{repo_dir}/pom.xml", ROOT_POM)
+    write_file(f"{repo_dir}/core/pom.xml", CORE_POM)
+    write_file(f"{repo_dir}/core/src/main/java/a/Core.java", "package a;\n\npublic class Core {\n}\n")
+    write_file(f"{repo_dir}/app/pom.xml", APP_POM)
+    write_file(f"{repo_dir}/app/src/test/java/a/AppTest.java", "package a;\n\npublic class AppTest {\n}\n")
+    git("init", "--quiet", cwd=repo_dir)
+    git("add", "-A", cwd=repo_dir)
+    git("commit", "--quiet", "-m", "init", cwd=repo_dir)
+    return f"file://{repo_dir}", git("rev-parse", "HEAD", cwd=repo_dir)
+
+
+@pytest.fixture
+def stub_mvn(tmp_path, monkeypatch) -> str:
+    """
+    Points SLUDI_MAVEN at a stub `mvn` that records its arguments in `mvn_calls` and fails while a `mvn_fail` file
+    exists, or reports a failure but exits 0 as `mvn -fn` does while a `mvn_fail_never` file exists, and
+    SLUDI_M2_REPOSITORY at an empty local repository `m2`. Returns the path of the calls file.
+    """
+    calls_file = str(tmp_path / "mvn_calls")
+    fail_file = str(tmp_path / "mvn_fail")
+    fail_never_file = str(tmp_path / "mvn_fail_never")
+    stub = tmp_path / "bin" / "mvn"
+    write_file(str(stub), f"""#!/bin/sh
+echo "$(pwd) $@" >> {calls_file}
+if [ -e {fail_file} ]; then echo "[INFO] BUILD FAILURE"; exit 1; fi
+if [ -e {fail_never_file} ]; then echo "[INFO] BUILD FAILURE"; echo "[INFO] Build failures were ignored."; exit 0; fi
+echo "[INFO] BUILD SUCCESS"
+""")
+    stub.chmod(stub.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv('SLUDI_MAVEN', str(stub))
+    monkeypatch.setenv('SLUDI_M2_REPOSITORY', str(tmp_path / "m2"))
+    return calls_file
+
+
+def read_calls(calls_file: str) -> list[str]:
+    if not os.path.exists(calls_file):
+        return []
+    with open(calls_file) as fr:
+        return fr.read().splitlines()
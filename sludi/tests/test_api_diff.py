@@ -0,0 +1,56 @@
+import os
+import zipfile
+
+import api_diff
+from api_diff import ClassSource, prescreen
+
+# Class files compiled by javac, taken from the py4j 0.10.9.9 jar (BSD license).
+PY4J_JAR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "py4j-0.10.9.9-classes.jar")
+
+
+def install_jar(repository: str, version: str, exclude: tuple[str, ...] = ()) -> None:
+    """ Installs the py4j classes, less `exclude`, into a local Maven repository as net.sf.py4j:py4j:<version>. """
+    base = f"{repository}/net/sf/py4j/py4j/{version}/py4j-{version}"
+    os.makedirs(os.path.dirname(base))
+    with open(f"{base}.pom", 'w') as fw:
+        fw.write(f"<project><groupId>net.sf.py4j</groupId><artifactId>py4j</artifactId><version>{version}</version>"
+                 "</project>")
+    with zipfile.ZipFile(PY4J_JAR) as source, zipfile.ZipFile(f"{base}.jar", 'w') as target:
+        for name in source.namelist():
+            if name[:-len('.class')] not in exclude:
+                target.writestr(name, source.read(name))
+
+
+def test_parses_class_files_compiled_by_javac():
+    source = ClassSource(PY4J_JAR)
+    assert sorted(source.entries) == ["py4j/Py4JException", "py4j/Py4JNetworkException",
+                                      "py4j/Py4JNetworkException$ErrorTime", "py4j/StringUtil"]
+    network = source.get("py4j/Py4JNetworkException")
+    assert network.super_name == "py4j/Py4JException"
+    assert network.methods[('getWhen', '()Lpy4j/Py4JNetworkException$ErrorTime;')] == api_diff.ACC_PUBLIC
+    assert ('method', 'py4j/Py4JException', '<init>', '(Ljava/lang/String;Ljava/lang/Throwable;)V') \
+        in network.references
+    error_time = source.get("py4j/Py4JNetworkException$ErrorTime")
+    assert error_time.super_name == "java/lang/Enum"
+    assert ('OTHER', 'Lpy4j/Py4JNetworkException$ErrorTime;') in error_time.fields
+    string_util = source.get("py4j/StringUtil")
+    assert string_util.methods[('escape', '(Ljava/lang/String;)Ljava/lang/String;')] & api_diff.ACC_STATIC
+
+
+def test_prescreen_predicts_the_removed_superclass(tmp_path):
+    repository = str(tmp_path / "m2")
+    install_jar(repository, "1.0")
+    install_jar(repository, "2.0", exclude=("py4j/Py4JException",))
+    report = prescreen({'lib': "net.sf.py4j:py4j", 'old': "1.0", 'new': "2.0", 'client': "c"}, None, repository)
+    assert report.verdict == "breaking"
+    assert [(c.kind, c.owner) for c in report.api_changes] == [("class_removed", "py4j/Py4JException")]
+    assert [b.consumer for b in report.broken_references] == ["py4j.Py4JNetworkException"]
+    assert report.exception == ("java.lang.NoClassDefFoundError", "py4j/Py4JException")
+
+
+def test_prescreen_of_identical_jars_is_clean(tmp_path):
+    repository = str(tmp_path / "m2")
+    install_jar(repository, "1.0")
+    install_jar(repository, "1.1")
+    report = prescreen({'lib': "net.sf.py4j:py4j", 'old': "1.0", 'new': "1.1", 'client': "c"}, None, repository)
+    assert report.verdict == "clean"
@@ -0,0 +1,59 @@
+import json
+
+import batch
+from api_diff import PrescreenReport
+
+
+def client_info(id: str, new: str) -> dict:
+    return {'id': id, 'client': "c", 'lib': "x:y", 'old': "1.0", 'new': new}
+
+
+def fake_prescreen(ci: dict) -> PrescreenReport:
+    if ci['new'] == "bad":
+        raise ValueError("Malformed class file")
+    report = PrescreenReport(ci['lib'], ci['old'], ci['new'])
+    if ci['new'] == "missing":
+        report.missing = ["x:y:missing"]
+    return report
+
+
+def test_failed_prescreen_is_unknown_and_does_not_stop_the_batch(monkeypatch):
+    monkeypatch.setattr(batch, 'prescreen', fake_prescreen)
+    clients_info = batch.prioritise([client_info("i-1", "2.0"), client_info("i-2", "bad"),
+                                     client_info("i-3", "missing")])
+    assert [(ci['id'], ci['prescreen']['verdict']) for ci in clients_info] == \
+        [("i-2", "unknown"), ("i-3", "unknown"), ("i-1", "clean")]
+    assert clients_info[0]['prescreen']['error'] == "Malformed class file"
+
+
+def test_skip_clean_runs_only_the_jobs_the_prescreen_flags(tmp_path, monkeypatch):
+    incompatibilities_file = tmp_path / "incompatibilities.json"
+    incompatibilities_file.write_text(json.dumps([client_info("i-1", "2.0"), client_info("i-2", "missing")]))
+    monkeypatch.setattr(batch, 'INCOMPATIBILITIES_JSON_FILE', str(incompatibilities_file))
+    monkeypatch.setattr(batch, 'prescreen', fake_prescreen)
+    monkeypatch.setattr(batch, 'write_knowledge_info', lambda record: None)
+    monkeypatch.setattr(batch, 'export_knowledge_info', lambda: None)
+    monkeypatch.setattr(batch, 'write_summary', lambda results: str(tmp_path / "summary.csv"))
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', lambda max_workers: RecordingExecutor())
+    results = batch.run_batch(None, workers=1, skip_clean=True)
+    assert sorted((r['id'], r['result']) for r in results) == [("i-1", "Skipped"), ("i-2", "Pass")]
+    assert RecordingExecutor.submitted == ["i-2"]
+
+
+class RecordingExecutor:
+    """ Runs nothing: records the jobs submitted and completes each as passed. """
+    submitted = []
+
+    def __enter__(self):
+        RecordingExecutor.submitted = []
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, fn, ci, *args):
+        from concurrent.futures import Future
+        RecordingExecutor.submitted.append(ci['id'])
+        future = Future()
+        future.set_result(dict(ci, result="Pass", duration=0))
+        return future
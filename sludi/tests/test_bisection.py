@@ -0,0 +1,58 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import bisection
+from knowledge_store import KnowledgeStore
+
+VERSIONS = ["1.0", "2.0", "3.0", "4.0", "5.0", "6.0", "7.0", "8.0", "9.0"]
+
+
+@pytest.fixture
+def bisect(tmp_path, monkeypatch):
+    """ Bisects x:y 1.0 -> 9.0 with the outcome of each version given by a function, returning (result, calls). """
+    index_file = tmp_path / "version_index.json"
+    index_file.write_text(json.dumps({"x:y": VERSIONS}))
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    calls = {'installs': 0, 'tested': [], 'records': []}
+
+    def install_client(client_info, keep_checkout):
+        calls['installs'] += 1
+        return client_info
+
+    monkeypatch.setattr(bisection, 'get_knowledge_store', lambda: store)
+    monkeypatch.setattr(bisection, 'write_knowledge_info', calls['records'].append)
+    monkeypatch.setattr(bisection, 'install_client', install_client)
+    monkeypatch.setattr(bisection, 'ProcessPoolExecutor', ThreadPoolExecutor)
+
+    def run(outcome_of):
+        def test_version(client_info, version, keep_checkout, stop_early):
+            calls['tested'].append(version)
+            return {'version': version, 'outcome': outcome_of(version)}
+
+        monkeypatch.setattr(bisection, 'test_version', test_version)
+        client_info = {'id': "i-1", 'url': "u", 'sha': "s", 'test': "T#t", 'test_cmd': "N/A", 'lib': "x:y",
+                       'old': "1.0", 'new': "9.0", 'client': "c", 'submodule': "N/A"}
+        return bisection.bisect(client_info, 2, repository=str(tmp_path / "m2"), index_file=str(index_file)), calls
+
+    return run
+
+
+def test_finds_the_first_failing_version_installing_once(bisect):
+    result, calls = bisect(lambda v: "fail" if bisection.version_key(v) >= bisection.version_key("5.0") else "pass")
+    assert (result.first_failing, result.last_passing, result.inconclusive) == ("5.0", "4.0", False)
+    assert calls['installs'] == 1
+    assert calls['records'][0]['first_failing_version'] == "5.0"
+
+
+def test_untestable_new_version_is_inconclusive(bisect):
+    result, calls = bisect(lambda v: "error" if v == "9.0" else "pass")
+    assert result.inconclusive
+    assert result.first_failing is None
+    assert calls['records'] == []
+
+
+def test_build_errors_are_skipped(bisect):
+    result, _ = bisect(lambda v: "error" if v == "5.0" else "fail" if v in ("6.0", "7.0", "8.0", "9.0") else "pass")
+    assert (result.first_failing, result.last_passing, result.skipped) == ("6.0", "4.0", ["5.0"])
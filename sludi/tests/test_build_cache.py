@@ -0,0 +1,140 @@
+import os
+
+from build_cache import BuildCache, get_changed_files, hash_key, tree_fingerprint
+from conftest import read_calls, write_file
+from git_cache import add_worktree
+from incompatibilities import install_project
+
+
+def checkout(maven_repo, tmp_path) -> tuple[str, str]:
+    url, sha = maven_repo
+    client_dir = str(tmp_path / "downloads/proj")
+    add_worktree(url, sha, client_dir, str(tmp_path / "mirrors"))
+    return sha, client_dir
+
+
+def test_put_and_get(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"))
+    log = tmp_path / "test.log"
+    log.write_text("[INFO] BUILD SUCCESS\n")
+    key = hash_key('test', 'sha', 'x:y', '2.0')
+
+    assert cache.get(key) is None
+    cache.put(key, True, str(log), group="test:i-1", exit_code=0)
+    entry = cache.get(key)
+    assert entry['success'] and entry['meta'] == {'exit_code': 0}
+    with open(entry['log']) as fr:
+        assert fr.read() == "[INFO] BUILD SUCCESS\n"
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = BuildCache(str(tmp_path / "cache"), max_bytes=10)
+    log = tmp_path / "test.log"
+    log.write_text("123456")
+    cache.put("a", True, str(log))
+    cache.put("b", True, str(log))
+
+    assert cache.get("a") is None and cache.get("b") is not None
+    assert cache.stats()['evictions'] == 1
+
+
+def test_tree_fingerprint_tracks_uncommitted_changes(maven_repo, tmp_path):
+    _, client_dir = checkout(maven_repo, tmp_path)
+    clean = tree_fingerprint(client_dir)
+    write_file(f"{client_dir}/core/src/main/java/a/Extra.java", "package a;\n")
+    assert tree_fingerprint(client_dir) != clean
+    os.remove(f"{client_dir}/core/src/main/java/a/Extra.java")
+    assert tree_fingerprint(client_dir) == clean
+
+
+def test_install_is_skipped_when_nothing_changed(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    install_project(sha, client_dir, cache)
+    install_project(sha, client_dir, cache)
+
+    calls = read_calls(stub_mvn)
+    assert len(calls) == 1 and calls[0].startswith(f"{client_dir} install")
+
+
+def test_install_rebuilds_only_changed_modules(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    install_project(sha, client_dir, cache)
+    write_file(f"{client_dir}/app/src/main/java/a/App.java", "package a;\n")
+    install_project(sha, client_dir, cache)
+
+    calls = read_calls(stub_mvn)
+    assert len(calls) == 2 and calls[1].endswith("-pl app -amd")
+
+
+def test_install_of_a_submodule_builds_its_dependencies(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    install_project(sha, client_dir, BuildCache(str(tmp_path / "cache")), "app")
+
+    assert read_calls(stub_mvn)[0].endswith("-pl app -am")
+
+
+def test_failed_install_is_not_reused(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    write_file(str(tmp_path / "mvn_fail"), "")
+    install_project(sha, client_dir, cache)
+    os.remove(tmp_path / "mvn_fail")
+    install_project(sha, client_dir, cache)
+    install_project(sha, client_dir, cache)
+
+    assert len(read_calls(stub_mvn)) == 2
+
+
+def test_install_reruns_when_local_repository_was_wiped(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    core_pom = str(tmp_path / "m2/a/core/1.0/core-1.0.pom")
+    write_file(core_pom, "<project/>")
+    install_project(sha, client_dir, cache)
+    install_project(sha, client_dir, cache)
+    os.remove(core_pom)
+    install_project(sha, client_dir, cache)
+
+    assert len(read_calls(stub_mvn)) == 2
+
+
+def test_install_failing_with_exit_code_zero_is_not_reused(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    write_file(str(tmp_path / "mvn_fail_never"), "")
+    install_project(sha, client_dir, cache)
+    install_project(sha, client_dir, cache)
+    os.remove(tmp_path / "mvn_fail_never")
+    install_project(sha, client_dir, cache)
+    install_project(sha, client_dir, cache)
+
+    assert len(read_calls(stub_mvn)) == 3
+
+
+def test_partial_rebuild_starts_from_the_last_successful_install(maven_repo, tmp_path, stub_mvn):
+    sha, client_dir = checkout(maven_repo, tmp_path)
+    cache = BuildCache(str(tmp_path / "cache"))
+    install_project(sha, client_dir, cache)
+    write_file(f"{client_dir}/core/src/main/java/a/Broken.java", "package a;\n")
+    write_file(str(tmp_path / "mvn_fail_never"), "")
+    install_project(sha, client_dir, cache)
+    os.remove(tmp_path / "mvn_fail_never")
+    write_file(f"{client_dir}/app/src/main/java/a/App.java", "package a;\n")
+    install_project(sha, client_dir, cache)
+
+    # core failed to install, so it is rebuilt along with app.
+    assert sorted(read_calls(stub_mvn)[-1].split(" -pl ")[1].removesuffix(" -amd").split(",")) == ["app", "core"]
+
+
+def test_only_build_output_of_modules_is_left_out_of_the_fingerprint(maven_repo, tmp_path):
+    _, client_dir = checkout(maven_repo, tmp_path)
+    clean = tree_fingerprint(client_dir)
+    write_file(f"{client_dir}/core/target/classes/a/Core.class", "\xca\xfe")
+    write_file(f"{client_dir}/build/output.txt", "")
+    assert tree_fingerprint(client_dir) == clean
+    write_file(f"{client_dir}/core/src/main/java/a/build/Tool.java", "package a.build;\n")
+    assert tree_fingerprint(client_dir) != clean
+    assert "core/src/main/java/a/build/Tool.java" in get_changed_files(client_dir)
@@ -0,0 +1,43 @@
+from knowledge_store import KnowledgeStore
+from services.conversation import ConversationSession
+
+
+def test_turns_are_saved_and_reloaded(tmp_path):
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    session = ConversationSession.load(store, "i-1", "openai")
+    session.request("why?", "system")
+    session.record("why?", "because")
+
+    reloaded = ConversationSession.load(store, "i-1", "openai")
+    assert reloaded.turns == [{"role": "user", "content": "why?"}, {"role": "assistant", "content": "because"}]
+    reloaded.clear()
+    assert ConversationSession.load(store, "i-1", "openai").turns == []
+
+
+def test_requests_fit_the_budget():
+    session = ConversationSession("i-1", "openai", token_budget=300)
+    for i in range(10):
+        prompt = f"question {i} " + "x" * 400
+        session.request(prompt)
+        session.record(prompt, "answer " + "y" * 200)
+    system, messages = session.request("last")
+
+    # The returned system prompt already holds the summary, so the estimate covers the whole payload.
+    assert session.estimate(system, messages, summary=[]) <= 300
+    assert [m["content"][:10] for m in messages] == ["question 9", "answer yyy", "last"]
+    assert system.startswith("Summary of earlier turns") and "question 8" in system
+
+
+def test_failed_request_leaves_the_session_unchanged():
+    session = ConversationSession("i-1", "openai", token_budget=120)
+    session.request("first " + "x" * 400)
+    session.record("first " + "x" * 400, "reply")
+    turns = list(session.turns)
+    _, messages = session.request("second " + "x" * 400)
+
+    assert len(messages) == 1
+    assert session.turns == turns and session.summary == []
+    _, retried = session.request("second " + "x" * 400)
+    assert retried == messages
+    session.record("second " + "x" * 400, "reply")
+    assert len(session.turns) == 2 and len(session.summary) == 1
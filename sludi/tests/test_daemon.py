@@ -0,0 +1,102 @@
+import json
+import os
+import socket
+import stat
+import threading
+import time
+
+import pytest
+
+import daemon
+import main
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="the daemon needs Unix domain sockets")
+
+
+def send(socket_file: str, message: dict) -> list[dict]:
+    """ Sends one request to the daemon and returns every message of its reply. """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_file)
+        connection.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        return [json.loads(line) for line in connection.makefile('rb')]
+
+
+@pytest.fixture
+def serve(tmp_path, monkeypatch):
+    """ Starts the daemon on a socket in a private directory, with `main.execute` replaced by `execute`. """
+    monkeypatch.setenv('SLUDI_MAVEN', 'mvn')
+    socket_dir = tmp_path / "run"
+    socket_dir.mkdir(mode=0o700)
+    socket_file = str(socket_dir / "d.sock")
+    threads = []
+
+    def start(execute) -> str:
+        monkeypatch.setattr(main, 'execute', execute)
+        thread = threading.Thread(target=daemon.serve, args=(socket_file,), daemon=True)
+        thread.start()
+        threads.append(thread)
+        deadline = time.time() + 5
+        while not daemon.ping(socket_file):
+            assert time.time() < deadline, "the daemon did not start"
+            time.sleep(0.01)
+        return socket_file
+
+    yield start
+    if threads:
+        send(socket_file, {'command': 'stop'})
+        threads[0].join(5)
+        assert not os.path.exists(socket_file)
+
+
+def test_socket_is_accessible_to_the_owner_only(serve):
+    socket_file = serve(lambda opts: None)
+
+    assert stat.S_IMODE(os.stat(socket_file).st_mode) == 0o600
+
+
+def test_refuses_a_directory_every_user_can_write_to(tmp_path, capsys):
+    socket_dir = tmp_path / "shared"
+    socket_dir.mkdir()
+    socket_dir.chmod(0o777)
+
+    assert daemon.serve(str(socket_dir / "d.sock")) is False
+    assert "Refusing to listen" in capsys.readouterr().out
+    assert os.listdir(socket_dir) == []
+
+
+def test_job_output_is_streamed_back(serve):
+    def execute(opts):
+        print(f"running {opts.id}, headless={opts.headless}")
+
+    replies = send(serve(execute), {'command': 'run', 'argv': ['--id', 'i-1']})
+
+    assert "".join(r['text'] for r in replies if r['type'] == 'output') == "running i-1, headless=True\n"
+    assert replies[-1] == {'type': 'exit', 'code': 0}
+
+
+def test_jobs_run_one_at_a_time(serve):
+    active, overlaps = [0], []
+
+    def execute(opts):
+        active[0] += 1
+        overlaps.append(active[0])
+        print(f"start {opts.id}")
+        time.sleep(0.2)
+        print(f"end {opts.id}")
+        active[0] -= 1
+
+    socket_file = serve(execute)
+    outputs = {}
+
+    def run(id: str) -> None:
+        replies = send(socket_file, {'command': 'run', 'argv': ['--id', id]})
+        outputs[id] = "".join(r['text'] for r in replies if r['type'] == 'output')
+
+    clients = [threading.Thread(target=run, args=(id,)) for id in ("i-1", "i-2")]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join(5)
+
+    assert overlaps == [1, 1]
+    assert outputs == {'i-1': "start i-1\nend i-1\n", 'i-2': "start i-2\nend i-2\n"}
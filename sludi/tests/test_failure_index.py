@@ -0,0 +1,26 @@
+import failure_index
+from failure_index import find_known_failure, get_failure_index
+from knowledge_store import KnowledgeStore
+
+RECORD = {'id': "i-1", 'exception': "java.lang.NoSuchMethodError", 'exception_info': "'long okio.Utf8.size()'",
+          'frames': ["okhttp3.internal.Util.size(Util.java:10)", "a.AppTest.test(AppTest.java:8)"],
+          'diagnosis': "Pin okio"}
+
+
+def test_records_are_indexed_once_and_then_one_by_one(tmp_path, monkeypatch):
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    store.upsert({'id': "i-0", 'exception': ""})
+    store.upsert(RECORD)
+    rebuilds = []
+    rebuild = failure_index.FailureIndex.rebuild
+    monkeypatch.setattr(failure_index.FailureIndex, 'rebuild', lambda self: rebuilds.append(1) or rebuild(self))
+
+    get_failure_index(store).add({'id': "i-2", 'exception': ""})
+    assert rebuilds == []
+    matches = find_known_failure(dict(RECORD, id="i-3"), store)
+    assert [m.id for m in matches] == ["i-1"]
+    assert rebuilds == [1]
+
+    failure_index._failure_indexes.clear()
+    find_known_failure(dict(RECORD, id="i-3"), KnowledgeStore(str(tmp_path / "knowledge.db")))
+    assert rebuilds == [1]
@@ -0,0 +1,73 @@
+import os
+
+import file_index
+from conftest import git, write_file
+from file_index import get_file_index, invalidate_file_indexes
+from git_cache import add_worktree
+
+
+def checkout(maven_repo, tmp_path) -> str:
+    url, sha = maven_repo
+    client_dir = str(tmp_path / "downloads/proj")
+    add_worktree(url, sha, client_dir, str(tmp_path / "mirrors"))
+    return client_dir
+
+
+def test_lookup_prefers_the_package(maven_repo, tmp_path):
+    client_dir = checkout(maven_repo, tmp_path)
+    write_file(f"{client_dir}/app/src/main/java/b/Core.java", "package b;\n")
+    index = get_file_index(client_dir)
+
+    assert index.lookup("Core.java", "a") == f"{client_dir}/core/src/main/java/a/Core.java"
+    assert index.lookup("Core.java", "b") == f"{client_dir}/app/src/main/java/b/Core.java"
+    assert index.lookup("Missing.java") is None
+
+
+def test_git_state_is_checked_once_per_stage(maven_repo, tmp_path, monkeypatch):
+    client_dir = checkout(maven_repo, tmp_path)
+    invalidate_file_indexes()
+    calls = []
+    get_index_state = file_index.get_index_state
+    monkeypatch.setattr(file_index, 'get_index_state', lambda d: calls.append(d) or get_index_state(d))
+    for _ in range(3):
+        get_file_index(client_dir)
+    invalidate_file_indexes()
+    get_file_index(client_dir)
+
+    assert len(calls) == 2
+
+
+def test_only_changed_paths_are_refreshed(maven_repo, tmp_path, monkeypatch):
+    client_dir = checkout(maven_repo, tmp_path)
+    invalidate_file_indexes()
+    index = get_file_index(client_dir)
+    write_file(f"{client_dir}/core/src/main/java/a/Added.java", "package a;\n")
+    os.remove(f"{client_dir}/app/src/test/java/a/AppTest.java")
+    git("mv", "core/src/main/java/a/Core.java", "core/src/main/java/a/Renamed.java", cwd=client_dir)
+    monkeypatch.setattr(file_index.FileIndex, 'build', lambda self, state: (_ for _ in ()).throw(AssertionError))
+    invalidate_file_indexes()
+
+    assert get_file_index(client_dir) is index
+    assert index.lookup("Added.java") == f"{client_dir}/core/src/main/java/a/Added.java"
+    assert index.lookup("Renamed.java") == f"{client_dir}/core/src/main/java/a/Renamed.java"
+    assert index.lookup("AppTest.java") is None and index.lookup("Core.java") is None
+
+
+def test_index_is_reloaded_from_disk(maven_repo, tmp_path):
+    client_dir = checkout(maven_repo, tmp_path)
+    get_file_index(client_dir)
+    file_index._file_indexes.clear()
+    invalidate_file_indexes()
+
+    assert os.path.exists(f"{tmp_path}/downloads/.proj.files.json")
+    assert get_file_index(client_dir).lookup("AppTest.java") == f"{client_dir}/app/src/test/java/a/AppTest.java"
+
+
+def test_build_packages_are_indexed_but_module_build_output_is_not(maven_repo, tmp_path):
+    client_dir = checkout(maven_repo, tmp_path)
+    write_file(f"{client_dir}/core/target/generated-sources/a/Tool.java", "package a;\n")
+    write_file(f"{client_dir}/core/src/main/java/a/build/Tool.java", "package a.build;\n")
+    invalidate_file_indexes()
+    index = get_file_index(client_dir)
+    assert index.lookup("Tool.java") == f"{client_dir}/core/src/main/java/a/build/Tool.java"
+    assert index.files["Tool.java"] == ["core/src/main/java/a/build/Tool.java"]
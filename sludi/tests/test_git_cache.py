@@ -0,0 +1,55 @@
+import os
+
+import pytest
+
+from conftest import git as run_git
+from git_cache import add_worktree, get_mirror_dir, has_commit, remove_worktree
+
+
+def test_worktrees_share_one_mirror(maven_repo, tmp_path):
+    url, sha = maven_repo
+    mirrors_dir = str(tmp_path / "mirrors")
+    add_worktree(url, sha, str(tmp_path / "jobs/i-1/proj"), mirrors_dir)
+    add_worktree(url, sha, str(tmp_path / "jobs/i-2/proj"), mirrors_dir)
+
+    assert os.listdir(mirrors_dir) == [os.path.basename(get_mirror_dir(url, mirrors_dir))]
+    for job in ("i-1", "i-2"):
+        worktree = tmp_path / f"jobs/{job}/proj"
+        assert (worktree / "core/pom.xml").is_file()
+        assert run_git("rev-parse", "HEAD", cwd=str(worktree)) == sha
+
+
+def test_mirror_fetches_new_commits_only(maven_repo, tmp_path):
+    url, sha = maven_repo
+    mirrors_dir = str(tmp_path / "mirrors")
+    add_worktree(url, sha, str(tmp_path / "old"), mirrors_dir)
+    repo_dir = url.removeprefix("file://")
+    with open(f"{repo_dir}/README", 'w') as fw:
+        fw.write("readme\n")
+    run_git("add", "README", cwd=repo_dir)
+    run_git("commit", "--quiet", "-m", "readme", cwd=repo_dir)
+    new_sha = run_git("rev-parse", "HEAD", cwd=repo_dir)
+
+    mirror_dir = get_mirror_dir(url, mirrors_dir)
+    assert not has_commit(mirror_dir, new_sha)
+    add_worktree(url, new_sha, str(tmp_path / "new"), mirrors_dir)
+    assert has_commit(mirror_dir, new_sha)
+    assert (tmp_path / "new/README").is_file() and not (tmp_path / "old/README").exists()
+
+
+def test_remove_worktree_unregisters_it(maven_repo, tmp_path):
+    url, sha = maven_repo
+    mirrors_dir = str(tmp_path / "mirrors")
+    worktree = str(tmp_path / "downloads/proj")
+    add_worktree(url, sha, worktree, mirrors_dir)
+    remove_worktree(worktree)
+
+    assert not os.path.exists(worktree)
+    listed = run_git("worktree", "list", "--porcelain", cwd=get_mirror_dir(url, mirrors_dir))
+    assert worktree not in listed
+
+
+def test_unknown_commit_raises(maven_repo, tmp_path):
+    url, _ = maven_repo
+    with pytest.raises(RuntimeError):
+        add_worktree(url, "0" * 40, str(tmp_path / "downloads/proj"), str(tmp_path / "mirrors"))
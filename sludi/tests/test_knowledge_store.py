@@ -0,0 +1,102 @@
+import json
+import multiprocessing
+import os
+
+import pytest
+
+import knowledge_store
+from knowledge_store import KnowledgeStore
+
+
+def write_json(path, records, mtime_ns=None) -> None:
+    with open(path, 'w') as fw:
+        json.dump(records, fw)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_upsert_replaces_the_record_and_keeps_its_position(tmp_path):
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    store.upsert({'id': "i-1", 'lib': "a"})
+    store.upsert({'id': "i-2", 'lib': "b"})
+    store.upsert({'id': "i-1", 'lib': "c"})
+    assert store.get("i-1") == {'id': "i-1", 'lib': "c"}
+    assert [r['id'] for r in store.all()] == ["i-1", "i-2"]
+    assert len(store) == 2
+    assert store.delete("i-2") and not store.delete("i-2")
+    assert store.get("i-2") is None
+
+
+def test_json_round_trip(tmp_path):
+    json_path = str(tmp_path / "knowledge.json")
+    records = [{'id': "i-1", 'exception': "E", 'frames': ["a.B.c(B.java:1)"]}, {'id': "i-2", 'diagnosis': "ü"}]
+    write_json(json_path, records)
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"), json_path)
+    assert store.all() == records
+    store.upsert({'id': "i-3"})
+    store.export_json(json_path)
+    with open(json_path) as fr:
+        assert json.load(fr) == records + [{'id': "i-3"}]
+    assert KnowledgeStore(str(tmp_path / "other.db"), json_path).all() == records + [{'id': "i-3"}]
+
+
+def test_hand_edited_json_is_imported_again(tmp_path):
+    json_path = str(tmp_path / "knowledge.json")
+    write_json(json_path, [{'id': "i-1", 'lib': "a"}])
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"), json_path)
+    store.upsert({'id': "i-2", 'lib': "b"})
+    store.export_json(json_path)
+    exported = os.stat(json_path).st_mtime_ns
+
+    assert store.sync_json(json_path) == 0
+    write_json(json_path, [{'id': "i-1", 'lib': "edited"}], exported - 10**9)
+    assert store.sync_json(json_path) == 0
+    assert store.get("i-1")['lib'] == "a"
+
+    write_json(json_path, [{'id': "i-1", 'lib': "edited"}], exported + 10**9)
+    assert store.sync_json(json_path) == 1
+    assert store.get("i-1")['lib'] == "edited"
+    assert store.get("i-2")['lib'] == "b"
+    assert store.sync_json(json_path) == 0
+
+
+def test_failed_export_leaves_the_json_intact(tmp_path, monkeypatch):
+    json_path = str(tmp_path / "knowledge.json")
+    write_json(json_path, [{'id': "i-1"}])
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"), json_path)
+    store.upsert({'id': "i-2"})
+
+    def dump(obj, fw, **kwargs):
+        fw.write('[{"id": "i-1"}, {"id"')
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(knowledge_store.json, 'dump', dump)
+    with pytest.raises(OSError):
+        store.export_json(json_path)
+    monkeypatch.undo()
+    with open(json_path) as fr:
+        assert json.load(fr) == [{'id': "i-1"}]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def write_records(db_path: str, prefix: str, count: int) -> None:
+    store = KnowledgeStore(db_path)
+    for i in range(count):
+        store.upsert({'id': f"{prefix}-{i}", 'n': i})
+        store.put_checkpoint(f"{prefix}-{i}", "test", {'n': i})
+    store.close()
+
+
+def test_two_processes_write_the_same_store(tmp_path):
+    db_path = str(tmp_path / "knowledge.db")
+    KnowledgeStore(db_path).close()
+    processes = [multiprocessing.Process(target=write_records, args=(db_path, prefix, 200)) for prefix in "ab"]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0, 0]
+    store = KnowledgeStore(db_path)
+    assert len(store) == 400
+    assert len({record['id'] for record in store.all()}) == 400
+    assert store.get_checkpoints("b-199") == {'test': {'n': 199}}
@@ -0,0 +1,146 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services.llm_client import MAX_RETRY_DELAY, OPENAI, LLMClient, LLMError, Provider
+from services.response_cache import ResponseCache
+
+
+def reply(text: str) -> bytes:
+    return json.dumps({"choices": [{"message": {"content": text}}],
+                       "usage": {"prompt_tokens": 3, "completion_tokens": 1}}).encode()
+
+
+class StubServer:
+    """
+    Answers POSTs on localhost with scripted (status, headers, body) responses, recording each client port. A
+    scripted Content-Length header is sent as is and the connection is closed after the body.
+    """
+
+    def __init__(self) -> None:
+        self.responses: list[tuple[int, dict, bytes]] = []
+        self.ports: list[int] = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers['Content-Length']))
+                stub.ports.append(self.client_address[1])
+                status, headers, body = stub.responses.pop(0)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if "Content-Length" not in headers:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                # A Content-Length longer than the body makes the client see the connection break mid-response.
+                self.close_connection = "Content-Length" in headers
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub_server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(stub_server, tmp_path):
+    client = LLMClient(OPENAI, "key", "model", stub_server.url, requests_per_minute=6000, max_retries=2, backoff=0,
+                       cache=ResponseCache(str(tmp_path / "llm_cache")))
+    yield client
+    client.close()
+
+
+def ask(client: LLMClient, prompt: str = "hello") -> str:
+    return client.complete([{"role": "user", "content": prompt}])
+
+
+def test_retries_after_429(client, stub_server):
+    stub_server.responses = [(429, {"Retry-After": "0"}, b'{"error": "rate limited"}'), (200, {}, reply("hi"))]
+
+    assert ask(client) == "hi"
+    assert len(stub_server.ports) == 2 and stub_server.ports[0] == stub_server.ports[1]
+
+
+def test_reply_is_cached(client, stub_server):
+    stub_server.responses = [(200, {}, reply("hi"))]
+
+    assert ask(client) == "hi" and ask(client) == "hi"
+    assert len(stub_server.ports) == 1
+
+
+def test_gives_up_after_max_retries(client, stub_server):
+    stub_server.responses = [(503, {"Retry-After": "0"}, b"busy")] * 3
+
+    with pytest.raises(LLMError) as error:
+        ask(client)
+    assert error.value.status == 503 and len(stub_server.ports) == 3
+
+
+def test_client_errors_are_not_retried(client, stub_server):
+    stub_server.responses = [(400, {}, b'{"error": "bad request"}')]
+
+    with pytest.raises(LLMError):
+        ask(client)
+    assert len(stub_server.ports) == 1
+
+
+@pytest.mark.parametrize("body", [b"not json", b'{"choices": []}', b'{"unexpected": true}'])
+def test_malformed_body_discards_the_connection(client, stub_server, body):
+    stub_server.responses = [(200, {}, body), (200, {}, reply("hi"))]
+
+    with pytest.raises(LLMError):
+        ask(client, "first")
+    assert client.pool._idle.empty()
+    assert ask(client, "second") == "hi"
+    assert stub_server.ports[0] != stub_server.ports[1]
+
+
+def events(*deltas: str) -> bytes:
+    return b"".join(b"data: " + json.dumps({"choices": [{"delta": {"content": d}}]}).encode() + b"\n\n"
+                    for d in deltas)
+
+
+def test_broken_stream_is_retried_only_before_the_first_delta(client, stub_server):
+    broken = {"Content-Length": "1000"}
+    stub_server.responses = [(200, broken, b""), (200, {}, events("hel", "lo") + b"data: [DONE]\n\n")]
+    deltas = []
+
+    assert client.complete([{"role": "user", "content": "a"}], stream=True, on_delta=deltas.append) == "hello"
+    assert deltas == ["hel", "lo"]
+
+    stub_server.responses = [(200, broken, events("hel")), (200, {}, events("hello"))]
+    deltas.clear()
+    with pytest.raises(LLMError):
+        client.complete([{"role": "user", "content": "b"}], stream=True, on_delta=deltas.append)
+    assert deltas == ["hel"]
+    assert len(stub_server.ports) == 3
+
+
+def test_retry_after_is_capped(client):
+    assert client._delay(0, "3600") == MAX_RETRY_DELAY
+    assert client._delay(0, "-5") == 0.0
+    client.backoff = 1.0
+    assert client._delay(10, None) == MAX_RETRY_DELAY
+
+
+def test_provider_is_abstract():
+    with pytest.raises(TypeError):
+        Provider()
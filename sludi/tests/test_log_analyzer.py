@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from log_analyzer import STOPPED_EARLY, analyze_test_log, run_test_build
+
+TEST_LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "knowledge", "_test_logs")
+
+# The exception, message and error location found by the line-list parser the analyzer replaced.
+SHIPPED_LOGS = [
+    ("i-1", "WireConverterFactoryTest", "java.lang.NoSuchMethodError",
+     "okio.Utf8.size$default(Ljava/lang/String;IIILjava/lang/Object;)J",
+     "retrofit2.converter.wire.WireConverterFactoryTest.serializeAndDeserialize(WireConverterFactoryTest.java:64)"),
+    ("i-2", "MoshiConverterFactoryTest", "java.lang.AssertionError",
+     'Expecting message:\n <"Cannot skip unexpected NAME at $.">\nbut was:\n <"Cannot skip unexpected NAME at $.taco">',
+     "retrofit2.converter.moshi.MoshiConverterFactoryTest.failOnUnknown(MoshiConverterFactoryTest.java:258)"),
+    ("i-4", "DefaultConfigFactoryManagerTest", "java.lang.ExceptionInInitializerError", "",
+     "com.ctrip.framework.apollo.spi.DefaultConfigFactoryManagerTest.setUp(DefaultConfigFactoryManagerTest.java:24)"),
+    ("i-5", "ApolloMockServerSpringIntegrationTest", "java.lang.IllegalStateException",
+     "Failed to load ApplicationContext", None),
+]
+
+
+@pytest.mark.parametrize("id, test_name, exception, message, error_location", SHIPPED_LOGS)
+def test_shipped_logs_give_the_results_of_the_previous_parser(id, test_name, exception, message, error_location):
+    report = analyze_test_log(f"{TEST_LOG_DIR}/{id}/test.log", test_name)
+    assert report.build_status == "FAILURE" and not report.success
+    assert report.failure_count == 1
+    # The previous parser split the message on ':' and joined the parts without them; the analyzer keeps them.
+    assert report.exception == (exception, message)
+    assert report.error_location == error_location
+
+
+def test_non_utf8_bytes_are_replaced(tmp_path):
+    test_log = f"{TEST_LOG_DIR}/i-1/test.log"
+    with open(test_log, 'rb') as fr:
+        data = fr.read()
+    assert b"\xbb NoSuchMethod" in data
+    report = analyze_test_log(test_log, "WireConverterFactoryTest")
+    assert report.lines == data.count(b"\n")
+
+    test_log = str(tmp_path / "test.log")
+    with open(test_log, 'wb') as fw:
+        fw.write(b"[ERROR] bar(a.FooTest) \xbb\xff <<< ERROR!\njava.lang.IllegalStateException: caf\xe9\n"
+                 b"\tat a.FooTest.bar(FooTest.java:7)\n[INFO] BUILD FAILURE\n")
+    report = analyze_test_log(test_log, "FooTest")
+    assert report.failures[0].header == "[ERROR] bar(a.FooTest) �� <<< ERROR!"
+    assert report.exception == ("java.lang.IllegalStateException", "caf�")
+    assert report.error_location == "a.FooTest.bar(FooTest.java:7)"
+
+
+def is_running(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as fr:
+            return fr.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="needs /proc to find the forked process")
+def test_stop_early_kills_the_build_and_its_forks(tmp_path):
+    build = tmp_path / "build.sh"
+    build.write_text(f"""sleep 60 &
+echo $! > {tmp_path}/fork.pid
+echo "[ERROR] bar(a.FooTest)  Time elapsed: 0.1 s  <<< ERROR!"
+echo "java.lang.IllegalStateException: boom"
+echo "\tat a.FooTest.bar(FooTest.java:7)"
+echo ""
+for i in $(seq 1 100); do echo "[INFO] Running a.OtherTest$i"; sleep 0.05; done
+echo "[INFO] BUILD SUCCESS"
+""")
+    test_log = str(tmp_path / "test.log")
+    report = run_test_build(f"sh {build}", str(tmp_path), test_log, "FooTest", stop_early=True)
+
+    assert report.stopped_early and not report.success
+    assert report.exception == ("java.lang.IllegalStateException", "boom")
+    with open(test_log) as fr:
+        lines = fr.readlines()
+    assert lines[-1] == STOPPED_EARLY.format(test="FooTest")
+    assert "[INFO] Running a.OtherTest100\n" not in lines
+    pid = int((tmp_path / "fork.pid").read_text())
+    deadline = time.time() + 5
+    while is_running(pid) and time.time() < deadline:
+        time.sleep(0.05)
+    assert not is_running(pid)
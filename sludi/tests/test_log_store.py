@@ -0,0 +1,62 @@
+import pytest
+
+import log_store
+import utils
+from log_analyzer import analyze_test_log
+from log_store import archive_test_log, latest_run
+
+FAILURE = """[ERROR] testParse(a.AppTest)  Time elapsed: 0.1 s  <<< ERROR!
+java.lang.NoSuchMethodError: 'void x.Y.parse()'
+\tat a.Core.run(Core.java:12)
+\tat a.AppTest.testParse(AppTest.java:8)
+"""
+
+
+def write_log(path: str, lines_before: int) -> str:
+    with open(path, 'w') as fw:
+        for i in range(lines_before):
+            fw.write(f"[INFO] Downloading artifact {i} of the reactor build\n")
+        fw.write(FAILURE)
+        fw.write("[INFO] Tests run: 1, Failures: 0, Errors: 1\n[INFO] BUILD FAILURE\n")
+    with open(path) as fr:
+        return fr.read()
+
+
+@pytest.mark.parametrize("lines_before", [0, 10, 255, 256, 2000])
+def test_offsets_of_archived_sections_match_the_log(tmp_path, monkeypatch, lines_before):
+    monkeypatch.setattr(log_store, 'CHUNK_SIZE', 4096)
+    text = write_log(str(tmp_path / "test.log"), lines_before)
+    run = archive_test_log("i-1", str(tmp_path / "test.log"), "AppTest", log_dir=str(tmp_path / "logs"))
+    assert run.failure_text() == FAILURE
+    assert run.stack_trace() == FAILURE[FAILURE.index("\tat"):]
+    assert run.build_line() == "[INFO] BUILD FAILURE"
+    assert run.text() == text
+
+
+def test_reanalyzing_a_run_for_another_test_name_matches_the_plain_log(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_store, 'CHUNK_SIZE', 1024)
+    write_log(str(tmp_path / "test.log"), 500)
+    archive_test_log("i-1", str(tmp_path / "test.log"), "OtherTest", log_dir=str(tmp_path / "logs"))
+    run = latest_run("i-1", "test", str(tmp_path / "logs"))
+    assert run.report().error_location is None
+    assert run.analyze("AppTest") == analyze_test_log(str(tmp_path / "test.log"), "AppTest")
+
+
+def test_zstd_is_the_default_codec_when_installed(tmp_path):
+    write_log(str(tmp_path / "test.log"), 10)
+    run = archive_test_log("i-1", str(tmp_path / "test.log"), log_dir=str(tmp_path / "logs"))
+    try:
+        import zstandard  # noqa: F401
+        assert run.index['codec'] == "zstd"
+    except ImportError:
+        assert run.index['codec'] == "gzip"
+
+
+def test_report_without_a_test_name_is_read_from_the_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, 'TEST_LOG_DIR', str(tmp_path / "logs"))
+    write_log(str(tmp_path / "test.log"), 10)
+    archive_test_log("i-1", str(tmp_path / "test.log"), "AppTest", log_dir=str(tmp_path / "logs"))
+    monkeypatch.setattr(utils, 'analyze_test_log', lambda *args: pytest.fail("the log was parsed again"))
+    report = utils.get_test_log_report("i-1")
+    assert not report.success
+    assert report.exception == ("java.lang.NoSuchMethodError", "'void x.Y.parse()'")
@@ -0,0 +1,78 @@
+from method_index import MethodIndex, find_spans, tokenize
+
+SOURCE = """package a;
+
+class Foo {
+    static {
+        init();
+    }
+
+    Foo() {
+    }
+
+    void bar() {
+        Runnable r = () -> {
+            call();
+        };
+        call(new Object() {
+            public String toString() {
+                return "x";
+            }
+        });
+    }
+}
+"""
+
+
+def test_spans_of_every_construct():
+    spans = find_spans(tokenize(SOURCE))
+
+    assert [span[2:] for span in spans] == [('class', 'Foo'), ('initializer', ''), ('constructor', 'Foo'),
+                                            ('method', 'bar'), ('lambda', ''), ('class', ''), ('method', 'toString')]
+    assert all(len(span) == 4 for span in spans)
+
+
+def test_find_returns_the_innermost_method():
+    index = MethodIndex(find_spans(tokenize(SOURCE)))
+
+    assert index.find(13)[3] == 'bar'
+    assert index.find(13, ('lambda',))[:2] == (12, 14)
+    assert index.find(18)[3] == 'toString'
+    assert index.find(2) is None
+
+
+def test_falls_back_to_the_regex_lexer(capsys):
+    source = SOURCE.replace('"x"', '"\\q"')
+
+    assert find_spans(tokenize(source, "Foo.java")) == find_spans(tokenize(SOURCE))
+    assert "Foo.java" in capsys.readouterr().out
+
+
+def test_methods_in_enum_constant_bodies():
+    source = """enum Op {
+    PLUS {
+        int apply(int a, int b) {
+            return a + b;
+        }
+    },
+    TIMES("*") {
+        int apply(int a, int b) {
+            return a * b;
+        }
+    };
+
+    Op() {
+    }
+
+    Op(String symbol) {
+    }
+
+    abstract int apply(int a, int b);
+}
+"""
+    spans = find_spans(tokenize(source))
+
+    assert spans == [(1, 20, 'class', 'Op'), (2, 6, 'class', 'PLUS'), (3, 5, 'method', 'apply'),
+                     (7, 11, 'class', 'TIMES'), (8, 10, 'method', 'apply'), (13, 14, 'constructor', 'Op'),
+                     (16, 17, 'constructor', 'Op')]
+    assert MethodIndex(spans).find(9)[3] == 'apply'
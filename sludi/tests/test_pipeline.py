@@ -0,0 +1,76 @@
+import pytest
+
+import pipeline
+from build_cache import BuildCache
+from conftest import git, read_calls, write_file
+from git_cache import add_worktree
+from knowledge_store import KnowledgeStore
+from pipeline import Pipeline, PipelineOptions
+from services import response_cache
+from services.conversation import ConversationSession
+
+
+@pytest.fixture
+def bumped(maven_repo, tmp_path, monkeypatch) -> Pipeline:
+    """ A pipeline whose checkout had x:y bumped to 2.0 and Core.java fixed after a diagnosis. """
+    url, sha = maven_repo
+    downloads_dir = str(tmp_path / "downloads")
+    add_worktree(url, sha, f"{downloads_dir}/proj", str(tmp_path / "mirrors"))
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    monkeypatch.setattr(pipeline, 'get_knowledge_store', lambda: store)
+    monkeypatch.setattr(pipeline, 'write_knowledge_info', lambda record: None)
+    client_info = {'id': "i-1", 'client': "proj", 'lib': "x:y", 'old': "1.0", 'new': "2.0", 'diagnosis': "Fix Core"}
+    p = Pipeline(client_info, PipelineOptions(headless=True), downloads_dir)
+    p.state.update(p.bump())
+    write_file(f"{downloads_dir}/proj/core/src/main/java/a/Core.java",
+               "package a;\n\npublic class Core {\n    int fixed;\n}\n")
+    return p
+
+
+def test_recorded_fix_leaves_out_the_version_bump(bumped):
+    assert [path.split("/downloads/")[1] for path in bumped.state['bumped_files']] == ["proj/core/pom.xml"]
+    bumped.record_fix()
+    assert "int fixed;" in bumped.client_info['fix']
+    assert "pom.xml" not in bumped.client_info['fix']
+
+
+def test_recorded_fix_leaves_out_the_bumped_poms_without_a_snapshot(bumped):
+    del bumped.state['bump_snapshot']
+    bumped.record_fix()
+    assert "int fixed;" in bumped.client_info['fix']
+    assert "pom.xml" not in bumped.client_info['fix']
+
+
+def test_replay_leaves_the_saved_sessions_alone(tmp_path, monkeypatch):
+    store = KnowledgeStore(str(tmp_path / "knowledge.db"))
+    monkeypatch.setattr(pipeline, 'get_knowledge_store', lambda: store)
+    saved = ConversationSession.load(store, "i-1", "openai")
+    saved.request("why?")
+    saved.record("why?", "because")
+    monkeypatch.setattr(response_cache, 'replay_mode', True)
+
+    replayed = Pipeline({'id': "i-1"}, PipelineOptions(headless=True), str(tmp_path / "downloads"))
+    assert replayed.openai_session.turns == [] and replayed.openai_session.store is None
+    replayed.openai_session.request("again?")
+    replayed.openai_session.record("again?", "still")
+    assert ConversationSession.load(store, "i-1", "openai").turns == saved.turns
+
+
+def test_every_test_run_installs_the_changed_modules_first(bumped, tmp_path, monkeypatch, stub_mvn):
+    client_dir = f"{bumped.downloads_dir}/proj"
+    bumped.client_info.update(sha=git("rev-parse", "HEAD", cwd=client_dir), test="AppTest#t", submodule="N/A",
+                              test_cmd="N/A")
+    cache = BuildCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(pipeline, 'get_build_cache', lambda: cache)
+    installs_before_test = []
+    monkeypatch.setattr(pipeline, 'run_upgraded_test',
+                        lambda ci, downloads_dir, stop_early: installs_before_test.append(len(read_calls(stub_mvn))))
+
+    bumped.test()
+    write_file(f"{client_dir}/core/src/main/java/a/Core.java", "package a;\n\npublic class Core {\n}\n")
+    bumped.test()
+    bumped.test()
+
+    calls = read_calls(stub_mvn)
+    assert installs_before_test == [1, 2, 2]
+    assert all(f"{client_dir} install" in call for call in calls)
@@ -0,0 +1,123 @@
+from conftest import write_file
+from incompatibilities import get_test_command
+from pom import ReactorGraph, get_pom_index, rewrite_dependency_version, rewrite_property
+
+OKHTTP = "com.squareup.okhttp3:okhttp"
+
+
+def test_rewrites_the_version_of_the_dependency():
+    text = """<dependencies>
+  <dependency>
+    <groupId>com.squareup.okhttp3</groupId>
+    <artifactId>okhttp</artifactId>
+    <version>3.14.9</version>
+  </dependency>
+  <dependency>
+    <groupId>com.squareup.okhttp3</groupId>
+    <artifactId>mockwebserver</artifactId>
+    <version>3.14.9</version>
+  </dependency>
+</dependencies>"""
+    assert rewrite_dependency_version(text, OKHTTP, "4.2.2") == text.replace("3.14.9", "4.2.2", 1)
+
+
+def test_dependency_excluding_the_lib_is_left_alone():
+    text = """<dependency>
+  <groupId>com.foo</groupId>
+  <artifactId>bar</artifactId>
+  <version>1.0</version>
+  <exclusions>
+    <exclusion>
+      <groupId>com.squareup.okhttp3</groupId>
+      <artifactId>okhttp</artifactId>
+    </exclusion>
+  </exclusions>
+</dependency>"""
+    assert rewrite_dependency_version(text, OKHTTP, "4.2.2") == text
+
+
+def test_commented_out_dependency_is_left_alone():
+    text = """<!--
+<dependency>
+  <groupId>com.squareup.okhttp3</groupId>
+  <artifactId>okhttp</artifactId>
+  <version>3.12.0</version>
+</dependency>
+-->
+<dependency>
+  <groupId>com.squareup.okhttp3</groupId>
+  <artifactId>okhttp</artifactId>
+  <!-- <version>3.0.0</version> -->
+  <version>3.14.9</version>
+</dependency>"""
+    expected = text.replace("<version>3.14.9</version>", "<version>4.2.2</version>")
+    assert rewrite_dependency_version(text, OKHTTP, "4.2.2") == expected
+
+
+def test_property_references_are_kept_unless_asked():
+    text = """<dependency>
+  <groupId>com.squareup.okhttp3</groupId>
+  <artifactId>okhttp</artifactId>
+  <version>${okhttp.version}</version>
+</dependency>"""
+    assert rewrite_dependency_version(text, OKHTTP, "4.2.2") == text
+    assert "<version>4.2.2</version>" in rewrite_dependency_version(text, OKHTTP, "4.2.2", replace_refs=True)
+
+
+def test_rewrite_property_skips_comments():
+    text = """<!-- <properties><okhttp.version>3.0</okhttp.version></properties> -->
+<properties>
+  <!-- <okhttp.version>3.1</okhttp.version> -->
+  <okhttp.version>3.14.9</okhttp.version>
+</properties>"""
+    expected = text.replace("3.14.9", "4.2.2")
+    assert rewrite_property(text, "okhttp.version", "4.2.2") == expected
+
+
+def test_set_version_follows_the_parent_property(tmp_path):
+    (tmp_path / "pom.xml").write_text("""<project>
+  <groupId>a</groupId><artifactId>parent</artifactId><version>1</version>
+  <modules><module>child</module></modules>
+  <properties><okhttp.version>3.14.9</okhttp.version></properties>
+</project>""")
+    (tmp_path / "child").mkdir()
+    (tmp_path / "child/pom.xml").write_text("""<project>
+  <parent><groupId>a</groupId><artifactId>parent</artifactId><version>1</version></parent>
+  <artifactId>child</artifactId>
+  <dependencies>
+    <dependency>
+      <groupId>com.squareup.okhttp3</groupId><artifactId>okhttp</artifactId><version>${okhttp.version}</version>
+    </dependency>
+  </dependencies>
+</project>""")
+    changed = get_pom_index(str(tmp_path)).set_version(OKHTTP, "4.2.2")
+
+    assert changed == [str(tmp_path / "pom.xml")]
+    assert "<okhttp.version>4.2.2</okhttp.version>" in (tmp_path / "pom.xml").read_text()
+
+
+def test_reactor_graph_finds_the_test_module_and_its_upstream_modules(maven_repo, tmp_path):
+    client_dir = str(tmp_path / "proj")
+    write_file(f"{client_dir}/app/src/test/java/a/build/BuildTest.java", "package a.build;\n\nclass BuildTest {\n}\n")
+    graph = ReactorGraph(client_dir)
+
+    assert graph.order == ['', 'core', 'app']
+    assert graph.find_test_module("AppTest") == "app"
+    assert graph.find_test_module("a.build.BuildTest") == "app"
+    assert graph.find_test_module("MissingTest") is None
+    assert graph.required_modules("app") == {'', 'core', 'app'}
+    assert graph.required_modules("core") == {'', 'core'}
+
+
+def test_found_test_module_is_tested_from_the_root_with_its_upstream_modules(maven_repo, tmp_path):
+    client_dir = str(tmp_path / "proj")
+    client_info = {'test': "AppTest#test", 'submodule': "N/A", 'test_cmd': "N/A"}
+    test_dir, test_cmd = get_test_command(client_info, client_dir)
+
+    assert client_info['test_module'] == "app"
+    assert test_dir == client_dir
+    assert "-Dtest=AppTest#test -pl app -am -Dsurefire.failIfNoSpecifiedTests=false" in test_cmd
+
+    configured = {'test': "AppTest#test", 'submodule': "app", 'test_cmd': "N/A"}
+    assert get_test_command(configured, client_dir) == (f"{client_dir}/app", "mvn test -fn -Drat.ignoreErrors=true "
+                                                        "-DtrimStackTrace=false -Dtest=AppTest#test")
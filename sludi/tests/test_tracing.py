@@ -0,0 +1,14 @@
+import json
+
+from tracing import read_spans, write_span
+
+
+def test_trace_file_is_rotated_above_the_size_limit(tmp_path):
+    trace_file = str(tmp_path / "trace.jsonl")
+    for i in range(10):
+        write_span(trace_file, {'name': "test", 'i': i}, max_bytes=100)
+    spans = read_spans(trace_file) + read_spans(trace_file + ".1")
+    assert len(read_spans(trace_file)) < 10
+    assert (tmp_path / "trace.jsonl.1").stat().st_size < 200
+    assert {record['i'] for record in spans} >= {8, 9}
+    assert json.loads((tmp_path / "trace.jsonl").read_text().splitlines()[-1])['i'] == 9
@@ -0,0 +1,166 @@
+""" Pipeline Stage Tracing """
+
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+TRACE_FILE = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/test_results/trace.jsonl'
+TRACE_FILE_ENV = 'SLUDI_TRACE_FILE'
+# Size above which the trace file is rotated to `<trace file>.1`, replacing the previous rotation.
+MAX_TRACE_BYTES = 32 * 1024 * 1024
+
+# Counters and sums exported per span name; every other attribute stays in the trace file only.
+PROMETHEUS_SUMS = ('log_bytes', 'input_tokens', 'output_tokens')
+
+_current_id: ContextVar[str | None] = ContextVar('sludi_trace_id', default=None)
+_current_span: ContextVar['Span | None'] = ContextVar('sludi_span', default=None)
+_write_lock = threading.Lock()
+
+
+class Span:
+    """ One timed stage of the pipeline, with the attributes recorded while it ran. """
+
+    def __init__(self, name: str, id: str | None, parent: 'Span | None', attrs: dict) -> None:
+        self.name = name
+        self.id = id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.attrs = attrs
+        self.start = time.time()
+        self._start = time.perf_counter()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def to_dict(self, error: str | None) -> dict:
+        record = {'trace_id': self.trace_id, 'span_id': self.span_id, 'parent_id': self.parent_id,
+                  'name': self.name, 'id': self.id, 'start': round(self.start, 6),
+                  'duration_ms': round((time.perf_counter() - self._start) * 1000, 3), 'attrs': self.attrs}
+        if error:
+            record['error'] = error
+        return record
+
+
+def configure(trace_file: str | None) -> None:
+    """
+    Sets the trace file for this process and the processes it starts. None disables tracing.
+    """
+    os.environ[TRACE_FILE_ENV] = trace_file or ''
+
+
+def get_trace_file() -> str | None:
+    return os.environ.get(TRACE_FILE_ENV, TRACE_FILE) or None
+
+
+@contextmanager
+def trace_context(id: str):
+    """ Attributes every span started in the block to the incompatibility `id`. """
+    token = _current_id.set(id)
+    try:
+        yield
+    finally:
+        _current_id.reset(token)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times a pipeline stage and appends it to the trace file as one JSON line when it ends.
+
+    Spans nest: a span started inside another shares its trace id and records it as its parent. Attributes such as
+    exit codes, log bytes and token counts are passed as keyword arguments or added with `Span.set` while the stage
+    runs. A stage that raises is recorded with the exception and the exception is re-raised.
+
+    Example:
+        with span("test", cmd=test_cmd) as s:
+            result = sub.run(test_cmd, ...)
+            s.set(exit_code=result.returncode)
+    """
+    current = Span(name, _current_id.get(), _current_span.get(), attrs)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace_file = get_trace_file()
+        if trace_file:
+            write_span(trace_file, current.to_dict(error))
+
+
+def write_span(trace_file: str, record: dict, max_bytes: int = MAX_TRACE_BYTES) -> None:
+    """
+    Appends one span record; each record is a single write in append mode, so processes can share the file.
+
+    Once the file holds `max_bytes` it is renamed to `<trace file>.1` and a new file is started, so the trace keeps
+    between one and two files' worth of the latest spans. A process racing the rename appends its record to the
+    rotated file, which is not lost.
+    """
+    line = json.dumps(record, default=str) + '\n'
+    with _write_lock:
+        os.makedirs(os.path.dirname(os.path.abspath(trace_file)), exist_ok=True)
+        try:
+            if os.path.getsize(trace_file) >= max_bytes:
+                os.replace(trace_file, trace_file + '.1')
+        except FileNotFoundError:
+            pass
+        with open(trace_file, 'a', encoding='utf-8') as fa:
+            fa.write(line)
+
+
+def read_spans(trace_file: str) -> list[dict]:
+    spans = []
+    with open(trace_file, 'r', encoding='utf-8') as fr:
+        for line in fr:
+            try:
+                spans.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return spans
+
+
+def export_prometheus(trace_file: str, prom_file: str) -> None:
+    """
+    Writes per-stage totals of a trace file in the Prometheus text format, for node_exporter's textfile collector.
+
+    Exports the count, total duration and error count of every span name, plus the sums of `PROMETHEUS_SUMS`
+    attributes. The file is replaced atomically so the collector never reads a partial file.
+    """
+    totals = {}
+    for record in read_spans(trace_file):
+        total = totals.setdefault(record['name'], dict.fromkeys(('count', 'seconds', 'errors') + PROMETHEUS_SUMS, 0))
+        total['count'] += 1
+        total['seconds'] += record['duration_ms'] / 1000
+        total['errors'] += 'error' in record
+        for attr in PROMETHEUS_SUMS:
+            value = record['attrs'].get(attr)
+            if isinstance(value, (int, float)):
+                total[attr] += value
+    lines = ["# HELP sludi_stage_runs_total Number of runs of a pipeline stage.",
+             "# TYPE sludi_stage_runs_total counter"]
+    lines += [f'sludi_stage_runs_total{{stage="{name}"}} {t["count"]}' for name, t in sorted(totals.items())]
+    lines += ["# HELP sludi_stage_duration_seconds_total Time spent in a pipeline stage.",
+              "# TYPE sludi_stage_duration_seconds_total counter"]
+    lines += [f'sludi_stage_duration_seconds_total{{stage="{name}"}} {t["seconds"]:.6f}'
+              for name, t in sorted(totals.items())]
+    lines += ["# HELP sludi_stage_errors_total Number of runs of a pipeline stage that raised.",
+              "# TYPE sludi_stage_errors_total counter"]
+    lines += [f'sludi_stage_errors_total{{stage="{name}"}} {t["errors"]}' for name, t in sorted(totals.items())]
+    for attr in PROMETHEUS_SUMS:
+        lines += [f"# HELP sludi_stage_{attr}_total Sum of {attr} recorded by a pipeline stage.",
+                  f"# TYPE sludi_stage_{attr}_total counter"]
+        lines += [f'sludi_stage_{attr}_total{{stage="{name}"}} {t[attr]}' for name, t in sorted(totals.items())
+                  if t[attr]]
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(prom_file)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as fw:
+        fw.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, prom_file)
@@ -1,16 +1,31 @@
 import os
 import subprocess as sub
 import json
-import javalang
-import re
 import subprocess
+import sqlite3
+
+from failure_index import get_failure_index
+from file_index import get_file_index
+from git_cache import add_worktree, remove_worktree
+from knowledge_store import KnowledgeStore
+from log_analyzer import TestLogReport, analyze_test_log
+from log_store import latest_run
+from method_index import get_method_index
+from pom import get_pom_index, rewrite_dependency_version
+from tracing import span
 
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 TEST_LOG_DIR = SCRIPT_DIR + '/knowledge/_test_logs'
 DOWNLOADS_DIR = SCRIPT_DIR + '/knowledge/_downloads'
+RESULTS_DIR = os.path.dirname(SCRIPT_DIR) + '/test_results'
 
 INCOMPATIBILITIES_JSON_FILE = SCRIPT_DIR + '/incompatibilities.json'
 KNOWLEDGE_JSON_FILE = SCRIPT_DIR + '/knowledge.json'
+KNOWLEDGE_DB_FILE = SCRIPT_DIR + '/knowledge.db'
+MAVEN_ENV = 'SLUDI_MAVEN'
+
+_knowledge_stores = {}
+_json_files = {}
 
 def get_test_result(id: str) -> bool:
     """
@@ -23,71 +38,111 @@ def get_test_result(id: str) -> bool:
 
     :return: A boolean indicating the build status. Returns True for success, and False for failure.
     """
-    test_log_path = TEST_LOG_DIR + '/' + id + '/test.log'
-    fail_msg = "BUILD FAILURE"
-    with open(test_log_path, 'r') as fr:
-        lines = fr.readlines()
-    for i in range(len(lines)):
-        if fail_msg in lines[i].strip():
-            return False
-    return True
+    return get_test_log_report(id).success
+
+
+def get_test_log_report(id: str, test_name: str | None = None) -> TestLogReport:
+    """
+    Analyzes the project's latest test log.
+
+    The latest archived run of the incompatibility is used, its report read from the run's index without reading the
+    log at all, unless the index was built for another test name. A plain test.log newer than that run, e.g. one put
+    there by hand while testing is disabled, is analyzed in a single streaming pass instead.
 
+    Args:
+        id (str): The incompatibility id whose test log should be analyzed.
+        test_name (str | None): Test class name used to locate the error location in the log. Without one, the error
+            location is the one found for the test name the run was archived with.
 
-def clone_project(client: str, url: str, sha: str) -> None:
+    Returns:
+        TestLogReport: Build status, failure blocks, exception and error location found in the log.
+    """
+    test_log_path = TEST_LOG_DIR + '/' + id + '/test.log'
+    with span("parse_log") as s:
+        run = latest_run(id, "test", TEST_LOG_DIR)
+        if run is not None and not (os.path.exists(test_log_path) and
+                                    os.path.getmtime(test_log_path) > run.index['created']):
+            indexed = test_name is None or run.index['test_name'] == test_name
+            report = run.report() if indexed else run.analyze(test_name)
+        else:
+            indexed = False
+            report = analyze_test_log(test_log_path, test_name)
+        s.set(log_bytes=report.bytes, lines=report.lines, failures=report.failure_count, indexed=indexed)
+    return report
+
+
+def clone_project(client: str, url: str, sha: str, downloads_dir=DOWNLOADS_DIR) -> None:
     """
-    Clones a Github project into the '_downloads' directory.
+    Checks out a Github project into the '_downloads' directory.
 
-    This function takes in the client name, repository URL, and commit SHA, 
-    and clones the project into the '_downloads' directory using the provided commit SHA.
+    This function takes in the client name, repository URL, and commit SHA, and checks out the provided commit SHA
+    into the '_downloads' directory as a worktree of a shared local mirror of the repository. The mirror is created
+    on first use and only fetches commits it does not have yet, so clients sharing a repository are cloned once.
 
     Args:
         client (str): Name of the repository client.
         url (str): The URL of the repository.
         sha (str): The SHA of the specific commit to be cloned.
+        downloads_dir (str): Directory the project is checked out into. Defaults to `DOWNLOADS_DIR`.
 
     Returns:
         None
     """
     print(f"Cloning project {client} from {url}")
-    cwd = os.getcwd()
-    os.chdir(DOWNLOADS_DIR)
-    sub.run('git clone ' + url, shell=True)
-    os.chdir(DOWNLOADS_DIR + '/' + client)
-    sub.run('git checkout ' + sha, shell=True)
-    os.chdir(cwd)
+    with span("clone", client=client, sha=sha):
+        add_worktree(url, sha, downloads_dir + '/' + client)
 
 
 def changeLibVersion(client: str, lib: str, lib_version: str,
-                     downloads_dir=DOWNLOADS_DIR) -> None:
+                     downloads_dir=DOWNLOADS_DIR) -> list[str]:
+    """
+    Sets the version of 'lib' to 'lib_version' in every pom.xml of the client.
+
+    The client's POMs are read from a cached POM index, so only POMs declaring the library are touched. Versions
+    declared through a property (e.g. `${okhttp.version}`) are changed where the property is defined, including in
+    a parent POM, and only files whose content changes are written.
+
+    Returns:
+        list[str]: The POM files that were changed.
+    """
     client_dir = downloads_dir + '/' + client
-    for dir_path, subpaths, files in os.walk(client_dir):
-        for f in files:
-            if f == 'pom.xml':
-                pom_file = dir_path + '/' + f
-                changeLibVersionOfOnePomFile(lib, lib_version, pom_file)
+    with span("bump", lib=lib, version=lib_version) as s:
+        changed = get_pom_index(client_dir).set_version(lib, lib_version)
+        s.set(files=len(changed))
+    if not changed:
+        print(f"Unable to find a version of {lib} to change in {client_dir}..")
+    return changed
                 
 
 def changeLibVersionOfOnePomFile(lib: str, lib_version: str, pom_file: str) -> None:
-    group_id = lib.split(':')[0]
-    artifact_id = lib.split(':')[1]
-    fr = open(pom_file, 'r', encoding='utf-8')
-    lines = fr.readlines()
-    fr.close()
-    for i in range(len(lines)):
-        if '<groupId>' + group_id + '</groupId>' in lines[i]:
-            if '<artifactId>' + artifact_id + '</artifactId>' in lines[i + 1]:
-                lines[i + 2] = re.sub('\<version\>.*\<\/version\>',
-                                      '<version>' + lib_version + '</version>',
-                                      lines[i + 2])
-    fw = open(pom_file, 'w', encoding='utf-8')
-    fw.write(''.join(lines))
-    fw.close()
+    with open(pom_file, 'r', encoding='utf-8') as fr:
+        text = fr.read()
+    new_text = rewrite_dependency_version(text, lib, lib_version)
+    if new_text != text:
+        with open(pom_file, 'w', encoding='utf-8') as fw:
+            fw.write(new_text)
+
+
+def get_maven_command(cmd: str) -> str:
+    """
+    Returns a Maven command line to run with the executable set in the SLUDI_MAVEN environment variable, e.g. `mvnd`,
+    whose long-lived build daemons avoid starting a cold JVM for every command. Commands are unchanged otherwise.
+    """
+    executable = os.environ.get(MAVEN_ENV)
+    if executable and (cmd == 'mvn' or cmd.startswith('mvn ')):
+        return executable + cmd[len('mvn'):]
+    return cmd
 
 
 def get_knowledge_info(id: str, file_path: str) -> dict | None:
     """
     Reads a JSON file and searches for an object with the specified ID.
 
+    Records of knowledge.json are read from its knowledge store, which holds the writes of the current run before
+    they are exported. Other files are parsed once and kept in memory until their modification time changes, so
+    repeated lookups (e.g. in the daemon) do not re-read them. A copy of the object is returned, so callers may modify
+    it.
+
     Args:
         id (str): The ID to search for in the JSON data.
         file_path (str): The path to the JSON file.
@@ -97,108 +152,139 @@ def get_knowledge_info(id: str, file_path: str) -> dict | None:
                       otherwise returns None.
     """
     try:
-        with open(file_path, 'r') as file:
-            clients_info = json.load(file)
-
-        for ci in clients_info:
-            if ci['id'] == id:
-                return ci
-        return None
+        if os.path.abspath(file_path) == os.path.abspath(KNOWLEDGE_JSON_FILE):
+            return get_knowledge_store(file_path).get(id)
+        mtime = os.path.getmtime(file_path)
+        cached = _json_files.get(file_path)
+        if cached is None or cached[0] != mtime:
+            with open(file_path, 'r') as file:
+                clients_info = json.load(file)
+            cached = _json_files[file_path] = (mtime, {ci['id']: ci for ci in clients_info})
+        ci = cached[1].get(id)
+        return dict(ci) if ci is not None else None
     except FileNotFoundError:
         print(f"File not found: {file_path}")
     except json.JSONDecodeError:
         print(f"Error decoding JSON in file: {file_path}")
+    except sqlite3.Error as e:
+        print(f"Error processing file {file_path}: {e}")
+
+
+def get_knowledge_store(file_path: str = KNOWLEDGE_JSON_FILE) -> KnowledgeStore:
+    """
+    Returns the knowledge store backing the given knowledge.json file.
+
+    The store lives next to the JSON file (knowledge.json -> knowledge.db). It imports the JSON file when it is
+    created empty, and again whenever the file was edited since it was last exported. One store is opened per
+    process and reused for every read and write.
+
+    Args:
+        file_path (str): The path to the JSON file. Defaults to `KNOWLEDGE_JSON_FILE`.
+
+    Returns:
+        KnowledgeStore: The store for `file_path`.
+    """
+    key = (os.path.abspath(file_path), os.getpid())
+    if key not in _knowledge_stores:
+        db_path = os.path.splitext(file_path)[0] + '.db'
+        _knowledge_stores[key] = KnowledgeStore(db_path, file_path)
+    else:
+        _knowledge_stores[key].sync_json(file_path)
+    return _knowledge_stores[key]
 
 
 def write_knowledge_info(ci: dict, file_path: str = KNOWLEDGE_JSON_FILE) -> bool:
     """
-    Appends the given client info to a JSON file.
+    Writes the given client info to the knowledge store and indexes its failure signature.
 
-    The function reads the existing data, updates the client info if exists, or appends the new client info and writes 
-    the updated data back to the file.
+    The client info replaces the stored record with the same id, or is added as a new record. Only that record is
+    written; use `export_knowledge_info` to write the store back out to the JSON file.
 
     Args:
-        ci (dict): The client information to be appended.
+        ci (dict): The client information to be written.
         file_path (str): The path to the JSON file. Defaults to `KNOWLEDGE_JSON_FILE`.
 
     Returns:
-        None
+        bool: True if the record was written, otherwise False.
     """
     try:
-        with open(file_path, 'r') as file:
-            clients_info = json.load(file)
-    except FileNotFoundError as e:
-        print(e)
-        exit(-1)
+        store = get_knowledge_store(file_path)
+        store.upsert(ci.copy())
+        get_failure_index(store).add(ci)
+        return True
+    except (sqlite3.Error, json.JSONDecodeError, IOError) as e:
+        print(f"Error processing file {file_path}: {e}")
+        return False
+
 
-    if get_knowledge_info(ci['id'], file_path) == None:
-        clients_info.append(ci)
+def export_knowledge_info(file_path: str = KNOWLEDGE_JSON_FILE) -> bool:
+    """
+    Exports every record of the knowledge store to the JSON file, replacing it atomically.
 
-    for i in range(len(clients_info)):
-        if ci['id'] == clients_info[i]['id']:
-            clients_info[i] = ci.copy()
-            break
+    Args:
+        file_path (str): The path to the JSON file. Defaults to `KNOWLEDGE_JSON_FILE`.
 
+    Returns:
+        bool: True if the file was written, otherwise False.
+    """
     try:
-        with open(KNOWLEDGE_JSON_FILE, 'w') as fw:
-            json.dump(clients_info, fw, indent=2)
-            return True
-    except (json.JSONDecodeError, IOError) as e:
+        get_knowledge_store(file_path).export_json(file_path)
+        return True
+    except (sqlite3.Error, IOError) as e:
         print(f"Error processing file {file_path}: {e}")
         return False
 
-def search_for_file(client: str, target_file_name: str) -> str | None:
+def search_for_file(client: str, target_file_name: str, downloads_dir=DOWNLOADS_DIR,
+                    package: str | None = None) -> str | None:
     """
     Searches for a specified file within a client's project directory under the _downloads directory.
 
-    This function searches the directory tree of the specified client's project located in the 
-    `_downloads` directory, looking for a file that matches the given name. If the file is found, 
-    the full path to the file is returned. Else, `None` is returned.
+    This function looks the file name up in the client's file index, which is built by walking the project once 
+    and rebuilt only when its git state changes. If the file is found, the full path to the file is returned. 
+    Else, `None` is returned.
 
     Args:
         client (str): The name of the client directory within the `_downloads` directory.
         target_file_name (str): The name of the file to search for.
+        downloads_dir (str): Directory holding the client's checkout. Defaults to `DOWNLOADS_DIR`.
+        package (str | None): Java package of the file, used to choose between files with the same name.
 
     Returns:
         str | None: The full path to the target file if found, otherwise `None`.
     """
-    start_path = os.path.join(DOWNLOADS_DIR, client)
-    for root, dirs, files in os.walk(start_path):
-        if target_file_name in files:
-            return os.path.join(root, target_file_name)
-    print(f"Unable to find file: {target_file_name}..")
-    return None
+    file_path = get_file_index(os.path.join(downloads_dir, client)).lookup(target_file_name, package)
+    if file_path is None:
+        print(f"Unable to find file: {target_file_name}..")
+    return file_path
 
-def get_method_by_line_no(source: str, line_no: int) -> str:
+def get_method_by_line_no(source: str, line_no: int, file_path: str = "") -> str:
     """
-    Given the source code of a Java file and a line number, this function uses the javalang library to identify and 
-    return the full method in which the specified line number resides.
+    Given the source code of a Java file and a line number, this function identifies and returns the full method,
+    constructor or initializer in which the specified line number resides.
+
+    The spans of the file are looked up in a method index cached by the file's content hash, so each stack frame is 
+    resolved with a binary search once the file has been indexed.
 
     Args:
         source (str): The Java source code as a string.
         line_no (int): The line number for which the containing method should be found.
+        file_path (str): The file the source was read from, for messages.
 
     Returns:
         str: The complete source code of the method that contains the given line number. If the line number is not 
-             within any method or the line number is invalid, it returns an empty string or appropriate message.
-    """
-    tree = javalang.parse.parse(source)
-    methods = []
-    
-    for path, node in tree:
-        if isinstance(node, javalang.tree.MethodDeclaration):
-            methods.append(node)
-    for method in methods:
-        if (method.position and method.position.line <= line_no):
-            if hasattr(method, 'body'):
-                last_line = method.body[-1].position.line if method.body and method.body[-1].position else method.position.line
-                if last_line >= line_no:
-                    method_lines = source.splitlines()[method.position.line - 1 : last_line+1]
-                    return "\n".join(method_lines)
-    return source.splitlines()[line_no-1]
-
-
-def get_code_from_source(client_info: dict) -> str:
+             within any method, the line itself is returned.
+    """
+    with span("method_lookup", line_no=line_no) as s:
+        index = get_method_index(source, path=file_path)
+        method = index.find(line_no) or index.find(line_no, ('lambda',))
+        s.set(found=method is not None)
+    lines = source.splitlines()
+    if method:
+        return "\n".join(lines[method[0] - 1 : method[1]])
+    return lines[line_no-1]
+
+
+def get_code_from_source(client_info: dict, downloads_dir=DOWNLOADS_DIR) -> str:
     """
     Retrieves the method responsible for an exception based on the information in 'client_info'.
 
@@ -206,12 +292,14 @@ def get_code_from_source(client_info: dict) -> str:
 
     Args:
         client_info (dict): client information from knowledge.json.
+        downloads_dir (str): Directory holding the client's checkout. Defaults to `DOWNLOADS_DIR`.
 
     Returns:
         str: The source code of the method responsible for the exception.
              Returns an empty string ("") if the method or file cannot be found.
     """
-    file_path = search_for_file(client_info["client"], client_info["file_name"])
+    file_path = search_for_file(client_info["client"], client_info["file_name"], downloads_dir,
+                                client_info.get("package"))
     if not file_path:
         return ""
     try:
@@ -221,23 +309,11 @@ def get_code_from_source(client_info: dict) -> str:
     except Exception as e:
         print(e)
         return ""
-    method_body = get_method_by_line_no(source, int(client_info["line_no"]))
+    method_body = get_method_by_line_no(source, int(client_info["line_no"]), file_path)
     return method_body if method_body else ""
 
 def open_pom_file(client_info: dict, downloads_dir=DOWNLOADS_DIR) -> None:
     client_dir = f"{downloads_dir}/{client_info['client']}"
-    lib = client_info['lib']
-    for dir_path, subpaths, files in os.walk(client_dir):
-        for f in files:
-            if f == 'pom.xml':
-                pom_file = dir_path + '/' + f
-                group_id = lib.split(':')[0]
-                artifact_id = lib.split(':')[1]
-                fr = open(pom_file, 'r', encoding='utf-8')
-                lines = fr.readlines()
-                fr.close()
-                for i in range(len(lines)):
-                    if '<groupId>' + group_id + '</groupId>' in lines[i]:
-                        if '<artifactId>' + artifact_id + '</artifactId>' in lines[i + 1]:
-                            subprocess.Popen(["notepad.exe", pom_file])
-                            return
+    version_files = get_pom_index(client_dir).find_version_files(client_info['lib'])
+    if version_files:
+        subprocess.Popen(["notepad.exe", next(iter(version_files))])